@@ -7,9 +7,20 @@ __version__ = "1.0.3"
 __author__ = "Leonardo Sousa"
 __email__ = "leokaique7@gmail.com"
 
-# Importações principais para facilitar o uso
-from .consulta_tool import consultar_banco_dados, consulta_postgres_tool
-from .agente_inteligente_v2 import processar_pergunta_com_agente_v2
+# Importações principais para facilitar o uso, carregadas no primeiro acesso
+# (importar o pacote não carrega Django, LangChain nem o modelo)
+_ATRIBUTOS_PREGUICOSOS = {
+    'consultar_banco_dados': 'consulta_tool',
+    'consulta_postgres_tool': 'consulta_tool',
+    'processar_pergunta_com_agente_v2': 'agente_inteligente_v2',
+}
+
+def __getattr__(nome):
+    modulo = _ATRIBUTOS_PREGUICOSOS.get(nome)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    from importlib import import_module
+    return getattr(import_module(f".{modulo}", __name__), nome)
 
 __all__ = [
     'consultar_banco_dados',
@@ -1,37 +1,34 @@
-from typing import List, Dict, Any
-from langgraph.prebuilt import create_react_agent
-from langchain.prompts import PromptTemplate
-from langchain.chat_models import init_chat_model
-from langchain.tools import tool
-from langchain.memory import ConversationBufferMemory
+from typing import List, Dict, Any, Optional
 from langgraph.checkpoint.memory import MemorySaver
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from mcp_servers import MCP_SERVERS_CONFIG
+from langgraph.errors import GraphRecursionError
+from langchain_core.messages import AIMessage, ToolMessage
+from mcp_servers import MCP_LOCAL_CONFIG, MCP_SERVERS_CONFIG, MCP_SERVIDORES
+from graficos_locais import obter_ferramentas_locais
+from provedor_modelo import obter_modelo
 from sql_generator import gerar_sql_da_pergunta
-from dotenv import load_dotenv
-from consulta_tool import consulta_postgres_tool, consultar_banco_dados
 import asyncio
-import os
-import django
 from cache_manager import query_cache
+from orcamento_agente import (
+    MonitorOrcamento,
+    OrcamentoAgente,
+    OrcamentoEsgotado,
+    contar_orcamento,
+    orcamento_atual,
+)
+from roteador import ROTA_AGENTE, ROTA_DIRETA, eh_pergunta_grafico, escolher_rota, metricas_rotas
+import time
+import uuid
 from conversation_memory import conversation_memory
-from consulta_tool import consultar_banco_dados
-from sql_generator import gerar_sql_da_pergunta
-
-load_dotenv()
-
-# Configurar Django
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
-django.setup()
+from consulta_tool import consultar_banco_dados, consultar_banco_dados_interno, consultar_banco_dados_interno_async
 
-# Inicializar componentes globais
-model_llm = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
-memory = ConversationBufferMemory(memory_key="chat_history")
+# Componentes globais: o modelo, o cliente MCP e o agente são criados em
+# inicializar_agente (no aquecimento do main.py ou na primeira pergunta)
 memory_saver = MemorySaver()
 
-
 mcp_client = None
 agent_executor = None
+# "mcp" com as ferramentas de gráfico, "fallback" só com consultar_banco_dados
+modo_agente = None
 
 def validar_schema_ferramenta(tool) -> bool:
     """Valida se o schema da ferramenta é compatível com Gemini"""
@@ -127,16 +124,28 @@ def filtrar_ferramentas_validas(mcp_tools: List) -> List:
 
 async def inicializar_agente():
     """Inicializa o agente com MCP client de forma assíncrona"""
-    global mcp_client, agent_executor
+    global mcp_client, agent_executor, modo_agente
+    
+    # Imports adiados: langgraph.prebuilt e o cliente MCP só são carregados ao criar o agente
+    from langgraph.prebuilt import create_react_agent
+    
+    model_llm = obter_modelo()
     
     try:
-        print("🔄 Inicializando MCP Client... ", MCP_SERVERS_CONFIG)
-        
-        # Inicializar MCP Client com a configuração correta
-        mcp_client = MultiServerMCPClient(MCP_SERVERS_CONFIG)
-        
-        # Obter ferramentas do MCP client
-        mcp_tools_raw = await mcp_client.get_tools()
+        if MCP_SERVIDORES == "local":
+            # Ferramentas de gráfico no próprio processo, sem rede
+            print("🔄 Usando ferramentas de gráfico locais (sem MCP remoto)")
+            mcp_tools_raw = obter_ferramentas_locais()
+        else:
+            config_mcp = MCP_LOCAL_CONFIG if MCP_SERVIDORES == "local_http" else MCP_SERVERS_CONFIG
+            print("🔄 Inicializando MCP Client... ", list(config_mcp))
+            
+            # Inicializar MCP Client com a configuração correta
+            from langchain_mcp_adapters.client import MultiServerMCPClient
+            mcp_client = MultiServerMCPClient(config_mcp)
+            
+            # Obter ferramentas do MCP client
+            mcp_tools_raw = await mcp_client.get_tools()
         print(f"✅ {len(mcp_tools_raw)} ferramentas MCP obtidas")
         
         # Filtrar ferramentas com schemas válidos
@@ -167,11 +176,6 @@ DETECÇÃO DE SOLICITAÇÕES DE GRÁFICO:
 Se a pergunta contém palavras como: "gráfico", "grafico", "chart", "visualiza", "gere um gráfico", "criar gráfico"
 → Use as ferramentas MCP de gráficos disponíveis
 
-METADADOS DISPONÍVEIS:
-- Campo enti_tipo_enti na tabela entidades (CL=Cliente, VE=Vendedor, FO=Fornecedor)
-- Tabelas: entidades, pedidosvenda, produtos, funcionarios
-- Relacionamentos já mapeados nos metadados
-
 FLUXO PARA GRÁFICOS:
 1. Primeiro obtenha os dados com consultar_banco_dados
 2. Depois use a ferramenta MCP apropriada
@@ -186,15 +190,16 @@ TIPOS DE GRÁFICO DISPONÍVEIS:
 SEMPRE responda em português brasileiro e seja DIRETO."""
 
         # Incluir ferramentas MCP nas ferramentas do agente
-        todas_ferramentas = [consultar_banco_dados, consulta_postgres_tool] + mcp_tools
+        todas_ferramentas = [consultar_banco_dados] + mcp_tools
 
         agent_executor = create_react_agent(
             model=model_llm,
             tools=todas_ferramentas,
             checkpointer=memory_saver,
-            state_modifier=system_prompt
+            prompt=system_prompt
         )
         
+        modo_agente = "mcp"
         print("✅ Agente inicializado com sucesso!")
         return True
         
@@ -215,12 +220,6 @@ INSTRUÇÕES IMPORTANTES:
 
 FERRAMENTAS DISPONÍVEIS:
 - consultar_banco_dados: Para consultas de dados
-- consulta_postgres_tool: Para consultas SQL diretas
-
-METADADOS IMPORTANTES DISPONÍVEIS:
-- Campo enti_tipo_enti na tabela entidades para classificar tipos
-- Exemplos: 'CL' = Clientes, 'VE' = Vendedores
-
 
 EXEMPLOS DE CONSULTAS:
 - "entidades por tipo" → Use consultar_banco_dados com "entidades por tipo"
@@ -231,10 +230,11 @@ SEMPRE responda em português brasileiro e USE AS FERRAMENTAS DISPONÍVEIS."""
 
             agent_executor = create_react_agent(
                 model=model_llm,
-                tools=[consultar_banco_dados, consulta_postgres_tool],
+                tools=[consultar_banco_dados],
                 checkpointer=memory_saver,
-                state_modifier=system_prompt_fallback
+                prompt=system_prompt_fallback
             )
+            modo_agente = "fallback"
             print("⚠️ Agente criado sem MCP tools (modo fallback)")
             return True
         except Exception as fallback_error:
@@ -251,8 +251,146 @@ def inicializar_agente_sync():
         print(f"❌ Erro na inicialização síncrona: {e}")
         return False
 
-def processar_pergunta_com_agente_v2(pergunta: str) -> str:
-    """Processa pergunta usando o agente inteligente v2 com contexto melhorado"""
+def _montar_pergunta_com_contexto(pergunta: str) -> str:
+    """Acrescenta à pergunta as instruções de dados ou de gráfico"""
+    # Criar prompt mais direto e específico
+    if eh_pergunta_grafico(pergunta):
+        return f"""
+        {pergunta}
+        
+        INSTRUÇÕES PARA GRÁFICOS:
+        1. Use OBRIGATORIAMENTE as ferramentas MCP disponíveis para criar os gráficos
+        2. Primeiro obtenha os dados com consultar_banco_dados se necessário
+        3. Depois use a ferramenta MCP de gráficos com os dados obtidos
+        4. Use tipo de gráfico "bar" como padrão
+        5. Responda em português brasileiro
+        
+        FLUXO: dados → ferramenta MCP de gráficos → resposta com gráfico
+        """
+    return f"""
+        {pergunta}
+        
+        INSTRUÇÕES PARA DADOS:
+        1. Use a ferramenta consultar_banco_dados para obter os dados
+        2. Faça UMA única chamada da ferramenta
+        3. NÃO tente múltiplas variações da consulta
+        4. Responda em português brasileiro
+        5. Se houver erro de SQL, informe o erro diretamente
+        """
+
+def _extrair_resposta(resultado) -> str:
+    """Extrai o texto da última mensagem do resultado do agente"""
+    resposta = ""
+    if isinstance(resultado, dict):
+        if "messages" in resultado and len(resultado["messages"]) > 0:
+            ultima_mensagem = resultado["messages"][-1]
+            
+            # Tentar diferentes formas de extrair o conteúdo
+            if hasattr(ultima_mensagem, 'content'):
+                resposta = ultima_mensagem.content
+            elif isinstance(ultima_mensagem, dict) and 'content' in ultima_mensagem:
+                resposta = ultima_mensagem['content']
+            else:
+                resposta = str(ultima_mensagem)
+        else:
+            resposta = str(resultado)
+    else:
+        resposta = str(resultado)
+    return resposta
+
+def _thread_conversa(slug: str, sessao: Optional[str]) -> str:
+    """
+    Thread do checkpointer da pergunta
+
+    Com sessão, as perguntas da sessão compartilham o histórico; sem ela cada
+    pergunta tem uma thread própria, apagada ao terminar. Perguntas simultâneas
+    nunca gravam na mesma thread, a não ser que sejam da mesma sessão.
+    """
+    if sessao:
+        return f"{slug}:{sessao}"
+    return f"pergunta:{uuid.uuid4().hex}"
+
+def _config_execucao(orcamento: OrcamentoAgente, thread_id: str) -> dict:
+    """Config do agente com a thread da pergunta, limite de passos e monitor do orçamento"""
+    return {
+        "configurable": {"thread_id": thread_id},
+        "recursion_limit": orcamento.limite_recursao,
+        "callbacks": [MonitorOrcamento(orcamento)],
+    }
+
+def _mensagens_encerramento(mensagens: list, resposta: str) -> list:
+    """
+    Fecha a conversa interrompida: chamadas de ferramenta sem resposta recebem um
+    ToolMessage e a resposta parcial vira a última mensagem do agente, para que a
+    próxima pergunta encontre um histórico válido
+    """
+    novas = []
+    ultima = mensagens[-1] if mensagens else None
+    if isinstance(ultima, AIMessage) and ultima.tool_calls:
+        novas.extend(
+            ToolMessage(content="Interrompido: orçamento do agente esgotado", tool_call_id=chamada["id"])
+            for chamada in ultima.tool_calls
+        )
+    novas.append(AIMessage(content=resposta))
+    return novas
+
+def _motivo_interrupcao(erro: Exception) -> str:
+    if isinstance(erro, GraphRecursionError):
+        return "limite de passos do agente"
+    if isinstance(erro, asyncio.TimeoutError):
+        return "tempo máximo da pergunta"
+    return str(erro)
+
+def _resposta_parcial(orcamento: OrcamentoAgente, erro: Exception) -> str:
+    orcamento.encerrar(_motivo_interrupcao(erro))
+    contar_orcamento('interrompidas')
+    print(f"⚠️ Resposta parcial: {orcamento.resumo()}")
+    return orcamento.resposta_parcial()
+
+def _encerrar_conversa(config: dict, resposta: str):
+    """Fecha a conversa interrompida na thread do checkpointer em que a pergunta rodou"""
+    # Só a thread: o monitor do orçamento esgotado não deve rodar no update_state
+    config = {"configurable": config["configurable"]}
+    try:
+        estado = agent_executor.get_state(config)
+        agent_executor.update_state(
+            config, {"messages": _mensagens_encerramento(estado.values.get("messages", []), resposta)},
+            as_node="agent"
+        )
+    except Exception as e:
+        print(f"⚠️ Não foi possível fechar a conversa interrompida: {e}")
+
+async def _encerrar_conversa_async(config: dict, resposta: str):
+    """Versão assíncrona de _encerrar_conversa"""
+    config = {"configurable": config["configurable"]}
+    try:
+        estado = await agent_executor.aget_state(config)
+        await agent_executor.aupdate_state(
+            config, {"messages": _mensagens_encerramento(estado.values.get("messages", []), resposta)},
+            as_node="agent"
+        )
+    except Exception as e:
+        print(f"⚠️ Não foi possível fechar a conversa interrompida: {e}")
+
+def processar_pergunta_com_agente_v2(pergunta: str, slug: str = "casaa", sessao: Optional[str] = None) -> str:
+    """
+    Processa pergunta usando o agente inteligente v2 com contexto melhorado
+
+    Perguntas simples de dados seguem o caminho direto (consultar_banco_dados_interno,
+    uma chamada ao LLM); gráficos e perguntas com várias etapas usam o agente.
+    """
+    inicio = time.perf_counter()
+    rota = escolher_rota(pergunta)
+    try:
+        if rota == ROTA_DIRETA:
+            print(f"\n⚡ Caminho direto: {pergunta}")
+            return consultar_banco_dados_interno(pergunta, slug)
+        return _processar_com_agente(pergunta, slug, sessao)
+    finally:
+        metricas_rotas.registrar(rota, inicio)
+
+def _processar_com_agente(pergunta: str, slug: str, sessao: Optional[str]) -> str:
+    """Executa a pergunta no agente ReAct"""
     global agent_executor
     
     try:
@@ -265,60 +403,100 @@ def processar_pergunta_com_agente_v2(pergunta: str) -> str:
         print(f"\n🤖 Processando: {pergunta}")
         print("=" * 50)
         
-        # Detectar se é uma solicitação de gráfico
-        palavras_grafico = ['gráfico', 'grafico', 'chart', 'visualiza', 'gere um gráfico', 'criar gráfico']
-        eh_solicitacao_grafico = any(palavra in pergunta.lower() for palavra in palavras_grafico)
+        pergunta_com_contexto = _montar_pergunta_com_contexto(pergunta)
         
-        # Criar prompt mais direto e específico
-        if eh_solicitacao_grafico:
-            pergunta_com_contexto = f"""
-            {pergunta}
-            
-            INSTRUÇÕES PARA GRÁFICOS:
-            1. Use OBRIGATORIAMENTE as ferramentas MCP disponíveis para criar os gráficos
-            2. Primeiro obtenha os dados com consultar_banco_dados se necessário
-            3. Depois use a ferramenta MCP de gráficos com os dados obtidos
-            4. Use tipo de gráfico "bar" como padrão
-            5. Responda em português brasileiro
-            
-            FLUXO: dados → ferramenta MCP de gráficos → resposta com gráfico
-            """
-        else:
-            pergunta_com_contexto = f"""
-            {pergunta}
-            
-            INSTRUÇÕES PARA DADOS:
-            1. Use a ferramenta consultar_banco_dados para obter os dados
-            2. Faça UMA única chamada da ferramenta
-            3. NÃO tente múltiplas variações da consulta
-            4. Responda em português brasileiro
-            5. Se houver erro de SQL, informe o erro diretamente
-            """
+        # Orçamento da pergunta: limite de LLM, ferramentas e tempo
+        orcamento = OrcamentoAgente()
+        contar_orcamento('perguntas')
+        token = orcamento_atual.set(orcamento)
+        config = _config_execucao(orcamento, _thread_conversa(slug, sessao))
+        try:
+            resultado = agent_executor.invoke({
+                "messages": [{"role": "user", "content": pergunta_com_contexto}]
+            }, config=config)
+        except (OrcamentoEsgotado, GraphRecursionError) as e:
+            resposta = _resposta_parcial(orcamento, e)
+            if sessao:
+                _encerrar_conversa(config, resposta)
+            return resposta
+        finally:
+            orcamento_atual.reset(token)
+            if not sessao:
+                memory_saver.delete_thread(config["configurable"]["thread_id"])
         
-        # Configurar thread_id para o checkpointer
-        config = {"configurable": {"thread_id": "main_conversation"}}
+        resposta = _extrair_resposta(resultado)
         
-        resultado = agent_executor.invoke({
-            "messages": [{"role": "user", "content": pergunta_com_contexto}]
-        }, config=config)
+        print(f"\n✅ Resposta final gerada!")
+        return resposta if resposta else "❌ Não foi possível gerar uma resposta."
         
-        # Extrair resposta do resultado
-        resposta = ""
-        if isinstance(resultado, dict):
-            if "messages" in resultado and len(resultado["messages"]) > 0:
-                ultima_mensagem = resultado["messages"][-1]
-                
-                # Tentar diferentes formas de extrair o conteúdo
-                if hasattr(ultima_mensagem, 'content'):
-                    resposta = ultima_mensagem.content
-                elif isinstance(ultima_mensagem, dict) and 'content' in ultima_mensagem:
-                    resposta = ultima_mensagem['content']
-                else:
-                    resposta = str(ultima_mensagem)
-            else:
-                resposta = str(resultado)
-        else:
-            resposta = str(resultado)
+    except Exception as e:
+        error_msg = f"❌ Erro no agente: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+_lock_inicializacao = None
+
+async def garantir_agente_async() -> bool:
+    """Inicializa o agente no event loop atual uma única vez, mesmo com requisições simultâneas"""
+    global _lock_inicializacao
+    if agent_executor is not None:
+        return True
+    if _lock_inicializacao is None:
+        _lock_inicializacao = asyncio.Lock()
+    async with _lock_inicializacao:
+        if agent_executor is not None:
+            return True
+        print("🔄 Inicializando agente...")
+        return await inicializar_agente()
+
+async def processar_pergunta_com_agente_v2_async(pergunta: str, slug: str = "casaa",
+                                                 sessao: Optional[str] = None) -> str:
+    """
+    Versão assíncrona de processar_pergunta_com_agente_v2
+
+    Usa ainvoke do agente: LLM, ferramentas de banco e ferramentas MCP rodam no
+    event loop, sem ocupar uma thread por pergunta.
+    """
+    inicio = time.perf_counter()
+    rota = escolher_rota(pergunta)
+    try:
+        if rota == ROTA_DIRETA:
+            print(f"\n⚡ Caminho direto: {pergunta}")
+            return await consultar_banco_dados_interno_async(pergunta, slug)
+        return await _processar_com_agente_async(pergunta, slug, sessao)
+    finally:
+        metricas_rotas.registrar(rota, inicio)
+
+async def _processar_com_agente_async(pergunta: str, slug: str, sessao: Optional[str]) -> str:
+    """Executa a pergunta no agente ReAct com ainvoke"""
+    try:
+        if not await garantir_agente_async():
+            return "❌ Erro: Não foi possível inicializar o agente."
+        
+        print(f"\n🤖 Processando: {pergunta}")
+        print("=" * 50)
+        
+        pergunta_com_contexto = _montar_pergunta_com_contexto(pergunta)
+        
+        orcamento = OrcamentoAgente()
+        contar_orcamento('perguntas')
+        token = orcamento_atual.set(orcamento)
+        config = _config_execucao(orcamento, _thread_conversa(slug, sessao))
+        try:
+            resultado = await asyncio.wait_for(agent_executor.ainvoke({
+                "messages": [{"role": "user", "content": pergunta_com_contexto}]
+            }, config=config), timeout=orcamento.tempo_restante)
+        except (OrcamentoEsgotado, GraphRecursionError, asyncio.TimeoutError) as e:
+            resposta = _resposta_parcial(orcamento, e)
+            if sessao:
+                await _encerrar_conversa_async(config, resposta)
+            return resposta
+        finally:
+            orcamento_atual.reset(token)
+            if not sessao:
+                await memory_saver.adelete_thread(config["configurable"]["thread_id"])
+        
+        resposta = _extrair_resposta(resultado)
         
         print(f"\n✅ Resposta final gerada!")
         return resposta if resposta else "❌ Não foi possível gerar uma resposta."
@@ -0,0 +1,55 @@
+"""
+Microbenchmark da montagem de prompt: renderização a cada chamada x fragmentos em cache
+
+Uso: python benchmark_prompt.py [slug] [repeticoes]
+"""
+import sys
+import timeit
+
+from schema_loader import (
+    carregar_schema,
+    formatar_metadados_para_prompt,
+    formatar_schema_para_prompt,
+    montar_metadados_prompt,
+    montar_schema_prompt,
+)
+from schema_index import selecionar_tabelas
+
+def medir(descricao: str, funcao, repeticoes: int):
+    funcao()  # aquecimento
+    tempo = min(timeit.repeat(funcao, number=repeticoes, repeat=3)) / repeticoes
+    print(f"  {descricao:<45} {tempo * 1000:9.3f} ms")
+    return tempo
+
+def executar(slug: str = "casaa", repeticoes: int = 20):
+    schema = carregar_schema(slug)
+    if not schema:
+        print(f"❌ Schema não encontrado para slug: {slug}")
+        return
+
+    tabelas = selecionar_tabelas(slug, "TOP 10 clientes que mais compraram")
+
+    assert montar_schema_prompt(slug) == formatar_schema_para_prompt(schema)
+    assert montar_schema_prompt(slug, tabelas) == formatar_schema_para_prompt(schema, tabelas)
+
+    print(f"📊 Montagem de prompt para '{slug}' ({repeticoes} repetições)")
+    print("Schema completo:")
+    antes = medir("renderizando a cada chamada", lambda: formatar_schema_para_prompt(schema), repeticoes)
+    depois = medir("fragmentos em cache", lambda: montar_schema_prompt(slug), repeticoes)
+    print(f"  → {antes / depois:.1f}x mais rápido")
+
+    print(f"Schema podado ({len(tabelas or [])} tabelas):")
+    antes = medir("renderizando a cada chamada", lambda: formatar_schema_para_prompt(schema, tabelas), repeticoes)
+    depois = medir("fragmentos em cache", lambda: montar_schema_prompt(slug, tabelas), repeticoes)
+    print(f"  → {antes / depois:.1f}x mais rápido")
+
+    print("Bloco de metadados:")
+    metadados = schema.get('_metadados', {})
+    antes = medir("renderizando a cada chamada", lambda: formatar_metadados_para_prompt(metadados), repeticoes)
+    depois = medir("fragmentos em cache", lambda: montar_metadados_prompt(slug), repeticoes)
+    print(f"  → {antes / depois:.1f}x mais rápido")
+
+if __name__ == "__main__":
+    slug = sys.argv[1] if len(sys.argv) > 1 else "casaa"
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    executar(slug, repeticoes)
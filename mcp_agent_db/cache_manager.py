@@ -1,10 +1,24 @@
+import asyncio
 import hashlib
 import json
+import os
+import re
+import sqlite3
+import threading
 import time
-from typing import Dict, Any, Optional
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 import pickle
 
+def normalizar_pergunta(pergunta: str) -> str:
+    """Forma canônica da pergunta: minúsculas, sem acentos, espaços e pontuação final"""
+    texto = unicodedata.normalize('NFKD', pergunta.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = ' '.join(texto.split())
+    return texto.rstrip(' ?.!;')
+
 class QueryCache:
     def __init__(self, ttl_minutes: int = 30, max_size: int = 100):
         self.cache: Dict[str, Dict] = {}
@@ -95,4 +109,350 @@ class QueryCache:
         }
 
 # Instância global do cache
-query_cache = QueryCache(ttl_minutes=30, max_size=100)
\ No newline at end of file
+query_cache = QueryCache(ttl_minutes=30, max_size=100)
+
+class SQLCache:
+    """
+    Cache persistente pergunta → SQL (SQLite local)
+
+    A chave é a pergunta normalizada + slug + versão do schema, então uma nova
+    versão do schema nunca reaproveita SQL antigo. Só entra SQL que já executou
+    com sucesso; um acerto vai direto para a execução, sem chamar o LLM, e os
+    dados continuam sempre atuais.
+
+    Leituras usam uma conexão por thread (WAL: não esperam o escritor) e os
+    acessos dos acertos são gravados em lote numa thread à parte, a cada
+    SQL_CACHE_ACESSOS_LOTE acertos ou antes de qualquer escrita.
+    """
+
+    def __init__(self, caminho: str = "cache/sql_cache.sqlite3",
+                 lote_acessos: int = int(os.getenv("SQL_CACHE_ACESSOS_LOTE", "50"))):
+        self.caminho = caminho
+        self.lote_acessos = lote_acessos
+        self._lock = threading.Lock()
+        self._conexao = None
+        self._leitores = threading.local()
+        # chave → [acessos, último acesso] ainda não gravados
+        self._acessos_pendentes: Dict[tuple, list] = {}
+        self._acessos_templates_pendentes: Dict[tuple, int] = {}
+        self._total_acessos_pendentes = 0
+        self._lock_acessos = threading.Lock()
+        self._gravando_acessos = False
+        self.hits = 0
+        self.misses = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            diretorio = os.path.dirname(self.caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, check_same_thread=False, timeout=10)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    pergunta TEXT NOT NULL,
+                    slug TEXT NOT NULL,
+                    versao_schema TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    pergunta_original TEXT,
+                    criado_em REAL NOT NULL,
+                    ultimo_acesso REAL NOT NULL,
+                    acessos INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (pergunta, slug, versao_schema)
+                )
+            """)
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS sql_templates (
+                    forma TEXT NOT NULL,
+                    slug TEXT NOT NULL,
+                    versao_schema TEXT NOT NULL,
+                    template TEXT NOT NULL,
+                    tipos TEXT NOT NULL,
+                    criado_em REAL NOT NULL,
+                    acessos INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (forma, slug, versao_schema)
+                )
+            """)
+            conexao.commit()
+            self._conexao = conexao
+        return self._conexao
+
+    def _ler(self, consulta: str, parametros: tuple) -> Optional[tuple]:
+        """SELECT de uma linha pela conexão de leitura da thread, sem o lock do escritor"""
+        if self.caminho == ":memory:":
+            with self._lock:
+                return self._conectar().execute(consulta, parametros).fetchone()
+        leitor = getattr(self._leitores, 'conexao', None)
+        if leitor is None:
+            if self._conexao is None:
+                with self._lock:
+                    self._conectar()
+            leitor = sqlite3.connect(self.caminho, timeout=10)
+            self._leitores.conexao = leitor
+        return leitor.execute(consulta, parametros).fetchone()
+
+    def _registrar_acesso(self, chave: tuple, template: bool = False):
+        """Conta o acerto em memória; o lote cheio é gravado numa thread à parte"""
+        with self._lock_acessos:
+            if template:
+                self._acessos_templates_pendentes[chave] = self._acessos_templates_pendentes.get(chave, 0) + 1
+            else:
+                acessos = self._acessos_pendentes.setdefault(chave, [0, 0.0])
+                acessos[0] += 1
+                acessos[1] = time.time()
+                self.hits += 1
+            self._total_acessos_pendentes += 1
+            gravar = self._total_acessos_pendentes >= self.lote_acessos and not self._gravando_acessos
+            if gravar:
+                self._gravando_acessos = True
+        if gravar:
+            threading.Thread(target=self._gravar_acessos_em_segundo_plano, daemon=True).start()
+
+    def _gravar_acessos_em_segundo_plano(self):
+        try:
+            with self._lock:
+                self._gravar_acessos()
+        except sqlite3.Error as e:
+            print(f"⚠️ Acessos do cache de SQL não gravados: {e}")
+        finally:
+            with self._lock_acessos:
+                self._gravando_acessos = False
+
+    def _gravar_acessos(self):
+        """Grava os acessos pendentes numa transação (chamar com self._lock)"""
+        with self._lock_acessos:
+            acessos, self._acessos_pendentes = self._acessos_pendentes, {}
+            templates, self._acessos_templates_pendentes = self._acessos_templates_pendentes, {}
+            self._total_acessos_pendentes = 0
+        if not acessos and not templates:
+            return
+        conexao = self._conectar()
+        conexao.executemany(
+            "UPDATE sql_cache SET acessos = acessos + ?, ultimo_acesso = MAX(ultimo_acesso, ?) "
+            "WHERE pergunta = ? AND slug = ? AND versao_schema = ?",
+            [(quantidade, ultimo, *chave) for chave, (quantidade, ultimo) in acessos.items()]
+        )
+        conexao.executemany(
+            "UPDATE sql_templates SET acessos = acessos + ? WHERE forma = ? AND slug = ? AND versao_schema = ?",
+            [(quantidade, *chave) for chave, quantidade in templates.items()]
+        )
+        conexao.commit()
+
+    def get(self, pergunta: str, slug: str, versao_schema: Optional[str]) -> Optional[str]:
+        """SQL já validado para a pergunta nesta versão do schema (None se não houver)"""
+        if not versao_schema:
+            return None
+        chave = (normalizar_pergunta(pergunta), slug, versao_schema)
+        linha = self._ler(
+            "SELECT sql FROM sql_cache WHERE pergunta = ? AND slug = ? AND versao_schema = ?", chave
+        )
+        if linha is None:
+            with self._lock_acessos:
+                self.misses += 1
+            return None
+        self._registrar_acesso(chave)
+        print(f"⚡ SQL em cache: {pergunta[:50]}... (versão {versao_schema})")
+        return linha[0]
+
+    def set(self, pergunta: str, slug: str, versao_schema: Optional[str], sql: str):
+        """Armazena o SQL executado com sucesso e descarta versões antigas do slug"""
+        if not versao_schema or not sql:
+            return
+        agora = time.time()
+        with self._lock:
+            self._gravar_acessos()
+            conexao = self._conectar()
+            conexao.execute(
+                "INSERT OR REPLACE INTO sql_cache "
+                "(pergunta, slug, versao_schema, sql, pergunta_original, criado_em, ultimo_acesso, acessos) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (normalizar_pergunta(pergunta), slug, versao_schema, sql, pergunta, agora, agora)
+            )
+            conexao.execute("DELETE FROM sql_cache WHERE slug = ? AND versao_schema != ?", (slug, versao_schema))
+            conexao.execute("DELETE FROM sql_templates WHERE slug = ? AND versao_schema != ?", (slug, versao_schema))
+            conexao.commit()
+
+    def get_template(self, forma: str, slug: str, versao_schema: str) -> Optional[tuple]:
+        """Template de SQL para a forma da pergunta: (template, tipos dos literais)"""
+        chave = (forma, slug, versao_schema)
+        linha = self._ler(
+            "SELECT template, tipos FROM sql_templates WHERE forma = ? AND slug = ? AND versao_schema = ?", chave
+        )
+        if linha is None:
+            return None
+        self._registrar_acesso(chave, template=True)
+        return linha[0], json.loads(linha[1])
+
+    def existe_template(self, forma: str, slug: str, versao_schema: str) -> bool:
+        """Há template para a forma (sem contar como acesso)"""
+        return self._ler(
+            "SELECT 1 FROM sql_templates WHERE forma = ? AND slug = ? AND versao_schema = ?",
+            (forma, slug, versao_schema)
+        ) is not None
+
+    def set_template(self, forma: str, slug: str, versao_schema: str, template: str, tipos: list):
+        """Armazena o template parametrizado de uma forma de pergunta"""
+        with self._lock:
+            self._gravar_acessos()
+            conexao = self._conectar()
+            conexao.execute(
+                "INSERT OR REPLACE INTO sql_templates "
+                "(forma, slug, versao_schema, template, tipos, criado_em, acessos) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (forma, slug, versao_schema, template, json.dumps(tipos), time.time())
+            )
+            conexao.commit()
+
+    def remover_template(self, forma: str, slug: str, versao_schema: Optional[str]):
+        """Remove o template de uma forma de pergunta"""
+        with self._lock:
+            conexao = self._conectar()
+            conexao.execute(
+                "DELETE FROM sql_templates WHERE forma = ? AND slug = ? AND versao_schema = ?",
+                (forma, slug, versao_schema)
+            )
+            conexao.commit()
+
+    def remover(self, pergunta: str, slug: str, versao_schema: Optional[str]):
+        """Remove uma entrada (ex: SQL em cache que passou a falhar)"""
+        with self._lock:
+            conexao = self._conectar()
+            conexao.execute(
+                "DELETE FROM sql_cache WHERE pergunta = ? AND slug = ? AND versao_schema = ?",
+                (normalizar_pergunta(pergunta), slug, versao_schema)
+            )
+            conexao.commit()
+
+    def clear(self, slug: Optional[str] = None):
+        """Limpa o cache inteiro ou apenas de um slug"""
+        with self._lock:
+            conexao = self._conectar()
+            for tabela in ("sql_cache", "sql_templates"):
+                if slug is None:
+                    conexao.execute(f"DELETE FROM {tabela}")
+                else:
+                    conexao.execute(f"DELETE FROM {tabela} WHERE slug = ?", (slug,))
+            conexao.commit()
+
+    def get_stats(self) -> Dict:
+        """Retorna estatísticas do cache de SQL"""
+        with self._lock:
+            self._gravar_acessos()
+            conexao = self._conectar()
+            total_items = conexao.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            total_templates = conexao.execute("SELECT COUNT(*) FROM sql_templates").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'total_items': total_items,
+            'total_templates': total_templates,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'caminho': self.caminho,
+        }
+
+# Instância global do cache de SQL
+sql_cache = SQLCache(os.getenv("SQL_CACHE_PATH", "cache/sql_cache.sqlite3"))
+
+class SingleFlight:
+    """
+    Coalescência de execuções idênticas em andamento
+
+    A primeira chamada com uma chave executa; as que chegam enquanto ela não
+    terminou esperam o mesmo resultado (ou a mesma exceção) em vez de repetir
+    LLM e banco. Há uma versão para threads (executar) e outra para o event
+    loop (executar_async), que não ocupa workers do executor enquanto espera.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento: Dict[Hashable, Future] = {}
+        self._em_andamento_async: Dict[Hashable, Dict] = {}
+        self.executadas = 0
+        self.compartilhadas = 0
+
+    def executar(self, chave: Hashable, funcao: Callable, *args, **kwargs):
+        """Executa funcao(*args) ou aguarda a execução já em andamento para a chave"""
+        with self._lock:
+            futuro = self._em_andamento.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = Future()
+                self._em_andamento[chave] = futuro
+                self.executadas += 1
+            else:
+                self.compartilhadas += 1
+
+        if not lider:
+            print(f"🔗 Aguardando execução idêntica em andamento: {str(chave)[:60]}")
+            return futuro.result()
+
+        try:
+            resultado = funcao(*args, **kwargs)
+            futuro.set_result(resultado)
+            return resultado
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+
+    async def executar_async(self, chave: Hashable, fabrica: Callable[[], Awaitable]):
+        """
+        Versão para o event loop: fabrica() só é chamada pela primeira requisição
+
+        A execução roda numa tarefa compartilhada; uma requisição cancelada
+        (cliente desconectou) só deixa de esperar, e a tarefa só é cancelada
+        quando nenhuma requisição interessada resta.
+        """
+        with self._lock:
+            entrada = self._em_andamento_async.get(chave)
+            lider = entrada is None
+            if lider:
+                entrada = {'tarefa': asyncio.ensure_future(fabrica()), 'interessados': 0}
+                self._em_andamento_async[chave] = entrada
+                entrada['tarefa'].add_done_callback(lambda _: self._encerrar_async(chave, entrada))
+                self.executadas += 1
+            else:
+                self.compartilhadas += 1
+            entrada['interessados'] += 1
+
+        if not lider:
+            print(f"🔗 Aguardando requisição idêntica em andamento: {str(chave)[:60]}")
+
+        tarefa = entrada['tarefa']
+        cancelada = False
+        try:
+            return await asyncio.shield(tarefa)
+        except asyncio.CancelledError:
+            cancelada = True
+            raise
+        finally:
+            with self._lock:
+                entrada['interessados'] -= 1
+                abandonada = entrada['interessados'] == 0
+            if cancelada and abandonada and not tarefa.done():
+                tarefa.cancel()
+
+    def _encerrar_async(self, chave: Hashable, entrada: Dict):
+        with self._lock:
+            if self._em_andamento_async.get(chave) is entrada:
+                del self._em_andamento_async[chave]
+        tarefa = entrada['tarefa']
+        if not tarefa.cancelled():
+            tarefa.exception()  # evita aviso de exceção não lida quando ninguém esperava
+
+    def get_stats(self) -> Dict:
+        """Retorna quantas execuções foram feitas e quantas foram economizadas"""
+        with self._lock:
+            em_andamento = len(self._em_andamento) + len(self._em_andamento_async)
+        total = self.executadas + self.compartilhadas
+        return {
+            'executadas': self.executadas,
+            'chamadas_economizadas': self.compartilhadas,
+            'em_andamento': em_andamento,
+            'taxa_economia': self.compartilhadas / total if total else 0.0,
+        }
+
+# Instância global de coalescência de consultas
+consultas_em_andamento = SingleFlight()
@@ -0,0 +1,71 @@
+"""
+Limites de concorrência do caminho assíncrono
+
+Em vez de um número fixo de threads, cada recurso tem um semáforo com limite
+configurável por variável de ambiente:
+
+    LIMITE_REQUISICOES  perguntas processadas ao mesmo tempo pelo agente
+    LIMITE_LLM          chamadas simultâneas de geração de SQL ao LLM
+    LIMITE_DB           consultas simultâneas ao banco
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
+LIMITES = {
+    'requisicoes': int(os.getenv("LIMITE_REQUISICOES", "32")),
+    'llm': int(os.getenv("LIMITE_LLM", "16")),
+    'db': int(os.getenv("LIMITE_DB", "10")),
+}
+
+class LimitadorConcorrencia:
+    """Semáforos nomeados com métricas de uso (em andamento, pico e espera)"""
+
+    def __init__(self, limites: Dict[str, int]):
+        self.limites = dict(limites)
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self._metricas = {
+            nome: {'em_andamento': 0, 'pico': 0, 'total': 0, 'esperaram': 0, 'espera_total_ms': 0.0}
+            for nome in limites
+        }
+
+    def _semaforo(self, nome: str) -> asyncio.Semaphore:
+        semaforo = self._semaforos.get(nome)
+        if semaforo is None:
+            with self._lock:
+                semaforo = self._semaforos.setdefault(nome, asyncio.Semaphore(self.limites[nome]))
+        return semaforo
+
+    @asynccontextmanager
+    async def limite(self, nome: str):
+        """Ocupa uma vaga do recurso enquanto o bloco executa"""
+        semaforo = self._semaforo(nome)
+        metricas = self._metricas[nome]
+        inicio = time.perf_counter()
+        esperou = semaforo.locked()
+        async with semaforo:
+            if esperou:
+                metricas['esperaram'] += 1
+                metricas['espera_total_ms'] += (time.perf_counter() - inicio) * 1000
+            metricas['em_andamento'] += 1
+            metricas['total'] += 1
+            metricas['pico'] = max(metricas['pico'], metricas['em_andamento'])
+            try:
+                yield
+            finally:
+                metricas['em_andamento'] -= 1
+
+    def get_stats(self) -> Dict:
+        """Retorna limites e uso de cada recurso"""
+        return {
+            nome: {'limite': self.limites[nome], **{k: round(v, 2) for k, v in metricas.items()}}
+            for nome, metricas in self._metricas.items()
+        }
+
+# Instância global dos limites de concorrência
+limitador = LimitadorConcorrencia(LIMITES)
@@ -1,19 +1,23 @@
-import os
-import django
-from django.db import connection
-from langchain.tools import tool
-from sql_generator import gerar_sql_da_pergunta
-from cache_manager import query_cache
+from langchain.tools import StructuredTool
+from sql_generator import ORIGEM_LLM, gerar_sql_com_origem, gerar_sql_com_origem_async
+from cache_manager import consultas_em_andamento, normalizar_pergunta, query_cache, sql_cache
 from conversation_memory import conversation_memory
-from schema_loader import carregar_schema
+from schema_loader import carregar_schema, obter_versao_schema
+from filtros_empresa import reescrever_sql
+from sql_templates import descartar_template, registrar_template
+from intencoes import resolver_intencao
+from orcamento_agente import registrar_sql_falho, sql_ja_falhou
+from executores import ConsultaExcedeuTempo, executar_sql, executar_sql_async
+from custo_consulta import ConsultaCara, verificar_custo, verificar_custo_async
 import json
+from typing import Optional
 
-# Configurar Django
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
-django.setup()
+MENSAGEM_SQL_REPETIDO = (
+    "❌ Este SQL já falhou nesta pergunta e não será executado novamente. "
+    "Informe o erro ao usuário em vez de tentar outra variação."
+)
 
-@tool
-def consulta_postgres_tool(pergunta: str, slug: str = "casaa") -> str:
+def _consulta_postgres(pergunta: str, slug: str = "casaa") -> str:
     """
     Ferramenta para consultar banco PostgreSQL com geração automática de SQL.
     
@@ -26,8 +30,10 @@ def consulta_postgres_tool(pergunta: str, slug: str = "casaa") -> str:
     """
     return consultar_banco_dados_interno(pergunta, slug)
 
-@tool
-def consultar_banco_dados(pergunta: str, slug: str = "casaa") -> str:
+async def _consulta_postgres_async(pergunta: str, slug: str = "casaa") -> str:
+    return await consultar_banco_dados_interno_async(pergunta, slug)
+
+def _consultar_banco_dados(pergunta: str, slug: str = "casaa") -> str:
     """
     Ferramenta principal para consultar banco de dados PostgreSQL.
     
@@ -40,6 +46,25 @@ def consultar_banco_dados(pergunta: str, slug: str = "casaa") -> str:
     """
     return consultar_banco_dados_interno(pergunta, slug)
 
+async def _consultar_banco_dados_async(pergunta: str, slug: str = "casaa") -> str:
+    return await consultar_banco_dados_interno_async(pergunta, slug)
+
+# Ferramentas com versão síncrona (invoke) e assíncrona (ainvoke): o agente
+# assíncrono consulta o banco sem ocupar uma thread por pergunta
+consulta_postgres_tool = StructuredTool.from_function(
+    func=_consulta_postgres,
+    coroutine=_consulta_postgres_async,
+    name="consulta_postgres_tool",
+    description=_consulta_postgres.__doc__,
+)
+
+consultar_banco_dados = StructuredTool.from_function(
+    func=_consultar_banco_dados,
+    coroutine=_consultar_banco_dados_async,
+    name="consultar_banco_dados",
+    description=_consultar_banco_dados.__doc__,
+)
+
 def consultar_banco_dados_interno(pergunta: str, slug: str = "casaa") -> str:
     """Função interna para consultar banco de dados"""
     try:
@@ -51,74 +76,216 @@ def consultar_banco_dados_interno(pergunta: str, slug: str = "casaa") -> str:
             print("📋 Resultado encontrado no cache")
             return resultado_cache
         
-        # Carregar schema e metadados
-        schema = carregar_schema(slug)
-        if not schema:
-            return f"❌ Schema não encontrado para slug: {slug}"
+        # Perguntas idênticas simultâneas compartilham a mesma execução
+        return consultas_em_andamento.executar(
+            (normalizar_pergunta(pergunta), slug),
+            _executar_consulta, pergunta, slug
+        )
         
-        metadados = schema.get('_metadados', {})
-        print(f"📊 Metadados carregados:")
-        print(f"  - Exemplos: {list(metadados.get('exemplos_consultas', {}).keys())}")
-        print(f"  - Campos chave: {list(metadados.get('campos_chave', {}).keys())}")
+    except Exception as e:
+        error_msg = f"❌ Erro na consulta: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+async def consultar_banco_dados_interno_async(pergunta: str, slug: str = "casaa") -> str:
+    """Versão assíncrona de consultar_banco_dados_interno"""
+    try:
+        print(f"🔍 Consultando banco para: {pergunta}")
         
-        # Adicionar contexto específico baseado na pergunta
-        pergunta_com_contexto = pergunta
+        resultado_cache = query_cache.get(pergunta, slug)
+        if resultado_cache:
+            print("📋 Resultado encontrado no cache")
+            return resultado_cache
         
-        if "entidade" in pergunta.lower() and "tipo" in pergunta.lower():
-            pergunta_com_contexto += "\n\nUSE: SELECT enti_tipo_enti, COUNT(*) as quantidade FROM entidades GROUP BY enti_tipo_enti"
-            print("🎯 Contexto específico adicionado para entidades por tipo")
-        elif "pedido" in pergunta.lower() and "cliente" in pergunta.lower():
-            pergunta_com_contexto += "\n\nUSE: Consulte tabelas de pedidos e clientes, agrupe por cliente. Use CAST para converter tipos se necessário."
-            print("🎯 Contexto específico adicionado para pedidos por cliente")
+        return await consultas_em_andamento.executar_async(
+            (normalizar_pergunta(pergunta), slug),
+            lambda: _executar_consulta_async(pergunta, slug)
+        )
         
-        # Gerar SQL com metadados
-        sql = gerar_sql_da_pergunta(pergunta_com_contexto, slug)
+    except Exception as e:
+        error_msg = f"❌ Erro na consulta: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+def _preparar_pergunta(pergunta: str, slug: str) -> Optional[str]:
+    """Carrega o schema e acrescenta à pergunta o contexto específico conhecido (None sem schema)"""
+    schema = carregar_schema(slug)
+    if not schema:
+        return None
+    
+    metadados = schema.get('_metadados', {})
+    print(f"📊 Metadados carregados:")
+    print(f"  - Exemplos: {list(metadados.get('exemplos_consultas', {}).keys())}")
+    print(f"  - Campos chave: {list(metadados.get('campos_chave', {}).keys())}")
+    
+    # Adicionar contexto específico baseado na pergunta
+    pergunta_com_contexto = pergunta
+    
+    # Entidades por tipo e pedidos por cliente têm SQL pronto no catálogo de intenções;
+    # aqui fica só a orientação para as variações que o catálogo não reconhece
+    if "pedido" in pergunta.lower() and "cliente" in pergunta.lower():
+        pergunta_com_contexto += "\n\nUSE: Consulte tabelas de pedidos e clientes, agrupe por cliente. Use CAST para converter tipos se necessário."
+        print("🎯 Contexto específico adicionado para pedidos por cliente")
+    
+    return pergunta_com_contexto
+
+def _descartar_sql(pergunta_com_contexto: str, slug: str, versao_schema):
+    """SQL que falhou não pode continuar sendo servido pelo cache"""
+    sql_cache.remover(pergunta_com_contexto, slug, versao_schema)
+    descartar_template(pergunta_com_contexto, slug, versao_schema)
+
+# SQLSTATE classe 42: erro de sintaxe, coluna ou tabela inexistente, tipo incompatível
+CLASSE_ERRO_SQL = '42'
+
+def _erro_do_sql(erro: Exception) -> bool:
+    """O próprio SQL está errado (ou caro demais): repetir dá o mesmo erro"""
+    if isinstance(erro, ConsultaCara):
+        return True
+    codigo = getattr(erro, 'pgcode', None) or getattr(erro, 'sqlstate', None)
+    return bool(codigo) and codigo.startswith(CLASSE_ERRO_SQL)
+
+def _registrar_falha(erro: Exception, sql: str, intencao: Optional[dict],
+                     pergunta_com_contexto: str, slug: str, versao_schema):
+    """
+    SQL errado sai do cache e não é repetido na pergunta; falhas passageiras
+    (pool esgotado, conexão, cancelamento) não tocam o cache. Um SQL que estourou
+    o statement_timeout continua no cache, mas não é repetido na mesma pergunta.
+    """
+    if _erro_do_sql(erro):
+        registrar_sql_falho(sql)
+        if not intencao:
+            _descartar_sql(pergunta_com_contexto, slug, versao_schema)
+    elif isinstance(erro, ConsultaExcedeuTempo):
+        registrar_sql_falho(sql)
+
+def _finalizar_consulta(pergunta: str, pergunta_com_contexto: str, slug: str, versao_schema,
+                        sql: str, colunas: list, resultados: list, registrar_sql: bool = True,
+                        truncado: bool = False) -> str:
+    """Registra o SQL validado, formata os resultados e guarda a resposta no cache"""
+    # SQL novo do LLM validado: a próxima vez a mesma pergunta (ou a mesma forma) dispensa
+    # o LLM. O que veio do cache ou de template já está lá e não volta ao escritor do SQLite
+    if registrar_sql:
+        sql_cache.set(pergunta_com_contexto, slug, versao_schema, sql)
+        registrar_template(pergunta_com_contexto, slug, versao_schema, sql)
+    
+    # Processar resultados
+    if not resultados:
+        resposta = "Nenhum resultado encontrado."
+    else:
+        # Converter para formato legível
+        dados_formatados = []
+        for linha in resultados:
+            linha_dict = dict(zip(colunas, linha))
+            dados_formatados.append(linha_dict)
         
-        if sql.startswith("-- Erro"):
-            return sql
+        # Adicionar à memória de conversa (método correto)
+        conversation_memory.add_interaction(pergunta, "", sql, dados_formatados)
         
-        print(f"🔍 SQL gerado: {sql}")
+        # Gerar insights
+        insights = gerar_insights(dados_formatados, pergunta, truncado)
         
-        # Executar consulta
-        with connection.cursor() as cursor:
-            cursor.execute(sql)
-            resultados = cursor.fetchall()
-            colunas = [desc[0] for desc in cursor.description]
+        # Gerar sugestões contextuais
+        sugestoes = conversation_memory.get_suggestions()
         
-        # Processar resultados
-        if not resultados:
-            resposta = "Nenhum resultado encontrado."
-        else:
-            # Converter para formato legível
-            dados_formatados = []
-            for linha in resultados:
-                linha_dict = dict(zip(colunas, linha))
-                dados_formatados.append(linha_dict)
-            
-            # Adicionar à memória de conversa (método correto)
-            conversation_memory.add_interaction(pergunta, "", sql, dados_formatados)
-            
-            # Gerar insights
-            insights = gerar_insights(dados_formatados, pergunta)
-            
-            # Gerar sugestões contextuais
-            sugestoes = conversation_memory.get_suggestions()
-            
-            # Formatar resposta
-            resposta = formatar_resposta_consulta(sql, dados_formatados, insights, sugestoes)
+        # Formatar resposta
+        resposta = formatar_resposta_consulta(sql, dados_formatados, insights, sugestoes, truncado)
+    
+    # Salvar no cache
+    query_cache.set(pergunta, slug, resposta, sql)
+    
+    return resposta
+
+def _executar_consulta(pergunta: str, slug: str) -> str:
+    """Gera o SQL, executa e formata a resposta de uma pergunta fora do cache"""
+    # Perguntas do catálogo de intenções já têm SQL validado: sem LLM
+    intencao = resolver_intencao(pergunta, slug)
+    if intencao:
+        pergunta_com_contexto, sql, origem = pergunta, intencao['sql'], None
+    else:
+        pergunta_com_contexto = _preparar_pergunta(pergunta, slug)
+        if pergunta_com_contexto is None:
+            return f"❌ Schema não encontrado para slug: {slug}"
         
-        # Salvar no cache
-        query_cache.set(pergunta, slug, resposta, sql)
+        # Gerar SQL com metadados (do cache, de um template ou do LLM)
+        sql, origem = gerar_sql_com_origem(pergunta_com_contexto, slug)
         
-        return resposta
+        if sql.startswith("-- Erro"):
+            return sql
+    
+    # Filtro de empresa/filial do tenant em cada tabela e LIMIT (tabelas grandes não são lidas inteiras)
+    sql = reescrever_sql(sql, slug).sql
+    
+    print(f"🔍 SQL gerado: {sql}")
+    
+    # O mesmo SQL não é tentado duas vezes na mesma pergunta do agente
+    if sql_ja_falhou(sql):
+        return MENSAGEM_SQL_REPETIDO
+    
+    # Executar consulta
+    versao_schema = obter_versao_schema(slug)
+    try:
+        # EXPLAIN antes de executar: SQL caro é limitado, regerado com o plano como feedback ou recusado
+        def regenerar_sync(feedback: str) -> str:
+            nonlocal origem
+            sql_novo, origem = gerar_sql_com_origem(pergunta_com_contexto + feedback, slug, usar_cache=False)
+            return reescrever_sql(sql_novo, slug).sql
+
+        regenerar = None if intencao else regenerar_sync
+        sql = verificar_custo(sql, slug, regenerar)
+        if sql.startswith("-- Erro"):
+            return sql
+        colunas, resultados, truncado = executar_sql(sql, slug)
+    except Exception as erro:
+        _registrar_falha(erro, sql, intencao, pergunta_com_contexto, slug, versao_schema)
+        raise
+    
+    return _finalizar_consulta(pergunta, pergunta_com_contexto, slug, versao_schema, sql, colunas, resultados,
+                               registrar_sql=origem == ORIGEM_LLM, truncado=truncado)
+
+async def _executar_consulta_async(pergunta: str, slug: str) -> str:
+    """Versão assíncrona de _executar_consulta (LLM com ainvoke, banco via executar_sql_async)"""
+    intencao = resolver_intencao(pergunta, slug)
+    if intencao:
+        pergunta_com_contexto, sql, origem = pergunta, intencao['sql'], None
+    else:
+        pergunta_com_contexto = _preparar_pergunta(pergunta, slug)
+        if pergunta_com_contexto is None:
+            return f"❌ Schema não encontrado para slug: {slug}"
         
-    except Exception as e:
-        error_msg = f"❌ Erro na consulta: {str(e)}"
-        print(error_msg)
-        return error_msg
+        sql, origem = await gerar_sql_com_origem_async(pergunta_com_contexto, slug)
+        
+        if sql.startswith("-- Erro"):
+            return sql
+    
+    sql = reescrever_sql(sql, slug).sql
+    
+    print(f"🔍 SQL gerado: {sql}")
+    
+    if sql_ja_falhou(sql):
+        return MENSAGEM_SQL_REPETIDO
+    
+    versao_schema = obter_versao_schema(slug)
+    try:
+        async def regenerar_async(feedback: str) -> str:
+            nonlocal origem
+            sql_novo, origem = await gerar_sql_com_origem_async(pergunta_com_contexto + feedback, slug,
+                                                                usar_cache=False)
+            return reescrever_sql(sql_novo, slug).sql
 
-def gerar_insights(dados: list, pergunta: str) -> str:
-    """Gera insights inteligentes baseados nos dados"""
+        regenerar = None if intencao else regenerar_async
+        sql = await verificar_custo_async(sql, slug, regenerar)
+        if sql.startswith("-- Erro"):
+            return sql
+        colunas, resultados, truncado = await executar_sql_async(sql, slug)
+    except Exception as erro:
+        _registrar_falha(erro, sql, intencao, pergunta_com_contexto, slug, versao_schema)
+        raise
+    
+    return _finalizar_consulta(pergunta, pergunta_com_contexto, slug, versao_schema, sql, colunas, resultados,
+                               registrar_sql=origem == ORIGEM_LLM, truncado=truncado)
+
+def gerar_insights(dados: list, pergunta: str, truncado: bool = False) -> str:
+    """Gera insights inteligentes baseados nos dados (só das linhas lidas, se truncado)"""
     if not dados:
         return ""
     
@@ -126,7 +293,10 @@ def gerar_insights(dados: list, pergunta: str) -> str:
     
     # Análise básica
     total_registros = len(dados)
-    insights.append(f"Total de registros: {total_registros}")
+    if truncado:
+        insights.append(f"Total de registros: mais de {total_registros} (análise das primeiras {total_registros} linhas)")
+    else:
+        insights.append(f"Total de registros: {total_registros}")
     
     # Análise específica para entidades por tipo
     if any('enti_tipo_enti' in str(item) for item in dados):
@@ -171,20 +341,25 @@ def gerar_insights(dados: list, pergunta: str) -> str:
     
     return "\n".join(insights) if insights else ""
 
-def formatar_resposta_consulta(sql: str, dados: list, insights: str, sugestoes: list) -> str:
+def formatar_resposta_consulta(sql: str, dados: list, insights: str, sugestoes: list,
+                               truncado: bool = False) -> str:
     """Formata a resposta da consulta de forma estruturada"""
     resposta = f"📊 **Resultados da consulta:**\n\n"
     resposta += f"```sql\n{sql}\n```\n\n"
     
     # Mostrar dados
-    if len(dados) <= 10:
+    if len(dados) <= 10 and not truncado:
         resposta += "**Dados encontrados:**\n"
         for i, linha in enumerate(dados, 1):
             resposta += f"\n**Registro {i}:**\n"
             for coluna, valor in linha.items():
                 resposta += f"- {coluna}: {valor}\n"
     else:
-        resposta += f"**Resumo:** {len(dados)} registros encontrados\n\n"
+        if truncado:
+            resposta += (f"**Resumo:** mais de {len(dados)} registros; a leitura parou no limite de "
+                         f"{len(dados)} linhas. Refine a pergunta (filtros ou agregação) para ver o total.\n\n")
+        else:
+            resposta += f"**Resumo:** {len(dados)} registros encontrados\n\n"
         resposta += "**Primeiros 5 registros:**\n"
         for i, linha in enumerate(dados[:5], 1):
             resposta += f"\n**Registro {i}:**\n"
@@ -0,0 +1,177 @@
+"""
+Verificação de custo do SQL antes da execução
+
+Todo SELECT passa por EXPLAIN (FORMAT JSON) e o custo total e as linhas
+estimadas do plano são comparados aos limites do tenant (custo_max e
+linhas_max no registro de tenants; padrão SQL_CUSTO_MAX e SQL_LINHAS_MAX):
+
+    dentro dos limites     executa
+    acima, sem LIMIT       tenta com LIMIT; executa se o novo plano couber
+    ainda acima            devolve ao gerador o plano como feedback (exigindo
+                           filtro de período ou por colunas indexadas), até
+                           SQL_CUSTO_REGERACOES vezes
+    sem saída              recusa (ConsultaCara), sem tocar o banco
+
+    SQL_CUSTO_VERIFICAR  true (padrão) liga a verificação
+"""
+
+import os
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from executores import PADRAO_CONSULTA, explicar_sql, explicar_sql_async
+from filtros_empresa import adicionar_limite
+from schema_loader import carregar_schema, colunas_indexadas
+from tenants import registro_tenants
+
+SQL_CUSTO_VERIFICAR = os.getenv("SQL_CUSTO_VERIFICAR", "true").lower() == "true"
+SQL_CUSTO_REGERACOES = int(os.getenv("SQL_CUSTO_REGERACOES", "1"))
+
+class ConsultaCara(Exception):
+    """SQL acima dos limites de custo do tenant mesmo depois de limitado e regerado"""
+
+# SQLs verificados, aprovados como vieram, aprovados com LIMIT, devolvidos ao gerador e recusados
+metricas_custo = {'verificadas': 0, 'aprovadas': 0, 'limitadas': 0, 'regeneradas': 0, 'recusadas': 0}
+_lock_metricas = threading.Lock()
+
+def contar_custo(campo: str):
+    with _lock_metricas:
+        metricas_custo[campo] += 1
+
+def limites_custo(slug: str) -> Dict:
+    config = registro_tenants.resolver(slug)[1]
+    return {'custo_max': config['custo_max'], 'linhas_max': config['linhas_max']}
+
+def _varreduras_sequenciais(no: Dict) -> List[Dict]:
+    """Seq Scans do plano, da mais cara para a mais barata"""
+    varreduras = []
+    pendentes = [no]
+    while pendentes:
+        atual = pendentes.pop()
+        if atual.get('Node Type') == 'Seq Scan' and atual.get('Relation Name'):
+            varreduras.append({
+                'tabela': atual['Relation Name'],
+                'custo': atual.get('Total Cost', 0),
+                'linhas': atual.get('Plan Rows', 0),
+            })
+        pendentes.extend(atual.get('Plans', []))
+    return sorted(varreduras, key=lambda v: v['custo'], reverse=True)
+
+def resumir_plano(plano: Dict) -> Dict:
+    """Custo total, linhas estimadas e varreduras sequenciais do nó raiz do EXPLAIN"""
+    return {
+        'custo': plano.get('Total Cost', 0),
+        'linhas': plano.get('Plan Rows', 0),
+        'varreduras': _varreduras_sequenciais(plano),
+    }
+
+def dentro_dos_limites(resumo: Dict, limites: Dict) -> bool:
+    return resumo['custo'] <= limites['custo_max'] and resumo['linhas'] <= limites['linhas_max']
+
+def _colunas_data(slug: str, tabela: str) -> List[str]:
+    schema = carregar_schema(slug) or {}
+    colunas = (schema.get(tabela) or {}).get('colunas', [])
+    return [c['nome'] for c in colunas if 'date' in c.get('tipo', '') or 'timestamp' in c.get('tipo', '')]
+
+def montar_feedback(sql: str, resumo: Dict, limites: Dict, slug: str) -> str:
+    """Texto acrescentado à pergunta para o gerador reescrever o SQL recusado"""
+    linhas = [
+        "\n\n⚠️ O SQL abaixo foi recusado pelo plano de execução "
+        f"(custo estimado {resumo['custo']:.0f}, máximo {limites['custo_max']:.0f}; "
+        f"~{resumo['linhas']} linhas, máximo {limites['linhas_max']}):",
+        sql,
+    ]
+    for varredura in resumo['varreduras'][:3]:
+        tabela = varredura['tabela']
+        filtros = _colunas_data(slug, tabela)[:2] + colunas_indexadas(slug, tabela)[:3]
+        sufixo = f" → filtre por {', '.join(filtros)}" if filtros else ""
+        linhas.append(f"   - leitura completa de {tabela} (custo {varredura['custo']:.0f}){sufixo}")
+    linhas.append("Gere outro SQL com filtro de período (coluna de data) ou por colunas indexadas, e LIMIT.")
+    return "\n".join(linhas)
+
+def _mensagem_recusa(resumo: Dict, limites: Dict) -> str:
+    tabelas = ", ".join(v['tabela'] for v in resumo['varreduras'][:3])
+    detalhe = f" (leitura completa de {tabelas})" if tabelas else ""
+    return (
+        f"Consulta cara demais para executar: custo estimado {resumo['custo']:.0f} "
+        f"(máximo {limites['custo_max']:.0f}), ~{resumo['linhas']} linhas{detalhe}. "
+        "Restrinja a pergunta a um período ou a um filtro mais específico."
+    )
+
+def verificar_custo(sql: str, slug: str, regenerar: Optional[Callable[[str], str]] = None) -> str:
+    """
+    Aplica a verificação de custo ao SQL
+
+    Args:
+        regenerar: recebe o feedback do plano e devolve outro SQL (None não regera)
+
+    Returns:
+        SQL a executar (o original, com LIMIT ou regerado)
+
+    Raises:
+        ConsultaCara: nenhuma alternativa ficou dentro dos limites
+    """
+    if not SQL_CUSTO_VERIFICAR or not PADRAO_CONSULTA.match(sql):
+        return sql
+    limites = limites_custo(slug)
+    for tentativa in range(SQL_CUSTO_REGERACOES + 1):
+        contar_custo('verificadas')
+        resumo = resumir_plano(explicar_sql(sql, slug))
+        if dentro_dos_limites(resumo, limites):
+            contar_custo('aprovadas')
+            return sql
+        limitado = adicionar_limite(sql)
+        if limitado != sql and dentro_dos_limites(resumir_plano(explicar_sql(limitado, slug)), limites):
+            contar_custo('limitadas')
+            print(f"📏 LIMIT aplicado pelo plano (custo estimado {resumo['custo']:.0f})")
+            return limitado
+        if regenerar is None or tentativa == SQL_CUSTO_REGERACOES:
+            break
+        contar_custo('regeneradas')
+        print(f"💸 SQL caro (custo {resumo['custo']:.0f}): devolvido ao gerador")
+        sql = regenerar(montar_feedback(sql, resumo, limites, slug))
+        if not PADRAO_CONSULTA.match(sql):
+            return sql
+    contar_custo('recusadas')
+    print(f"🚫 SQL recusado pelo custo ({resumo['custo']:.0f})")
+    raise ConsultaCara(_mensagem_recusa(resumo, limites))
+
+async def verificar_custo_async(sql: str, slug: str,
+                                regenerar: Optional[Callable[[str], Awaitable[str]]] = None) -> str:
+    """Versão assíncrona de verificar_custo (EXPLAIN e regeração sem bloquear o event loop)"""
+    if not SQL_CUSTO_VERIFICAR or not PADRAO_CONSULTA.match(sql):
+        return sql
+    limites = limites_custo(slug)
+    for tentativa in range(SQL_CUSTO_REGERACOES + 1):
+        contar_custo('verificadas')
+        resumo = resumir_plano(await explicar_sql_async(sql, slug))
+        if dentro_dos_limites(resumo, limites):
+            contar_custo('aprovadas')
+            return sql
+        limitado = adicionar_limite(sql)
+        if limitado != sql and dentro_dos_limites(resumir_plano(await explicar_sql_async(limitado, slug)), limites):
+            contar_custo('limitadas')
+            print(f"📏 LIMIT aplicado pelo plano (custo estimado {resumo['custo']:.0f})")
+            return limitado
+        if regenerar is None or tentativa == SQL_CUSTO_REGERACOES:
+            break
+        contar_custo('regeneradas')
+        print(f"💸 SQL caro (custo {resumo['custo']:.0f}): devolvido ao gerador")
+        sql = await regenerar(montar_feedback(sql, resumo, limites, slug))
+        if not PADRAO_CONSULTA.match(sql):
+            return sql
+    contar_custo('recusadas')
+    print(f"🚫 SQL recusado pelo custo ({resumo['custo']:.0f})")
+    raise ConsultaCara(_mensagem_recusa(resumo, limites))
+
+def obter_metricas_custo() -> Dict:
+    """Limites de custo por tenant e contadores da verificação"""
+    with _lock_metricas:
+        contadores = dict(metricas_custo)
+    return {
+        'ativo': SQL_CUSTO_VERIFICAR,
+        'regeneracoes': SQL_CUSTO_REGERACOES,
+        'limites': {t['slug']: {'custo_max': t['custo_max'], 'linhas_max': t['linhas_max']}
+                    for t in registro_tenants.listar()},
+        **contadores,
+    }
@@ -1,9 +1,401 @@
-from django.db import connections
+import asyncio
+import itertools
+import json
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
 
-def executar_sql_com_slug(sql: str, slug: str) -> list:
+from concorrencia import limitador
+from pool_conexoes import (
+    DB_POOL_OCIOSA_MAX_S,
+    DB_POOL_TIMEOUT_S,
+    PoolEsgotado,
+    pools_conexao,
+)
+from tenants import registro_tenants
 
-    with connections['default'].cursor() as cursor:
-        cursor.execute(sql)
-        colunas = [col[0] for col in cursor.description]
-        dados = cursor.fetchall()
-    return [dict(zip(colunas, row)) for row in dados]
+# Driver assíncrono opcional: sem asyncpg instalado, as consultas do caminho
+# assíncrono usam o pool psycopg2 do tenant em uma thread (asyncio.to_thread)
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+USAR_ASYNCPG = os.getenv("DB_DRIVER_ASYNC", "asyncpg").lower() == "asyncpg" and asyncpg is not None
+
+# Um pool asyncpg por tenant (mesma chave dos pools psycopg2)
+_pools_async: Dict[str, "asyncpg.Pool"] = {}
+_lock_pools_async = None
+_esperas_async = {'timeouts_pool_async': 0}
+
+# Máximo de linhas lidas por consulta (0 lê tudo) e tamanho de cada lote do cursor
+DB_LIMITE_LINHAS = int(os.getenv("DB_LIMITE_LINHAS", "1000"))
+DB_LOTE_LINHAS = int(os.getenv("DB_LOTE_LINHAS", "200"))
+
+# Só consultas podem virar DECLARE CURSOR; o resto usa cursor comum com fetchmany
+PADRAO_CONSULTA = re.compile(r"^\s*(SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+
+class ResultadoSQL(NamedTuple):
+    """Colunas, linhas lidas (até o limite) e se a leitura parou antes do fim"""
+    colunas: List[str]
+    linhas: list
+    truncado: bool
+
+# statement_timeout pedido pela requisição em andamento (só reduz o do tenant)
+timeout_requisicao_ms: ContextVar[Optional[int]] = ContextVar("timeout_requisicao_ms", default=None)
+
+# SQLSTATE de "canceling statement" (statement_timeout ou cancelamento)
+SQLSTATE_CANCELADA = '57014'
+
+class ConsultaExcedeuTempo(TimeoutError):
+    """SQL interrompido pelo statement_timeout"""
+
+class ConsultaCancelada(Exception):
+    """SQL cancelado porque o cliente desistiu da requisição"""
+
+# Consultas executadas, interrompidas no limite de linhas, linhas lidas,
+# SQLs interrompidos por statement_timeout, cancelados e clientes que desconectaram
+metricas_execucao = {
+    'consultas': 0, 'truncadas': 0, 'linhas_lidas': 0,
+    'timeouts': 0, 'canceladas': 0, 'desconexoes': 0,
+}
+_lock_metricas = threading.Lock()
+
+def contar_execucao(campo: str):
+    with _lock_metricas:
+        metricas_execucao[campo] += 1
+
+def _timeout_efetivo(timeout_tenant_ms: int) -> int:
+    """statement_timeout do tenant, reduzido pelo da requisição quando ele é menor"""
+    pedido = timeout_requisicao_ms.get()
+    if pedido and pedido > 0:
+        return min(pedido, timeout_tenant_ms) if timeout_tenant_ms else pedido
+    return timeout_tenant_ms
+
+class ConsultaCancelavel:
+    """Conexão do SQL que roda numa thread, para o event loop poder cancelá-lo no banco"""
+
+    def __init__(self):
+        self.cancelada = False
+        self._conexao = None
+        self._lock = threading.Lock()
+
+    def associar(self, conexao):
+        with self._lock:
+            if self.cancelada:
+                raise ConsultaCancelada("Consulta cancelada antes de começar")
+            self._conexao = conexao
+
+    def desassociar(self):
+        # Antes de a conexão voltar ao pool: o cancel não pode atingir o SQL de outra requisição
+        with self._lock:
+            self._conexao = None
+
+    def cancelar(self):
+        """Cancel do driver: o Postgres interrompe o SQL em andamento nesta conexão"""
+        with self._lock:
+            self.cancelada = True
+            if self._conexao is not None:
+                self._conexao.cancel()
+
+# O cancel do driver abre uma conexão ao servidor e espera a resposta: roda fora do
+# event loop, em threads próprias (as do to_thread podem estar todas presas nos SQLs
+# que se quer cancelar)
+_executor_cancelamento = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cancelar-sql")
+
+def _traduzir_erro(erro: Exception, timeout_ms: int, cancelavel: Optional[ConsultaCancelavel]) -> Exception:
+    """Erro de cancelamento do Postgres vira ConsultaExcedeuTempo ou ConsultaCancelada"""
+    if (getattr(erro, 'pgcode', None) or getattr(erro, 'sqlstate', None)) != SQLSTATE_CANCELADA:
+        return erro
+    if cancelavel is not None and cancelavel.cancelada:
+        return ConsultaCancelada("Consulta cancelada: o cliente desconectou")
+    contar_execucao('timeouts')
+    print(f"⏱️ SQL interrompido pelo statement_timeout ({timeout_ms} ms)")
+    return ConsultaExcedeuTempo(f"A consulta excedeu o tempo máximo de {timeout_ms} ms e foi cancelada no banco")
+
+def _registrar_execucao(linhas: int, truncado: bool):
+    with _lock_metricas:
+        metricas_execucao['consultas'] += 1
+        metricas_execucao['linhas_lidas'] += linhas
+        if truncado:
+            metricas_execucao['truncadas'] += 1
+
+def _lote(limite: int) -> int:
+    """Lote do fetchmany: não busca mais que o limite (+1 para detectar truncamento)"""
+    return min(DB_LOTE_LINHAS, limite + 1) if limite else DB_LOTE_LINHAS
+
+def _coletar(colunas: List[str], linhas: Iterable, limite: int) -> ResultadoSQL:
+    """Consome o gerador até limite + 1 linhas e para: o restante nunca sai do banco"""
+    if limite:
+        lidas = list(itertools.islice(linhas, limite + 1))
+        truncado = len(lidas) > limite
+        lidas = lidas[:limite]
+    else:
+        lidas, truncado = list(linhas), False
+    _registrar_execucao(len(lidas), truncado)
+    if truncado:
+        print(f"✂️ Resultado truncado em {limite} linhas")
+    return ResultadoSQL(colunas, lidas, truncado)
+
+@contextmanager
+def linhas_em_lotes(sql: str, slug: str, lote: int = DB_LOTE_LINHAS,
+                    cancelavel: Optional[ConsultaCancelavel] = None):
+    """
+    Executa o SQL em uma conexão do pool do tenant com cursor no servidor
+
+    Yields:
+        (colunas, gerador de linhas buscadas com fetchmany em lotes de `lote`);
+        o gerador só vale dentro do bloco
+    """
+    pool = pools_conexao.pool(slug)
+    timeout_tenant_ms = pool.config['statement_timeout_ms']
+    timeout_ms = _timeout_efetivo(timeout_tenant_ms)
+    with pool.conexao() as conexao:
+        no_servidor = bool(PADRAO_CONSULTA.match(sql))
+        if no_servidor:
+            # DECLARE CURSOR exige transação; a conexão volta ao pool em autocommit
+            conexao.autocommit = False
+        try:
+            if cancelavel is not None:
+                cancelavel.associar(conexao)
+            if timeout_ms != timeout_tenant_ms:
+                # SET LOCAL vale até o fim da transação; fora dela, até o RESET no fim
+                with conexao.cursor() as cursor:
+                    cursor.execute(
+                        "SET LOCAL statement_timeout = %s" if no_servidor else "SET statement_timeout = %s",
+                        (timeout_ms,)
+                    )
+            nome = f"consulta_{uuid.uuid4().hex[:12]}" if no_servidor else None
+            with conexao.cursor(name=nome) as cursor:
+                cursor.itersize = lote
+                cursor.execute(sql)
+                # No cursor nomeado a descrição das colunas só existe após o primeiro fetch;
+                # comando sem resultado (SET, DDL) não tem descrição
+                primeiro_lote = cursor.fetchmany(lote) if no_servidor or cursor.description else []
+                colunas = [desc[0] for desc in cursor.description or ()]
+
+                def linhas() -> Iterator[tuple]:
+                    atual = primeiro_lote
+                    while atual:
+                        yield from atual
+                        if len(atual) < lote:
+                            return
+                        atual = cursor.fetchmany(lote)
+
+                yield colunas, linhas()
+        except Exception as e:
+            erro = _traduzir_erro(e, timeout_ms, cancelavel)
+            if erro is e:
+                raise
+            raise erro from e
+        finally:
+            if cancelavel is not None:
+                cancelavel.desassociar()
+            try:
+                if no_servidor:
+                    conexao.rollback()
+                    conexao.autocommit = True
+                elif timeout_ms != timeout_tenant_ms:
+                    with conexao.cursor() as cursor:
+                        cursor.execute("RESET statement_timeout")
+            except Exception:
+                # Conexão em estado desconhecido: fechada, o pool a descarta
+                conexao.close()
+
+def executar_sql(sql: str, slug: str, limite: Optional[int] = None,
+                 cancelavel: Optional[ConsultaCancelavel] = None) -> ResultadoSQL:
+    """
+    Executa o SQL no pool do tenant lendo no máximo `limite` linhas (padrão DB_LIMITE_LINHAS)
+
+    Returns:
+        ResultadoSQL(colunas, linhas, truncado)
+    """
+    limite = DB_LIMITE_LINHAS if limite is None else limite
+    with linhas_em_lotes(sql, slug, _lote(limite), cancelavel) as (colunas, linhas):
+        return _coletar(colunas, linhas, limite)
+
+def executar_sql_com_slug(sql: str, slug: str, limite: Optional[int] = None) -> list:
+    colunas, linhas, _ = executar_sql(sql, slug, limite)
+    return [dict(zip(colunas, row)) for row in linhas]
+
+async def _obter_pool(slug: str):
+    """Pool asyncpg do tenant, criado na primeira consulta com a conexão do registro"""
+    global _lock_pools_async
+    chave, config = registro_tenants.resolver(slug)
+    pool = _pools_async.get(chave)
+    if pool is not None:
+        return pool
+    if _lock_pools_async is None:
+        _lock_pools_async = asyncio.Lock()
+    async with _lock_pools_async:
+        pool = _pools_async.get(chave)
+        if pool is None:
+            referencia = pools_conexao.pool(slug)
+            # asyncpg já descarta conexões fechadas no acquire e ociosas após
+            # max_inactive_connection_lifetime
+            pool = await asyncpg.create_pool(
+                host=config['host'],
+                port=config['port'],
+                user=config['user'],
+                password=config['password'],
+                database=config['dbname'],
+                min_size=referencia.minimo,
+                max_size=referencia.maximo,
+                max_inactive_connection_lifetime=DB_POOL_OCIOSA_MAX_S,
+                server_settings={
+                    'search_path': 'public',
+                    'statement_timeout': str(config['statement_timeout_ms']),
+                },
+            )
+            _pools_async[chave] = pool
+            print(f"🔌 Pool asyncpg {chave}: {referencia.minimo}-{referencia.maximo} conexões ({config['dbname']})")
+    return pool
+
+async def executar_sql_async(sql: str, slug: str, limite: Optional[int] = None) -> ResultadoSQL:
+    """
+    Executa o SQL sem bloquear o event loop, lendo no máximo `limite` linhas
+
+    Returns:
+        ResultadoSQL(colunas, linhas, truncado)
+    """
+    limite = DB_LIMITE_LINHAS if limite is None else limite
+    async with limitador.limite('db'):
+        if USAR_ASYNCPG:
+            return await _executar_asyncpg(sql, slug, limite)
+        cancelavel = ConsultaCancelavel()
+        tarefa = asyncio.ensure_future(asyncio.to_thread(executar_sql, sql, slug, limite, cancelavel))
+        try:
+            return await asyncio.shield(tarefa)
+        except asyncio.CancelledError:
+            # Cancelar a tarefa não interrompe a thread: o SQL é cancelado no banco
+            cancelamento = asyncio.get_running_loop().run_in_executor(_executor_cancelamento, cancelavel.cancelar)
+            cancelamento.add_done_callback(lambda f: f.cancelled() or f.exception())
+            contar_execucao('canceladas')
+            print("🛑 SQL cancelado no banco (requisição cancelada)")
+            tarefa.add_done_callback(lambda t: t.cancelled() or t.exception())
+            raise
+
+async def _executar_asyncpg(sql: str, slug: str, limite: int) -> ResultadoSQL:
+    """Execução pelo pool asyncpg do tenant; ao cancelar a tarefa o asyncpg cancela o SQL no banco"""
+    pool = await _obter_pool(slug)
+    timeout_tenant_ms = registro_tenants.resolver(slug)[1]['statement_timeout_ms']
+    timeout_ms = _timeout_efetivo(timeout_tenant_ms)
+    try:
+        conexao = await pool.acquire(timeout=DB_POOL_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        _esperas_async['timeouts_pool_async'] += 1
+        raise PoolEsgotado(f"Pool asyncpg {slug}: nenhuma conexão livre em {DB_POOL_TIMEOUT_S:g}s")
+    try:
+        linhas = []
+        async with conexao.transaction():
+            if timeout_ms != timeout_tenant_ms:
+                await conexao.execute(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+            declaracao = await conexao.prepare(sql)
+            colunas = [atributo.name for atributo in declaracao.get_attributes()]
+            if not PADRAO_CONSULTA.match(sql):
+                return _coletar(colunas, map(tuple, await declaracao.fetch()), limite)
+            # Cursor no servidor, buscado em lotes de prefetch
+            async for registro in declaracao.cursor(prefetch=_lote(limite)):
+                linhas.append(tuple(registro))
+                if limite and len(linhas) > limite:
+                    break
+        return _coletar(colunas, linhas, limite)
+    except asyncio.CancelledError:
+        contar_execucao('canceladas')
+        print("🛑 SQL cancelado no banco (requisição cancelada)")
+        raise
+    except Exception as e:
+        erro = _traduzir_erro(e, timeout_ms, None)
+        if erro is e:
+            raise
+        raise erro from e
+    finally:
+        await pool.release(conexao)
+
+def _plano_raiz(resultado) -> Dict:
+    """Nó raiz do EXPLAIN (FORMAT JSON); o asyncpg devolve o JSON como texto"""
+    if isinstance(resultado, str):
+        resultado = json.loads(resultado)
+    return resultado[0]['Plan']
+
+def explicar_sql(sql: str, slug: str) -> Dict:
+    """
+    Plano estimado do SQL (EXPLAIN sem ANALYZE: nada é executado)
+
+    Roda numa transação desfeita no fim, para que um segundo comando colado
+    ao SQL não tenha efeito.
+    """
+    with pools_conexao.pool(slug).conexao() as conexao:
+        conexao.autocommit = False
+        try:
+            with conexao.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}")
+                return _plano_raiz(cursor.fetchone()[0])
+        finally:
+            try:
+                conexao.rollback()
+                conexao.autocommit = True
+            except Exception:
+                conexao.close()
+
+async def explicar_sql_async(sql: str, slug: str) -> Dict:
+    """Versão assíncrona de explicar_sql"""
+    async with limitador.limite('db'):
+        if not USAR_ASYNCPG:
+            return await asyncio.to_thread(explicar_sql, sql, slug)
+        pool = await _obter_pool(slug)
+        try:
+            conexao = await pool.acquire(timeout=DB_POOL_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            _esperas_async['timeouts_pool_async'] += 1
+            raise PoolEsgotado(f"Pool asyncpg {slug}: nenhuma conexão livre em {DB_POOL_TIMEOUT_S:g}s")
+        try:
+            # Protocolo estendido: um único comando por chamada
+            return _plano_raiz(await conexao.fetchval(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}"))
+        finally:
+            await pool.release(conexao)
+
+async def aquecer_banco(slugs: List[str]) -> Dict[str, int]:
+    """Abre as conexões mínimas do pool de cada slug antes da primeira pergunta"""
+    abertas = {}
+    for slug in slugs:
+        if USAR_ASYNCPG:
+            pool = await _obter_pool(slug)
+            async with pool.acquire(timeout=DB_POOL_TIMEOUT_S) as conexao:
+                await conexao.fetchval("SELECT 1")
+            abertas[slug] = pool.get_size()
+        else:
+            abertas[slug] = await asyncio.to_thread(pools_conexao.pool(slug).aquecer)
+    return abertas
+
+async def fechar_pools():
+    """Fecha os pools de todos os tenants (desligamento da API)"""
+    pools = list(_pools_async.values())
+    _pools_async.clear()
+    for pool in pools:
+        await pool.close()
+    await asyncio.to_thread(pools_conexao.fechar_todos)
+
+def obter_metricas_pools() -> Dict:
+    """Tenants cadastrados, uso dos pools (psycopg2 e asyncpg) e linhas lidas/truncadas"""
+    return {
+        'tenants': registro_tenants.listar(),
+        'driver_async': 'asyncpg' if USAR_ASYNCPG else 'pool psycopg2 em thread',
+        'pools': pools_conexao.get_stats(),
+        'pools_async': {
+            chave: {'abertas': pool.get_size(), 'ociosas': pool.get_idle_size(),
+                    'minimo': pool.get_min_size(), 'maximo': pool.get_max_size()}
+            for chave, pool in _pools_async.items()
+        },
+        **_esperas_async,
+        'execucao': {
+            'limite_linhas': DB_LIMITE_LINHAS,
+            'lote_linhas': DB_LOTE_LINHAS,
+            **metricas_execucao,
+        },
+    }
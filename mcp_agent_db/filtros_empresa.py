@@ -1,32 +1,290 @@
+"""
+Reescrita do SQL gerado antes da execução
+
+    - filtro de empresa/filial do tenant (empresa e filial no registro de
+      tenants) em toda tabela base com colunas *_empr/*_fili da chave primária,
+      inclusive em subconsultas, CTEs e JOINs: o Postgres usa os índices
+      compostos que começam por empr, fili
+    - LIMIT em consultas sem LIMIT que leem tabelas grandes, e LIMIT acima de
+      DB_LIMITE_LINHAS reduzido a DB_LIMITE_LINHAS + 1 (a linha extra só
+      sinaliza ao executor que o resultado foi cortado)
+    - SQL normalizado (formatação e caixa de palavras-chave únicas) para chaves
+      de cache
+
+Com sqlglot instalado o SQL é reescrito na árvore sintática; sem ele, ou se o
+parser falhar, as regras valem só para consultas simples (uma tabela, sem
+subconsulta) e o resto passa inalterado.
+"""
+
 import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-def forcar_filtro_empresa(sql: str, slug: str) -> str:
-    """Força filtro de empresa nas queries quando necessário"""
-    # Mapear slug para código da empresa
-    empresa_map = {
-        "casaa": 1,
-        "spartacus": 2,
-        "cliente_teste": 3
-    }
-    
-    codigo_empresa = empresa_map.get(slug)
-    if not codigo_empresa:
+from executores import DB_LIMITE_LINHAS
+from schema_loader import carregar_schema, tabela_grande
+from tenants import registro_tenants
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:
+    sqlglot = None
+    print("⚠️ sqlglot não instalado: filtro de empresa só em consultas simples "
+          "(JOINs, subconsultas e CTEs passam sem filtro); instale com pip install sqlglot")
+
+# LIMIT aplicado a consultas sem LIMIT que leem tabelas grandes
+LIMITE_TABELA_GRANDE = 1000
+
+# Maior LIMIT mantido: o executor lê no máximo DB_LIMITE_LINHAS (0 não limita)
+LIMITE_MAXIMO = DB_LIMITE_LINHAS + 1 if DB_LIMITE_LINHAS else 0
+
+PADRAO_COLUNA_TENANT = {
+    'empresa': re.compile(r"^[a-z]+_empr$"),
+    'filial': re.compile(r"^[a-z]+_fili$"),
+}
+
+class SQLReescrito(NamedTuple):
+    """SQL a executar, forma normalizada (chave de cache) e o que foi alterado"""
+    sql: str
+    normalizado: str
+    alteracoes: List[str]
+
+def colunas_tenant(slug: str, tabela: str) -> Dict[str, str]:
+    """Colunas de empresa/filial da tabela (da chave primária, se o schema a informa)"""
+    schema = carregar_schema(slug) or {}
+    colunas = (schema.get(tabela) or {}).get('colunas', [])
+    chave = [c for c in colunas if c.get('primary_key')] or colunas
+    encontradas = {}
+    for campo, padrao in PADRAO_COLUNA_TENANT.items():
+        nome = next((c['nome'] for c in chave if padrao.match(c['nome'])), None)
+        if nome:
+            encontradas[campo] = nome
+    return encontradas
+
+def _valores_tenant(slug: str) -> Dict[str, int]:
+    config = registro_tenants.resolver(slug)[1]
+    return {campo: config[campo] for campo in ('empresa', 'filial') if config.get(campo) is not None}
+
+def normalizar_sql(sql: str) -> str:
+    """Forma canônica do SQL: a mesma consulta escrita de outro jeito vira a mesma chave"""
+    if sqlglot is not None:
+        try:
+            return sqlglot.parse_one(sql, read='postgres').sql(dialect='postgres')
+        except Exception:
+            pass
+    return re.sub(r"\s+", " ", sql.strip().rstrip(';')).strip()
+
+# Reescrita na árvore sintática (sqlglot)
+
+def _conjuncoes(condicao) -> list:
+    """Termos ligados por AND no nível de cima da condição"""
+    while isinstance(condicao, (exp.Where, exp.Paren)):
+        condicao = condicao.this
+    if isinstance(condicao, exp.And):
+        return _conjuncoes(condicao.left) + _conjuncoes(condicao.right)
+    return [condicao]
+
+def _ja_filtra(condicao, referencia: str, coluna: str, valor: int) -> bool:
+    """
+    True só se a condição já exige coluna = valor num termo de nível de cima
+
+    Qualquer outro uso da coluna (outro valor, IN, OR, igualdade com outra
+    tabela) não isola o tenant, e o filtro é acrescentado.
+    """
+    if condicao is None:
+        return False
+    for termo in _conjuncoes(condicao):
+        if not isinstance(termo, exp.EQ):
+            continue
+        for lado_coluna, lado_valor in ((termo.left, termo.right), (termo.right, termo.left)):
+            if (isinstance(lado_coluna, exp.Column) and lado_coluna.name == coluna
+                    and lado_coluna.table in ('', referencia)
+                    and isinstance(lado_valor, exp.Literal) and lado_valor.is_int
+                    and int(lado_valor.this) == valor):
+                return True
+    return False
+
+def _predicado(referencia: str, coluna: str, valor: int):
+    return exp.EQ(this=exp.column(coluna, table=referencia), expression=exp.Literal.number(valor))
+
+def _filtrar_select(select, slug: str, valores: Dict[str, int], ctes: set, alteracoes: List[str]):
+    """Filtro do tenant em cada tabela base do FROM e dos JOINs deste SELECT"""
+    origem = select.args.get('from_') or select.args.get('from')
+    if origem is None:
+        return
+    joins = select.args.get('joins') or []
+    # Lado que pode vir nulo num outer join: o filtro vai no ON, senão o JOIN vira INNER
+    destinos = [(origem.this, None)]
+    externo = next((j for j in joins if j.args.get('side') in ('RIGHT', 'FULL')), None)
+    if externo is not None:
+        destinos = [(origem.this, externo if externo is joins[0] else False)]
+    for join in joins:
+        lado = join.args.get('side')
+        destinos.append((join.this, join if lado in ('LEFT', 'FULL') else None))
+
+    for tabela, join in destinos:
+        if not isinstance(tabela, exp.Table) or tabela.name in ctes:
+            continue
+        colunas = colunas_tenant(slug, tabela.name.lower())
+        referencia = tabela.alias_or_name
+        condicao = join.args.get('on') if join else select.args.get('where')
+        filtros = [
+            (colunas[campo], valor) for campo, valor in valores.items()
+            if colunas.get(campo) and not _ja_filtra(condicao, referencia, colunas[campo], valor)
+        ]
+        if not filtros:
+            continue
+        if join is False or (join is not None and join.args.get('using')):
+            print(f"⚠️ Filtro de empresa não aplicado em {tabela.name}: outer join sem ON compatível")
+            continue
+        predicado = exp.and_(*(_predicado(referencia, coluna, valor) for coluna, valor in filtros))
+        if join is not None:
+            join.on(predicado, copy=False)
+        else:
+            select.where(predicado, copy=False)
+        alteracoes.extend(f"{referencia}.{coluna} = {valor}" for coluna, valor in filtros)
+
+def _limitar_arvore(arvore, slug: str, ctes: set, alteracoes: List[str]):
+    limite = arvore.args.get('limit')
+    if limite is not None:
+        valor = limite.args.get('expression')
+        if (LIMITE_MAXIMO and isinstance(valor, exp.Literal) and valor.is_int
+                and int(valor.this) > LIMITE_MAXIMO):
+            limite.set('expression', exp.Literal.number(LIMITE_MAXIMO))
+            alteracoes.append(f"LIMIT {valor.this} -> {LIMITE_MAXIMO}")
+        return
+    grandes = sorted({
+        t.name for t in arvore.find_all(exp.Table)
+        if t.name not in ctes and tabela_grande(slug, t.name.lower())
+    })
+    if grandes:
+        arvore.limit(LIMITE_TABELA_GRANDE, copy=False)
+        alteracoes.append(f"LIMIT {LIMITE_TABELA_GRANDE} (tabelas grandes: {', '.join(grandes)})")
+
+def _reescrever_arvore(sql: str, slug: str, valores: Dict[str, int]) -> Optional[SQLReescrito]:
+    """None se o SQL não for uma consulta que o sqlglot entende"""
+    try:
+        arvore = sqlglot.parse_one(sql, read='postgres')
+    except Exception:
+        return None
+    if not isinstance(arvore, (exp.Select, exp.Union)):
+        return None
+    ctes = {cte.alias_or_name for cte in arvore.find_all(exp.CTE)}
+    alteracoes: List[str] = []
+    if valores:
+        for select in list(arvore.find_all(exp.Select)):
+            _filtrar_select(select, slug, valores, ctes, alteracoes)
+    _limitar_arvore(arvore, slug, ctes, alteracoes)
+    normalizado = arvore.sql(dialect='postgres')
+    if not alteracoes:
+        return SQLReescrito(sql, normalizado, [])
+    return SQLReescrito(arvore.sql(dialect='postgres', pretty=True), normalizado, alteracoes)
+
+# Reescrita por expressões regulares (sem sqlglot)
+
+CLAUSULAS_FINAIS = r"\b(GROUP\s+BY|HAVING|WINDOW|ORDER\s+BY|LIMIT|OFFSET|FETCH|FOR)\b"
+PALAVRAS_APOS_FROM = {'WHERE', 'GROUP', 'HAVING', 'WINDOW', 'ORDER', 'LIMIT', 'OFFSET', 'FETCH', 'FOR'}
+
+def adicionar_limite(sql: str, limite: int = LIMITE_TABELA_GRANDE) -> str:
+    """Acrescenta LIMIT a um SELECT que ainda não tem (outros comandos voltam inalterados)"""
+    sql_limpo = sql.strip().rstrip(';').rstrip()
+    if not re.match(r"^\s*(SELECT|WITH)\b", sql_limpo, flags=re.IGNORECASE):
         return sql
-    
-    # Se a query já tem filtro de empresa, não modificar
-    if "pedi_empr" in sql.lower():
+    if re.search(r"\bLIMIT\s+\d+", sql_limpo, flags=re.IGNORECASE):
         return sql
-    
-    # Adicionar filtro WHERE ou AND conforme necessário
-    if "WHERE" in sql.upper():
-        sql = sql.replace("WHERE", f"WHERE pedi_empr = {codigo_empresa} AND")
-    elif "FROM" in sql.upper() and "pedidosvenda" in sql.lower():
-        # Adicionar WHERE após FROM pedidosvenda
-        sql = re.sub(
-            r"(FROM\s+pedidosvenda[^\s]*)", 
-            f"\\1 WHERE pedi_empr = {codigo_empresa}", 
-            sql, 
-            flags=re.IGNORECASE
-        )
-    
-    return sql
\ No newline at end of file
+    return f"{sql_limpo}\nLIMIT {limite}"
+
+def _origem_simples(sql: str) -> Optional[Tuple[str, str, int]]:
+    """(tabela, referência, fim do FROM) de um SELECT de uma tabela só, sem JOIN, subconsulta ou UNION"""
+    if not re.match(r"^\s*SELECT\b", sql, flags=re.IGNORECASE):
+        return None
+    if len(re.findall(r"\bSELECT\b", sql, flags=re.IGNORECASE)) != 1:
+        return None
+    if re.search(r"\b(JOIN|UNION|INTERSECT|EXCEPT)\b", sql, flags=re.IGNORECASE):
+        return None
+    origem = re.search(r"\bFROM\s+([a-zA-Z_]\w*)(?:\s+(?:AS\s+)?([a-zA-Z_]\w*))?(\s*,)?", sql, flags=re.IGNORECASE)
+    if origem is None or origem.group(3):
+        return None
+    tabela, alias = origem.group(1), origem.group(2)
+    if alias and alias.upper() in PALAVRAS_APOS_FROM:
+        return tabela, tabela, origem.start(2)
+    return tabela, alias or tabela, origem.end()
+
+def _conjuncoes_texto(condicao: str) -> List[str]:
+    """Termos ligados por AND fora de parênteses e de literais"""
+    termos, inicio, profundidade = [], 0, 0
+    for token in re.finditer(r"'(?:[^']|'')*'|\(|\)|\bAND\b", condicao, flags=re.IGNORECASE):
+        if token.group() == '(':
+            profundidade += 1
+        elif token.group() == ')':
+            profundidade -= 1
+        elif profundidade == 0 and token.group().upper() == 'AND':
+            termos.append(condicao[inicio:token.start()])
+            inicio = token.end()
+    termos.append(condicao[inicio:])
+    return [termo.strip() for termo in termos]
+
+def _ja_filtra_texto(condicao: str, referencia: str, coluna: str, valor: int) -> bool:
+    """Versão de _ja_filtra para o texto da condição (BETWEEN ... AND impede a dispensa)"""
+    if re.search(r"\bBETWEEN\b", condicao, flags=re.IGNORECASE):
+        return False
+    padrao = re.compile(rf"^(?:{re.escape(referencia)}\.)?{re.escape(coluna)}\s*=\s*{valor}$", re.IGNORECASE)
+    return any(padrao.match(termo) for termo in _conjuncoes_texto(condicao))
+
+def _reescrever_regex(sql: str, slug: str, valores: Dict[str, int]) -> SQLReescrito:
+    alteracoes: List[str] = []
+    sql_limpo = sql.strip().rstrip(';').rstrip()
+    origem = _origem_simples(sql_limpo) if valores else None
+    if origem:
+        tabela, referencia, fim_from = origem
+        colunas = colunas_tenant(slug, tabela.lower())
+        where = re.search(r"\bWHERE\b", sql_limpo, flags=re.IGNORECASE)
+        resto = fim_from if where is None else where.end()
+        final = re.search(CLAUSULAS_FINAIS, sql_limpo[resto:], flags=re.IGNORECASE)
+        fim = resto + final.start() if final else len(sql_limpo)
+        condicao = sql_limpo[where.end():fim].strip() if where else ""
+        predicados = [
+            f"{referencia}.{colunas[campo]} = {valor}"
+            for campo, valor in valores.items()
+            if colunas.get(campo) and not _ja_filtra_texto(condicao, referencia, colunas[campo], valor)
+        ]
+        if predicados:
+            filtro = " AND ".join(predicados)
+            if where is None:
+                sql_limpo = f"{sql_limpo[:fim].rstrip()} WHERE {filtro} {sql_limpo[fim:]}".rstrip()
+            else:
+                sql_limpo = f"{sql_limpo[:where.end()]} {filtro} AND ({condicao}) {sql_limpo[fim:]}".rstrip()
+            alteracoes.extend(predicados)
+    elif valores and re.search(r"\bFROM\b", sql_limpo, flags=re.IGNORECASE):
+        print("⚠️ Filtro de empresa não aplicado: consulta complexa sem sqlglot instalado")
+
+    limite = re.search(r"\bLIMIT\s+(\d+)\s*$", sql_limpo, flags=re.IGNORECASE)
+    if limite and LIMITE_MAXIMO and int(limite.group(1)) > LIMITE_MAXIMO:
+        sql_limpo = f"{sql_limpo[:limite.start(1)]}{LIMITE_MAXIMO}"
+        alteracoes.append(f"LIMIT {limite.group(1)} -> {LIMITE_MAXIMO}")
+    elif not limite:
+        tabelas = re.findall(r"\b(?:FROM|JOIN)\s+([a-zA-Z_]\w*)", sql_limpo, flags=re.IGNORECASE)
+        grandes = [t for t in dict.fromkeys(tabelas) if tabela_grande(slug, t.lower())]
+        limitado = adicionar_limite(sql_limpo) if grandes else sql_limpo
+        if limitado != sql_limpo:
+            sql_limpo = limitado
+            alteracoes.append(f"LIMIT {LIMITE_TABELA_GRANDE} (tabelas grandes: {', '.join(grandes)})")
+
+    if not alteracoes:
+        return SQLReescrito(sql, normalizar_sql(sql), [])
+    return SQLReescrito(sql_limpo, normalizar_sql(sql_limpo), alteracoes)
+
+def reescrever_sql(sql: str, slug: str) -> SQLReescrito:
+    """Aplica filtro do tenant e LIMIT ao SQL gerado (comandos que não são consulta passam inalterados)"""
+    if not re.match(r"^\s*(SELECT|WITH)\b", sql, flags=re.IGNORECASE):
+        return SQLReescrito(sql, normalizar_sql(sql), [])
+    valores = _valores_tenant(slug)
+    reescrito = _reescrever_arvore(sql, slug, valores) if sqlglot is not None else None
+    if reescrito is None:
+        reescrito = _reescrever_regex(sql, slug, valores)
+    if reescrito.alteracoes:
+        print(f"✏️ SQL reescrito: {'; '.join(reescrito.alteracoes)}")
+    return reescrito
+
+def forcar_filtro_empresa(sql: str, slug: str) -> str:
+    """Filtro de empresa/filial do tenant (e LIMIT) no SQL; ver reescrever_sql"""
+    return reescrever_sql(sql, slug).sql
@@ -4,10 +4,23 @@ import psycopg2
 import sqlite3
 import os
 import json
-from typing import Dict, List, Any
+import hashlib
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Iterable, Optional
+from schema_compacto import EXTENSAO, atualizar_schema_compacto, salvar_schema_compacto
+from schema_loader import resumo_estatisticas
+from schema_index import secoes_compartilhadas
 
 SCHEMA_DIR = "schemas"
 
+# Quantidade de bancos processados em paralelo por gerar_schemas
+SCHEMA_WORKERS = int(os.getenv("SCHEMA_WORKERS", "4"))
+
+# Colunas com até esse número de valores distintos guardam os valores mais comuns
+LIMITE_BAIXA_CARDINALIDADE = 20
+
 # Configurações de exemplo para diferentes tipos de banco
 DATABASES = {
     "casaa": {
@@ -73,28 +86,32 @@ def conectar_db(config: Dict[str, Any]):
     else:
         raise ValueError(f"Tipo de banco não suportado: {tipo}")
 
-def extrair_schema_postgres(conexao):
-    """Extrai schema do PostgreSQL"""
+def extrair_schema_postgres(conexao, esquema="public"):
+    """
+    Extrai schema do PostgreSQL direto do pg_catalog
+
+    Uma única consulta sobre pg_class/pg_attribute/pg_index, filtrada por OID
+    do namespace, em vez dos joins por nome das views do information_schema.
+    """
     cursor = conexao.cursor()
     cursor.execute("""
-        SELECT 
-            t.table_name,
-            c.column_name,
-            c.data_type,
-            c.is_nullable,
-            c.column_default,
-            CASE WHEN pk.column_name IS NOT NULL THEN true ELSE false END as is_primary_key
-        FROM information_schema.tables t
-        JOIN information_schema.columns c ON t.table_name = c.table_name
-        LEFT JOIN (
-            SELECT ku.table_name, ku.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage ku ON tc.constraint_name = ku.constraint_name
-            WHERE tc.constraint_type = 'PRIMARY KEY'
-        ) pk ON c.table_name = pk.table_name AND c.column_name = pk.column_name
-        WHERE t.table_schema = 'public' AND t.table_type = 'BASE TABLE'
-        ORDER BY t.table_name, c.ordinal_position;
-    """)
+        SELECT
+            c.relname AS table_name,
+            a.attname AS column_name,
+            format_type(a.atttypid, NULL) AS data_type,
+            CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END AS is_nullable,
+            pg_get_expr(d.adbin, d.adrelid) AS column_default,
+            COALESCE(a.attnum = ANY(i.indkey), false) AS is_primary_key
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+        LEFT JOIN pg_index i ON i.indrelid = c.oid AND i.indisprimary
+        WHERE n.nspname = %s
+          AND c.relkind IN ('r', 'p')
+          AND NOT c.relispartition
+        ORDER BY c.relname, a.attnum;
+    """, (esquema,))
     return cursor.fetchall()
 
 def extrair_schema_sqlite(conexao):
@@ -124,12 +141,143 @@ def extrair_schema_sqlite(conexao):
     
     return resultado
 
-def extrair_schema(conexao, tipo_banco="postgres"):
+def extrair_fks_postgres(conexao, esquema="public"):
+    """Extrai as chaves estrangeiras do PostgreSQL (colunas na ordem da constraint)"""
+    cursor = conexao.cursor()
+    cursor.execute("""
+        SELECT
+            c.relname AS tabela,
+            con.conname AS nome,
+            r.relname AS tabela_ref,
+            array_agg(a.attname ORDER BY k.ordem) AS colunas,
+            array_agg(af.attname ORDER BY k.ordem) AS colunas_ref
+        FROM pg_constraint con
+        JOIN pg_class c ON c.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_class r ON r.oid = con.confrelid
+        CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, attnum_ref, ordem)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        JOIN pg_attribute af ON af.attrelid = con.confrelid AND af.attnum = k.attnum_ref
+        WHERE con.contype = 'f' AND n.nspname = %s
+        GROUP BY c.relname, con.conname, r.relname
+        ORDER BY c.relname, con.conname;
+    """, (esquema,))
+    return [
+        (tabela, nome, tabela_ref, list(colunas), list(colunas_ref))
+        for tabela, nome, tabela_ref, colunas, colunas_ref in cursor.fetchall()
+    ]
+
+def extrair_fks_sqlite(conexao):
+    """Extrai as chaves estrangeiras do SQLite"""
+    cursor = conexao.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tabelas = [nome for (nome,) in cursor.fetchall()]
+    
+    resultado = []
+    for tabela in tabelas:
+        cursor.execute(f"PRAGMA foreign_key_list({tabela});")
+        fks = {}
+        for id_fk, seq, tabela_ref, coluna, coluna_ref, *_ in cursor.fetchall():
+            fk = fks.setdefault(id_fk, (tabela, f"fk_{tabela}_{id_fk}", tabela_ref, [], []))
+            fk[3].append(coluna)
+            fk[4].append(coluna_ref)
+        resultado.extend(fks.values())
+    
+    return resultado
+
+def extrair_estatisticas_postgres(conexao, esquema="public") -> Dict[str, Dict]:
+    """
+    Extrai tamanho, índices e estatísticas de colunas (pg_stats) por tabela
+
+    Estatísticas de coluna são guardadas só para colunas indexadas e de baixa
+    cardinalidade (com os valores mais comuns), para não inflar o schema.
+    """
+    cursor = conexao.cursor()
+    estatisticas: Dict[str, Dict] = {}
+
+    cursor.execute("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND NOT c.relispartition;
+    """, (esquema,))
+    for tabela, linhas, tamanho in cursor.fetchall():
+        estatisticas[tabela] = {
+            # reltuples = -1 quando a tabela nunca foi analisada (PG14+)
+            "linhas": linhas if linhas is not None and linhas >= 0 else None,
+            "tamanho_bytes": tamanho,
+            "indices": [],
+            "colunas": {}
+        }
+
+    cursor.execute("""
+        SELECT c.relname, i.relname, ix.indisunique, array_agg(a.attname ORDER BY k.ordem)
+        FROM pg_index ix
+        JOIN pg_class c ON c.oid = ix.indrelid
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        CROSS JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ordem)
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = k.attnum
+        WHERE n.nspname = %s
+        GROUP BY c.relname, i.relname, ix.indisunique
+        ORDER BY c.relname, i.relname;
+    """, (esquema,))
+    for tabela, indice, unico, colunas in cursor.fetchall():
+        if tabela in estatisticas:
+            estatisticas[tabela]["indices"].append({"nome": indice, "colunas": list(colunas), "unico": unico})
+
+    cursor.execute("""
+        SELECT tablename, attname, n_distinct, null_frac,
+               array_to_json(most_common_vals::text::text[]), array_to_json(most_common_freqs)
+        FROM pg_stats
+        WHERE schemaname = %s;
+    """, (esquema,))
+    for tabela, coluna, n_distinct, null_frac, valores, frequencias in cursor.fetchall():
+        info = estatisticas.get(tabela)
+        if info is None:
+            continue
+        indexada = any(coluna in indice["colunas"] for indice in info["indices"])
+        baixa_cardinalidade = n_distinct is not None and 0 < n_distinct <= LIMITE_BAIXA_CARDINALIDADE
+        if not (indexada or baixa_cardinalidade):
+            continue
+        estatistica = {"n_distinct": n_distinct, "null_frac": round(null_frac or 0.0, 4)}
+        if baixa_cardinalidade and valores:
+            estatistica["valores_comuns"] = valores
+            estatistica["frequencias"] = [round(f, 4) for f in (frequencias or [])]
+        info["colunas"][coluna] = estatistica
+
+    return estatisticas
+
+def extrair_estatisticas_sqlite(conexao) -> Dict[str, Dict]:
+    """Extrai contagem de linhas e índices do SQLite (sem estatísticas de coluna)"""
+    cursor = conexao.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tabelas = [nome for (nome,) in cursor.fetchall()]
+
+    estatisticas = {}
+    for tabela in tabelas:
+        cursor.execute(f'SELECT COUNT(*) FROM "{tabela}";')
+        (linhas,) = cursor.fetchone()
+        indices = []
+        cursor.execute(f"PRAGMA index_list({tabela});")
+        for _, indice, unico, *_ in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_info({indice});")
+            colunas = [nome for _, _, nome in sorted(cursor.fetchall())]
+            indices.append({"nome": indice, "colunas": colunas, "unico": bool(unico)})
+        estatisticas[tabela] = {"linhas": linhas, "tamanho_bytes": None, "indices": indices, "colunas": {}}
+
+    return estatisticas
+
+def extrair_schema(conexao, tipo_banco="postgres", esquema="public"):
     """Extrai schema baseado no tipo de banco"""
     if tipo_banco == "postgres":
-        dados = extrair_schema_postgres(conexao)
+        dados = extrair_schema_postgres(conexao, esquema)
+        fks = extrair_fks_postgres(conexao, esquema)
+        estatisticas = extrair_estatisticas_postgres(conexao, esquema)
     elif tipo_banco == "sqlite":
         dados = extrair_schema_sqlite(conexao)
+        fks = extrair_fks_sqlite(conexao)
+        estatisticas = extrair_estatisticas_sqlite(conexao)
     else:
         raise ValueError(f"Tipo de banco não suportado para extração: {tipo_banco}")
     
@@ -151,14 +299,140 @@ def extrair_schema(conexao, tipo_banco="postgres"):
             "primary_key": is_primary_key
         })
     
+    for tabela, nome, tabela_ref, colunas, colunas_ref in fks:
+        if tabela in schema:
+            schema[tabela].setdefault("fks", []).append({
+                "nome": nome,
+                "colunas": colunas,
+                "tabela_ref": tabela_ref,
+                "colunas_ref": colunas_ref
+            })
+    
+    for tabela, estatistica in estatisticas.items():
+        if tabela in schema:
+            schema[tabela]["estatisticas"] = estatistica
+    
     return schema
 
-def salvar_schema(slug, schema):
+def salvar_schema(slug, schema, inalteradas: Optional[Iterable[str]] = None,
+                  versao_anterior: Optional[str] = None) -> str:
+    """
+    Grava o schema (JSON e compacto) de forma atômica e retorna sua versão
+
+    Com inalteradas, o compacto reaproveita os blocos dessas tabelas do arquivo
+    anterior (se ele for da versao_anterior) e só serializa as demais. O JSON é
+    sempre regravado inteiro: é a fonte da versão e do próximo versionamento.
+    """
     os.makedirs(SCHEMA_DIR, exist_ok=True)
     caminho = os.path.join(SCHEMA_DIR, f"{slug}.json")
-    with open(caminho, "w", encoding="utf-8") as f:
-        json.dump(schema, f, indent=2, ensure_ascii=False)
-    print(f"✅ Schema salvo em {caminho}")
+    conteudo = json.dumps(schema, indent=2, ensure_ascii=False).encode("utf-8")
+    hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+
+    # Versão compacta primeiro: o schema_loader só a prefere se não for mais antiga que o JSON.
+    # Leva o índice de relevância pronto para os workers do modo compartilhado.
+    caminho_compacto = os.path.join(SCHEMA_DIR, f"{slug}{EXTENSAO}")
+    if inalteradas is None:
+        salvar_schema_compacto(schema, caminho_compacto, hash_conteudo, secoes_compartilhadas(schema))
+    else:
+        reaproveitadas = atualizar_schema_compacto(
+            schema, caminho_compacto, inalteradas, hash_conteudo, versao_anterior, secoes_compartilhadas(schema)
+        )
+        print(f"♻️ {slug}: {reaproveitadas} tabelas reaproveitadas do schema compacto anterior")
+
+    temporario = f"{caminho}.tmp{os.getpid()}"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+    # Mantém o compacto com o mesmo mtime do JSON para que continue sendo o preferido
+    stat_json = os.stat(caminho)
+    os.utime(caminho_compacto, ns=(stat_json.st_atime_ns, stat_json.st_mtime_ns))
+
+    print(f"✅ Schema salvo em {caminho} (+ {caminho_compacto})")
+    return hash_conteudo[:12]
+
+# Campos que definem a estrutura de uma tabela (entram no fingerprint).
+# 'estatisticas' fica de fora: muda a cada geração sem alterar a estrutura.
+CAMPOS_DEFINICAO = ("colunas", "descricao", "fks")
+
+def fingerprint_tabela(info: Dict) -> str:
+    """Hash da definição de uma tabela, independente de versão e estatísticas"""
+    definicao = {campo: info.get(campo) for campo in CAMPOS_DEFINICAO}
+    conteudo = json.dumps(definicao, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()[:16]
+
+def carregar_schema_anterior(slug) -> Optional[Dict]:
+    """Lê o schema JSON gerado anteriormente para o slug, se existir"""
+    caminho = os.path.join(SCHEMA_DIR, f"{slug}.json")
+    if not os.path.exists(caminho):
+        return None
+    try:
+        with open(caminho, "rb") as f:
+            conteudo = f.read()
+        schema = json.loads(conteudo.decode("utf-8"))
+        schema["_versao_arquivo"] = hashlib.sha256(conteudo).hexdigest()[:12]
+        return schema
+    except Exception as e:
+        print(f"⚠️ Schema anterior ilegível ({caminho}): {e}")
+        return None
+
+def versionar_tabelas(schema: Dict, anterior: Optional[Dict]) -> Dict:
+    """
+    Compara o schema extraído com o anterior tabela a tabela
+
+    Cada tabela recebe 'fingerprint' e 'versao'. Tabelas inalteradas mantêm a
+    versão anterior; alteradas têm a versão incrementada; novas começam em 1.
+
+    Estatísticas não mudam a versão, mas tabelas cujo resumo de estatísticas
+    (o que aparece no prompt) mudou são listadas em 'estatisticas_alteradas'.
+
+    Returns:
+        Manifesto com as tabelas adicionadas, removidas e alteradas
+    """
+    anterior = anterior or {}
+    adicionadas, alteradas, estatisticas_alteradas = [], [], []
+
+    for tabela, info in schema.items():
+        if tabela.startswith('_'):
+            continue
+        fingerprint = fingerprint_tabela(info)
+        info_anterior = anterior.get(tabela)
+        if info_anterior is None:
+            info["versao"] = 1
+            adicionadas.append(tabela)
+        elif info_anterior.get("fingerprint") == fingerprint:
+            info["versao"] = info_anterior.get("versao", 1)
+        else:
+            info["versao"] = info_anterior.get("versao", 0) + 1
+            alteradas.append(tabela)
+        info["fingerprint"] = fingerprint
+        if info_anterior is not None and resumo_estatisticas(info) != resumo_estatisticas(info_anterior):
+            estatisticas_alteradas.append(tabela)
+
+    removidas = [t for t in anterior if not t.startswith('_') and t not in schema]
+
+    return {
+        "versao_anterior": anterior.get("_versao_arquivo"),
+        "adicionadas": sorted(adicionadas),
+        "removidas": sorted(removidas),
+        "alteradas": sorted(alteradas),
+        "estatisticas_alteradas": sorted(estatisticas_alteradas),
+        "metadados_alterados": anterior.get("_metadados") != schema.get("_metadados"),
+    }
+
+def houve_alteracao(manifesto: Dict) -> bool:
+    return bool(
+        manifesto["adicionadas"] or manifesto["removidas"]
+        or manifesto["alteradas"] or manifesto["estatisticas_alteradas"]
+        or manifesto["metadados_alterados"]
+    )
+
+def salvar_manifesto(slug, manifesto: Dict):
+    """Grava schemas/<slug>.manifest.json, usado para invalidação seletiva de caches"""
+    caminho = os.path.join(SCHEMA_DIR, f"{slug}.manifest.json")
+    temporario = f"{caminho}.tmp{os.getpid()}"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2, ensure_ascii=False)
+    os.replace(temporario, caminho)
 
 # Dicionário de campos chave por contexto
 CAMPOS_CHAVE = {
@@ -189,10 +463,50 @@ CAMPOS_CHAVE = {
     }
 }
 
+# Relacionamentos lógicos (sem FK no banco) usados pelo grafo de joins
+RELACIONAMENTOS_LOGICOS = [
+    {
+        "nome": "cliente do pedido",
+        "tabela": "pedidosvenda", "colunas": ["pedi_empr", "pedi_forn"],
+        "tabela_ref": "entidades", "colunas_ref": ["enti_empr", "enti_clie"]
+    },
+    {
+        "nome": "vendedor do pedido",
+        "tabela": "pedidosvenda", "colunas": ["pedi_empr", "pedi_vend"],
+        "tabela_ref": "entidades", "colunas_ref": ["enti_empr", "enti_clie"]
+    },
+    {
+        "nome": "itens do pedido",
+        "tabela": "itenspedidovenda", "colunas": ["iped_empr", "iped_fili", "iped_pedi"],
+        "tabela_ref": "pedidosvenda", "colunas_ref": ["pedi_empr", "pedi_fili", "pedi_nume"]
+    },
+    {
+        "nome": "produto do item",
+        "tabela": "itenspedidovenda", "colunas": ["iped_empr", "iped_prod"],
+        "tabela_ref": "produtos", "colunas_ref": ["prod_empr", "prod_codi"]
+    },
+    {
+        "nome": "saldo do produto",
+        "tabela": "saldosprodutos", "colunas": ["sapr_empr", "sapr_prod"],
+        "tabela_ref": "produtos", "colunas_ref": ["prod_empr", "prod_codi"]
+    },
+    {
+        "nome": "fornecedor do título",
+        "tabela": "titulospagar", "colunas": ["titu_empr", "titu_forn"],
+        "tabela_ref": "entidades", "colunas_ref": ["enti_empr", "enti_clie"]
+    },
+    {
+        "nome": "cliente do título",
+        "tabela": "titulosreceber", "colunas": ["titu_empr", "titu_clie"],
+        "tabela_ref": "entidades", "colunas_ref": ["enti_empr", "enti_clie"]
+    }
+]
+
 def adicionar_metadados_schema(schema_dict):
     """Adiciona metadados sobre campos chave ao schema"""
     schema_dict["_metadados"] = {
         "campos_chave": CAMPOS_CHAVE,
+        "relacionamentos": RELACIONAMENTOS_LOGICOS,
         "descricao": "Metadados para facilitar consultas do agente",
         "exemplos_consultas": {
             "clientes": [
@@ -228,9 +542,18 @@ def adicionar_metadados_schema(schema_dict):
     }
     return schema_dict
 
-def gerar_schema(slug):
-    """Gera o schema para um banco específico"""
+def gerar_schema(slug, incremental=False):
+    """
+    Gera o schema para um banco específico
+
+    Args:
+        slug: Identificador do banco em DATABASES
+        incremental: Se True, não regrava os arquivos quando nenhuma tabela
+            mudou em relação ao schema anterior e, quando mudou, reaproveita no
+            schema compacto os blocos das tabelas inalteradas
+    """
     print(f"🔄 Gerando schema para: {slug}")
+    inicio = time.perf_counter()
     
     try:
         # Conectar ao banco - CORRIGIDO
@@ -243,23 +566,75 @@ def gerar_schema(slug):
         if not conn:
             return None
         
-        # Extrair schema
-        schema = extrair_schema(conn, config.get("tipo", "postgres"))
+        try:
+            # Extrair schema
+            schema = extrair_schema(conn, config.get("tipo", "postgres"), config.get("schema", "public"))
+        finally:
+            conn.close()
         
         # Adicionar metadados
         schema = adicionar_metadados_schema(schema)
         
-        # Salvar schema
-        salvar_schema(slug, schema)
+        # Versionar tabelas em relação ao schema anterior
+        anterior = carregar_schema_anterior(slug)
+        manifesto = versionar_tabelas(schema, anterior)
+        print(
+            f"🧮 {slug}: {len(manifesto['adicionadas'])} adicionadas, "
+            f"{len(manifesto['removidas'])} removidas, {len(manifesto['alteradas'])} alteradas"
+        )
+        
+        if incremental and manifesto["versao_anterior"] and not houve_alteracao(manifesto):
+            print(f"✅ Schema sem alterações: {slug} (arquivos mantidos)")
+            return schema
+        
+        # Salvar schema e manifesto de mudanças; no modo incremental o compacto só
+        # serializa de novo as tabelas com definição ou estatísticas diferentes
+        inalteradas = None
+        if incremental and anterior:
+            inalteradas = [t for t, info in schema.items() if not t.startswith('_') and anterior.get(t) == info]
+        manifesto["versao_atual"] = salvar_schema(slug, schema, inalteradas, manifesto["versao_anterior"])
+        manifesto["slug"] = slug
+        manifesto["gerado_em"] = datetime.now().isoformat()
+        salvar_manifesto(slug, manifesto)
         
-        conn.close()
-        print(f"✅ Schema gerado com sucesso: {slug}")
+        print(f"✅ Schema gerado com sucesso: {slug} ({time.perf_counter() - inicio:.2f}s)")
         return schema  # Retornar o schema em vez de True
         
     except Exception as e:
-        print(f"❌ Erro ao gerar schema: {e}")
+        print(f"❌ Erro ao gerar schema ({slug}): {e}")
         return None
 
+def gerar_schemas(slugs: Optional[Iterable[str]] = None, max_workers: int = SCHEMA_WORKERS,
+                  incremental: bool = False) -> Dict[str, Optional[Dict]]:
+    """
+    Gera os schemas de vários bancos em paralelo
+
+    Args:
+        slugs: Slugs a gerar (padrão: todos de DATABASES)
+        max_workers: Quantidade de bancos extraídos simultaneamente
+        incremental: Repassado para gerar_schema
+
+    Returns:
+        Dict slug → schema gerado (None para os que falharam)
+    """
+    slugs = list(slugs) if slugs else list(DATABASES.keys())
+    if not slugs:
+        return {}
+    
+    inicio = time.perf_counter()
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(slugs)))) as executor:
+        futuros = {executor.submit(gerar_schema, slug, incremental): slug for slug in slugs}
+        for futuro in as_completed(futuros):
+            resultados[futuros[futuro]] = futuro.result()
+    
+    sucesso = [slug for slug, schema in resultados.items() if schema]
+    falhas = [slug for slug, schema in resultados.items() if not schema]
+    print(f"📦 {len(sucesso)}/{len(slugs)} schemas gerados em {time.perf_counter() - inicio:.2f}s")
+    if falhas:
+        print(f"⚠️ Falharam: {', '.join(falhas)}")
+    return resultados
+
 def criar_banco_exemplo_sqlite():
     """Cria um banco SQLite de exemplo para testar"""
     print("🛠️ Criando banco SQLite de exemplo...")
@@ -367,5 +742,15 @@ def testar_sistema_completo():
     return schema
 
 if __name__ == "__main__":
-    # Testar sistema completo
-    testar_sistema_completo()
+    import sys
+    
+    # Uso: python gerar_schema.py [--incremental] [--todos | slug ...]
+    incremental = "--incremental" in sys.argv[1:]
+    slugs = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if "--todos" in sys.argv[1:]:
+        gerar_schemas(incremental=incremental)
+    elif slugs:
+        gerar_schemas(slugs, incremental=incremental)
+    else:
+        # Testar sistema completo
+        testar_sistema_completo()
@@ -0,0 +1,81 @@
+"""
+Servidor MCP local de gráficos
+
+Mesmas ferramentas da whitelist do agente (generate_bar_chart, generate_pie_chart,
+generate_line_chart, generate_column_chart), mas sem rede: cada ferramenta
+devolve a especificação do gráfico (formato Chart.js) em JSON.
+
+Dois modos de uso:
+    MCP_SERVIDORES=local       ferramentas no próprio processo (sem protocolo MCP)
+    MCP_SERVIDORES=local_http  este arquivo rodando como servidor MCP:
+                               python graficos_locais.py [porta]
+"""
+
+import json
+import sys
+from typing import Dict, List, Optional
+
+TIPOS_GRAFICO = {
+    'generate_bar_chart': ('bar', 'Gera um gráfico de barras horizontais a partir de pares categoria/valor.'),
+    'generate_column_chart': ('bar', 'Gera um gráfico de colunas a partir de pares categoria/valor.'),
+    'generate_line_chart': ('line', 'Gera um gráfico de linhas a partir de pares categoria/valor.'),
+    'generate_pie_chart': ('pie', 'Gera um gráfico de pizza a partir de pares categoria/valor.'),
+}
+
+def montar_grafico(ferramenta: str, data: List[Dict], title: str = "",
+                   axisXTitle: str = "", axisYTitle: str = "") -> str:
+    """Especificação Chart.js do gráfico, em JSON"""
+    tipo, _ = TIPOS_GRAFICO[ferramenta]
+    categorias = [str(ponto.get('category', ponto.get('time', ''))) for ponto in data]
+    valores = [ponto.get('value', 0) for ponto in data]
+    especificacao = {
+        'type': tipo,
+        'data': {'labels': categorias, 'datasets': [{'label': title or 'valor', 'data': valores}]},
+        'options': {
+            'indexAxis': 'y' if ferramenta == 'generate_bar_chart' else 'x',
+            'plugins': {'title': {'display': bool(title), 'text': title}},
+            'scales': {} if tipo == 'pie' else {
+                'x': {'title': {'display': bool(axisXTitle), 'text': axisXTitle}},
+                'y': {'title': {'display': bool(axisYTitle), 'text': axisYTitle}},
+            },
+        },
+    }
+    return json.dumps(especificacao, ensure_ascii=False, default=str)
+
+def _criar_funcao(ferramenta: str):
+    def gerar(data: List[Dict], title: str = "", axisXTitle: str = "", axisYTitle: str = "") -> str:
+        return montar_grafico(ferramenta, data, title, axisXTitle, axisYTitle)
+    gerar.__name__ = ferramenta
+    gerar.__doc__ = TIPOS_GRAFICO[ferramenta][1]
+    return gerar
+
+def obter_ferramentas_locais() -> List:
+    """Ferramentas de gráfico como StructuredTool, para uso no próprio processo"""
+    from langchain_core.tools import StructuredTool
+
+    ferramentas = []
+    for nome, (_, descricao) in TIPOS_GRAFICO.items():
+        funcao = _criar_funcao(nome)
+
+        async def corrotina(data: List[Dict], title: str = "", axisXTitle: str = "",
+                            axisYTitle: str = "", _funcao=funcao) -> str:
+            return _funcao(data, title, axisXTitle, axisYTitle)
+
+        ferramentas.append(StructuredTool.from_function(
+            func=funcao, coroutine=corrotina, name=nome, description=descricao
+        ))
+    return ferramentas
+
+def criar_servidor_mcp(porta: Optional[int] = None):
+    """Servidor MCP (FastMCP) com as mesmas ferramentas"""
+    from mcp.server.fastmcp import FastMCP
+
+    servidor = FastMCP("graficos_locais", port=porta or 8765)
+    for nome, (_, descricao) in TIPOS_GRAFICO.items():
+        servidor.add_tool(_criar_funcao(nome), name=nome, description=descricao)
+    return servidor
+
+if __name__ == "__main__":
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    print(f"📊 Servidor MCP de gráficos local em http://localhost:{porta}/mcp")
+    criar_servidor_mcp(porta).run(transport="streamable-http")
@@ -0,0 +1,216 @@
+"""
+Grafo de joins entre tabelas
+
+Monta, por slug, um grafo com as chaves estrangeiras extraídas pelo
+gerar_schema ('fks' de cada tabela) e os relacionamentos lógicos declarados
+em _metadados.relacionamentos. Os caminhos mais curtos a partir de cada
+tabela são calculados uma vez (BFS) e reaproveitados para injetar no prompt
+as cláusulas de JOIN exatas entre as tabelas selecionadas.
+
+Quem publica o schema compacto grava os relacionamentos já validados como
+seção do arquivo; os workers montam o grafo sem ler as tabelas.
+"""
+
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from schema_compacto import ler_tabela_avulsa, percorrer_tabelas
+from schema_loader import carregar_schema, obter_versao_schema
+
+# Caminhos maiores que isso raramente são o join que a pergunta quer
+MAX_SALTOS = 3
+
+# Incrementar quando o formato da seção mudar: seções antigas são ignoradas
+VERSAO_RELACIONAMENTOS = 1
+
+class Aresta:
+    """Ligação entre duas tabelas por uma lista de pares de colunas"""
+    __slots__ = ('origem', 'destino', 'colunas', 'colunas_destino', 'nome')
+
+    def __init__(self, origem: str, destino: str, colunas: List[str], colunas_destino: List[str], nome: str = ""):
+        self.origem = origem
+        self.destino = destino
+        self.colunas = colunas
+        self.colunas_destino = colunas_destino
+        self.nome = nome
+
+    def invertida(self) -> 'Aresta':
+        return Aresta(self.destino, self.origem, self.colunas_destino, self.colunas, self.nome)
+
+    def condicao(self) -> str:
+        return " AND ".join(
+            f"{self.origem}.{col} = {self.destino}.{col_destino}"
+            for col, col_destino in zip(self.colunas, self.colunas_destino)
+        )
+
+    def clausula(self) -> str:
+        sufixo = f"  -- {self.nome}" if self.nome else ""
+        return f"JOIN {self.destino} ON {self.condicao()}{sufixo}"
+
+def extrair_relacionamentos(schema: Dict) -> List[Dict]:
+    """
+    FKs de cada tabela e relacionamentos de _metadados cujas colunas existem no schema
+
+    Só as tabelas citadas num relacionamento têm as colunas conferidas; num
+    SchemaCompacto nenhuma tabela fica retida.
+    """
+    relacionamentos = []
+    colunas_por_tabela: Dict[str, set] = {}
+    for tabela, info in percorrer_tabelas(schema):
+        fks = info.get('fks') or []
+        if fks:
+            colunas_por_tabela[tabela] = {col['nome'] for col in info.get('colunas', [])}
+        relacionamentos.extend(dict(fk, tabela=tabela) for fk in fks)
+    relacionamentos.extend(schema.get('_metadados', {}).get('relacionamentos', []))
+
+    def colunas_de(tabela: str) -> set:
+        if tabela not in colunas_por_tabela:
+            info = ler_tabela_avulsa(schema, tabela)
+            colunas_por_tabela[tabela] = {col['nome'] for col in info.get('colunas', [])} if info else set()
+        return colunas_por_tabela[tabela]
+
+    # Relacionamentos declarados podem citar tabelas/colunas que este banco não tem
+    return [
+        {
+            'nome': rel.get('nome', ''),
+            'tabela': rel['tabela'], 'colunas': list(rel['colunas']),
+            'tabela_ref': rel['tabela_ref'], 'colunas_ref': list(rel['colunas_ref']),
+        }
+        for rel in relacionamentos
+        if set(rel['colunas']) <= colunas_de(rel['tabela']) and set(rel['colunas_ref']) <= colunas_de(rel['tabela_ref'])
+    ]
+
+def secao_relacionamentos(schema: Dict) -> Dict:
+    """Seção do schema compacto com os relacionamentos já validados"""
+    return {'versao': VERSAO_RELACIONAMENTOS, 'relacionamentos': extrair_relacionamentos(schema)}
+
+class GrafoJoins:
+    """Grafo não direcionado de relacionamentos com caminhos mínimos memoizados"""
+
+    def __init__(self, schema: Dict):
+        self.vizinhos: Dict[str, List[Aresta]] = {}
+        self._arvores: Dict[str, Dict[str, Optional[Aresta]]] = {}
+        self._lock = threading.Lock()
+
+        secao = schema.secao('relacionamentos') if hasattr(schema, 'secao') else None
+        if secao and secao.get('versao') == VERSAO_RELACIONAMENTOS:
+            relacionamentos = secao['relacionamentos']
+        else:
+            relacionamentos = extrair_relacionamentos(schema)
+
+        for rel in relacionamentos:
+            origem, destino = rel['tabela'], rel['tabela_ref']
+            aresta = Aresta(origem, destino, list(rel['colunas']), list(rel['colunas_ref']), rel.get('nome', ''))
+            self.vizinhos.setdefault(origem, []).append(aresta)
+            self.vizinhos.setdefault(destino, []).append(aresta.invertida())
+
+    @property
+    def total_arestas(self) -> int:
+        return sum(len(arestas) for arestas in self.vizinhos.values()) // 2
+
+    def _arvore(self, origem: str) -> Dict[str, Optional[Aresta]]:
+        """Árvore de caminhos mínimos (BFS) a partir de origem: tabela → aresta de chegada"""
+        arvore = self._arvores.get(origem)
+        if arvore is not None:
+            return arvore
+
+        arvore = {origem: None}
+        fila = deque([origem])
+        while fila:
+            atual = fila.popleft()
+            for aresta in self.vizinhos.get(atual, []):
+                if aresta.destino not in arvore:
+                    arvore[aresta.destino] = aresta
+                    fila.append(aresta.destino)
+
+        with self._lock:
+            self._arvores[origem] = arvore
+        return arvore
+
+    def precomputar(self, tabelas: Optional[List[str]] = None):
+        """Calcula antecipadamente as árvores de caminhos (padrão: todas as tabelas com relacionamento)"""
+        for tabela in tabelas or list(self.vizinhos):
+            self._arvore(tabela)
+
+    def caminho(self, origem: str, destino: str) -> Optional[List[Aresta]]:
+        """Menor sequência de joins de origem até destino (None se não há ligação)"""
+        arvore = self._arvore(origem)
+        if destino not in arvore:
+            return None
+        arestas = []
+        atual = destino
+        while arvore[atual] is not None:
+            aresta = arvore[atual]
+            arestas.append(aresta)
+            atual = aresta.origem
+        return list(reversed(arestas))
+
+    def escolher_raiz(self, tabelas: List[str]) -> Optional[str]:
+        """Tabela selecionada que alcança mais das outras (empate: a mais relevante)"""
+        candidatas = [t for t in tabelas if t in self.vizinhos]
+        if not candidatas:
+            return None
+        return max(candidatas, key=lambda t: (sum(1 for o in tabelas if o in self._arvore(t)), -tabelas.index(t)))
+
+    def clausulas_join(self, tabelas: List[str], max_saltos: int = MAX_SALTOS) -> List[str]:
+        """
+        Cláusulas JOIN que ligam as tabelas selecionadas
+
+        Une os caminhos mínimos a partir da raiz escolhida, incluindo tabelas
+        intermediárias; caminhos com mais de max_saltos joins são ignorados.
+        """
+        raiz = self.escolher_raiz(tabelas)
+        if raiz is None:
+            return []
+        clausulas = []
+        ligadas = {raiz}
+        for tabela in tabelas:
+            if tabela in ligadas:
+                continue
+            caminho = self.caminho(raiz, tabela)
+            if not caminho or len(caminho) > max_saltos:
+                continue
+            for aresta in caminho:
+                if aresta.destino not in ligadas:
+                    ligadas.add(aresta.destino)
+                    clausulas.append(aresta.clausula())
+        return clausulas
+
+_grafos: Dict[str, Dict] = {}
+_lock_grafos = threading.Lock()
+
+def obter_grafo(slug: str) -> Optional[GrafoJoins]:
+    """Retorna o grafo de joins do slug, reconstruindo-o quando a versão do schema muda"""
+    versao = obter_versao_schema(slug)
+    if versao is None:
+        return None
+
+    entrada = _grafos.get(slug)
+    if entrada and entrada['versao'] == versao:
+        return entrada['grafo']
+
+    with _lock_grafos:
+        entrada = _grafos.get(slug)
+        if entrada and entrada['versao'] == versao:
+            return entrada['grafo']
+
+        grafo = GrafoJoins(carregar_schema(slug))
+        grafo.precomputar()
+        _grafos[slug] = {'versao': versao, 'grafo': grafo}
+        print(f"🔗 Grafo de joins criado: {slug} ({grafo.total_arestas} relacionamentos)")
+        return grafo
+
+def montar_dicas_join(slug: str, tabelas: Optional[List[str]]) -> str:
+    """Bloco de prompt com os JOINs exatos entre as tabelas selecionadas"""
+    if not tabelas:
+        return ""
+    grafo = obter_grafo(slug)
+    if grafo is None:
+        return ""
+    clausulas = grafo.clausulas_join(tabelas)
+    if not clausulas:
+        return ""
+    linhas = [f"\n\n🔗 JOINS EXATOS (a partir de FROM {grafo.escolher_raiz(tabelas)}):"]
+    linhas.extend(f"   {clausula}" for clausula in clausulas)
+    return "\n".join(linhas)
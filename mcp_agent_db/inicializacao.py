@@ -0,0 +1,131 @@
+"""
+Inicialização do serviço: configuração sob demanda e aquecimento
+
+Importar os módulos não abre conexão nem cria o modelo ou o agente: cada
+componente é iniciado no primeiro uso. Na subida da API (main.py) o
+aquecimento inicia tudo antes de aceitar tráfego, para que a primeira
+pergunta não pague a inicialização:
+
+    AQUECER_NA_INICIALIZACAO  1 (padrão) aquece na subida; 0 deixa tudo sob demanda
+    AQUECER_SLUGS             slugs cujos schemas, chains e pools de conexão são
+                              abertos (padrão casaa)
+
+O relatório de cada etapa (tempo, status, erro) fica em /api/inicializacao e a
+prontidão em /api/pronto.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+AQUECER_NA_INICIALIZACAO = os.getenv("AQUECER_NA_INICIALIZACAO", "1") == "1"
+AQUECER_SLUGS = [slug.strip() for slug in os.getenv("AQUECER_SLUGS", "casaa").split(",") if slug.strip()]
+
+class RelatorioInicializacao:
+    """Tempo e resultado de cada etapa da subida"""
+
+    def __init__(self):
+        self.etapas: Dict[str, Dict] = {}
+        self.tempo_importacao_s: Optional[float] = None
+        self.tempo_aquecimento_s: Optional[float] = None
+        self.aquecimento = 'pendente' if AQUECER_NA_INICIALIZACAO else 'desativado'
+        self._lock = threading.Lock()
+
+    def registrar_importacao(self, inicio: float):
+        self.tempo_importacao_s = round(time.perf_counter() - inicio, 3)
+        print(f"📦 Módulos importados em {self.tempo_importacao_s:.2f}s")
+
+    async def executar_etapa(self, nome: str, funcao: Callable[[], Awaitable[Any]]):
+        """Executa uma etapa, registrando tempo e erro sem interromper as seguintes"""
+        inicio = time.perf_counter()
+        try:
+            detalhe = await funcao()
+            status, erro = 'ok', None
+        except Exception as e:
+            detalhe, status, erro = None, 'erro', str(e)
+        tempo = round(time.perf_counter() - inicio, 3)
+        with self._lock:
+            self.etapas[nome] = {'status': status, 'tempo_s': tempo, 'detalhe': detalhe, 'erro': erro}
+        if erro:
+            print(f"❌ Aquecimento {nome}: {erro} ({tempo:.2f}s)")
+        else:
+            print(f"🔥 Aquecimento {nome}: ok ({tempo:.2f}s)")
+
+    @property
+    def pronto(self) -> bool:
+        """Sem aquecimento o serviço está pronto (tudo sob demanda); com ele, quando todas as etapas passaram"""
+        if self.aquecimento == 'desativado':
+            return True
+        with self._lock:
+            return self.aquecimento == 'concluido' and all(e['status'] == 'ok' for e in self.etapas.values())
+
+    def get_stats(self) -> Dict:
+        pronto = self.pronto
+        with self._lock:
+            return {
+                'pronto': pronto,
+                'aquecimento': self.aquecimento,
+                'slugs': AQUECER_SLUGS,
+                'tempo_importacao_s': self.tempo_importacao_s,
+                'tempo_aquecimento_s': self.tempo_aquecimento_s,
+                'etapas': {nome: dict(etapa) for nome, etapa in self.etapas.items()},
+            }
+
+# Instância global do relatório de inicialização
+relatorio_inicializacao = RelatorioInicializacao()
+
+async def _aquecer_modelo() -> str:
+    from provedor_modelo import obter_modelo
+
+    modelo = await asyncio.to_thread(obter_modelo)
+    return type(modelo).__name__
+
+async def _aquecer_schemas(slugs: List[str]) -> Dict:
+    from schema_index import obter_indice
+    from schema_loader import carregar_schema
+    from sql_generator import registro_chains
+
+    def carregar():
+        tabelas = {}
+        for slug in slugs:
+            schema = carregar_schema(slug)
+            if not schema:
+                raise RuntimeError(f"schema não encontrado para o slug {slug}")
+            obter_indice(slug)
+            registro_chains.obter(slug)
+            tabelas[slug] = len(schema)
+        return tabelas
+
+    return await asyncio.to_thread(carregar)
+
+async def _aquecer_banco(slugs: List[str]) -> Dict[str, int]:
+    from executores import aquecer_banco
+
+    return await aquecer_banco(slugs)
+
+async def _aquecer_agente() -> Optional[str]:
+    import agente_inteligente_v2
+
+    if not await agente_inteligente_v2.garantir_agente_async():
+        raise RuntimeError("não foi possível inicializar o agente")
+    return agente_inteligente_v2.modo_agente
+
+async def aquecer(slugs: Optional[List[str]] = None):
+    """Inicia modelo, schemas, pools de conexão dos slugs e agente (com as ferramentas MCP)"""
+    slugs = slugs or AQUECER_SLUGS
+    relatorio = relatorio_inicializacao
+    relatorio.aquecimento = 'em_andamento'
+    inicio = time.perf_counter()
+    print(f"🔥 Aquecendo o serviço ({', '.join(slugs)})...")
+
+    await relatorio.executar_etapa('modelo', _aquecer_modelo)
+    await relatorio.executar_etapa('schemas', lambda: _aquecer_schemas(slugs))
+    await relatorio.executar_etapa('banco', lambda: _aquecer_banco(slugs))
+    await relatorio.executar_etapa('agente', _aquecer_agente)
+
+    relatorio.tempo_aquecimento_s = round(time.perf_counter() - inicio, 3)
+    relatorio.aquecimento = 'concluido'
+    situacao = "pronto" if relatorio.pronto else "com falhas (ver /api/inicializacao)"
+    print(f"✅ Aquecimento concluído em {relatorio.tempo_aquecimento_s:.2f}s: {situacao}")
@@ -0,0 +1,217 @@
+"""
+Catálogo de intenções: perguntas conhecidas com SQL validado
+
+Relatórios fixos (estoque baixo, contas a pagar da semana, sugestão de compras)
+e perguntas frequentes (entidades por tipo, pedidos por cliente) não precisam
+do LLM. Cada intenção declara os padrões que a reconhecem, os parâmetros que
+podem ser lidos da pergunta (com padrão e limites) e o SQL revisado, com
+variações por slug quando o banco do cliente for diferente.
+
+O catálogo é consultado antes da geração: uma pergunta reconhecida vai direto
+para o banco. Intenções cujas tabelas não existem no schema do slug são
+ignoradas e a pergunta segue o caminho normal.
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional
+
+from cache_manager import normalizar_pergunta
+from schema_loader import carregar_schema, obter_versao_schema
+
+# Início opcional de pedido ("quais são as", "liste os", "mostre") antes do objeto da pergunta
+PEDIDO = r"^(?:(?:quais (?:sao )?|quantas |liste |listar |mostre |mostrar |ver )?(?:as |os )?)"
+
+# Próximos dias ou semana corrente (vencidas e semana passada ficam para o gerador)
+PERIODO_FUTURO = r"(?:(?:[dn]?esta|[dn]?essa|da|na) semana|(?:n|d)os proximos (?:\d+ )?dias|(?:em|ate) \d+ dias)"
+
+# Ordem importa: a primeira intenção reconhecida vence, então as mais
+# específicas vêm antes (sugestão de compras também fala em "estoque baixo")
+CATALOGO_INTENCOES: List[Dict] = [
+    {
+        'nome': 'sugestao_compras_estoque',
+        'descricao': 'Produtos com muita venda recente e estoque menor que o vendido no período',
+        'padroes': [
+            PEDIDO + r"sugest(?:ao|oes) de compras?(?: (?:dos|nos) ultimos \d+ dias)?$",
+            PEDIDO + r"produtos (?:mais )?vendidos (?:(?:dos|nos) ultimos \d+ dias )?"
+                     r"(?:(?:com )?mais de \d+ unidades )?(?:e )?com estoque baixo$",
+        ],
+        'parametros': {
+            'quantidade': {'regex': r"mais de (\d+) unidades", 'padrao': 10, 'minimo': 0, 'maximo': 1000000},
+            'dias': {'regex': r"ultimos (\d+) dias", 'padrao': 30, 'minimo': 1, 'maximo': 366},
+        },
+        'tabelas': ['itenspedidovenda', 'produtos', 'saldosprodutos'],
+        'sql': """SELECT p.prod_codi, p.prod_nome, SUM(i.iped_quan) AS quantidade_vendida, s.sapr_sald AS estoque_atual
+FROM itenspedidovenda i
+JOIN produtos p ON p.prod_empr = i.iped_empr AND p.prod_codi = i.iped_prod
+JOIN saldosprodutos s ON s.sapr_prod = i.iped_prod AND s.sapr_empr = i.iped_empr AND s.sapr_fili = i.iped_fili
+WHERE i.iped_data >= CURRENT_DATE - {dias}
+GROUP BY p.prod_codi, p.prod_nome, s.sapr_sald
+HAVING SUM(i.iped_quan) > {quantidade} AND s.sapr_sald < SUM(i.iped_quan)
+ORDER BY quantidade_vendida DESC
+LIMIT 100""",
+    },
+    {
+        'nome': 'estoque_baixo',
+        'descricao': 'Produtos com saldo abaixo de um mínimo fixo ou do estoque mínimo cadastrado',
+        'padroes': [
+            PEDIDO + r"(?:produtos |itens )?(?:com |de |cujo )?estoque (?:esta |estao )?"
+                     r"(?:baixo|abaixo do minimo|abaixo de \d+)$",
+            PEDIDO + r"(?:produtos|itens) abaixo do estoque minimo$",
+        ],
+        'parametros': {
+            'minimo': {'regex': r"abaixo de (\d+)", 'padrao': 2, 'minimo': 0, 'maximo': 1000000},
+        },
+        'tabelas': ['saldosprodutos', 'produtos'],
+        'sql': """SELECT p.prod_codi, p.prod_nome, s.sapr_empr, s.sapr_fili, s.sapr_sald, p.prod_mini
+FROM saldosprodutos s
+JOIN produtos p ON p.prod_empr = s.sapr_empr AND p.prod_codi = s.sapr_prod
+WHERE s.sapr_sald < {minimo} OR s.sapr_sald < p.prod_mini
+ORDER BY s.sapr_sald
+LIMIT 200""",
+    },
+    {
+        'nome': 'contas_a_pagar_periodo',
+        'descricao': 'Títulos a pagar em aberto que vencem nos próximos N dias',
+        'padroes': [
+            PEDIDO + r"(?:contas|titulos) a pagar (?:em aberto )?"
+                     r"(?:(?:que )?(?:vencem|vencendo|a vencer|com vencimento) )?" + PERIODO_FUTURO + "$",
+            PEDIDO + r"(?:contas|titulos) a pagar (?:em aberto )?(?:que )?(?:vencem|vencendo|a vencer)$",
+        ],
+        'parametros': {
+            'dias': {'regex': r"(\d+) dias", 'padrao': 7, 'minimo': 1, 'maximo': 366},
+        },
+        'tabelas': ['titulospagar', 'entidades'],
+        'sql': """SELECT t.titu_empr, t.titu_fili, t.titu_titu, t.titu_parc, e.enti_nome AS fornecedor, t.titu_venc, t.titu_valo
+FROM titulospagar t
+LEFT JOIN entidades e ON e.enti_empr = t.titu_empr AND e.enti_clie = t.titu_forn
+WHERE t.titu_aber = 'A'
+  AND t.titu_venc BETWEEN CURRENT_DATE AND CURRENT_DATE + {dias}
+ORDER BY t.titu_venc, t.titu_valo DESC""",
+    },
+    {
+        'nome': 'entidades_por_tipo',
+        'descricao': 'Quantidade de entidades por tipo (CL, FO, VE, AM)',
+        'padroes': [
+            PEDIDO + r"(?:quantidade de |total de |numero de |quantas )?entidades "
+                     r"(?:(?:existem|temos|ha|cadastradas) )?(?:por|de cada|em cada) tipo$",
+            PEDIDO + r"(?:quantidade de |total de )?(?:entidades por )?tipos? de entidades?$",
+        ],
+        'parametros': {},
+        'tabelas': ['entidades'],
+        'sql': """SELECT enti_tipo_enti, COUNT(*) AS quantidade
+FROM entidades
+GROUP BY enti_tipo_enti
+ORDER BY quantidade DESC""",
+    },
+    {
+        'nome': 'pedidos_por_cliente',
+        'descricao': 'Quantidade e valor de pedidos por entidade, sem filtrar o tipo da entidade',
+        'padroes': [
+            r"^(?:quantos |total de |quantidade de )?pedidos (?:por|de cada) cliente$",
+        ],
+        'parametros': {},
+        'tabelas': ['pedidosvenda', 'entidades'],
+        'sql': """SELECT e.enti_clie, e.enti_nome, e.enti_tipo_enti, COUNT(*) AS quantidade_pedidos, SUM(p.pedi_tota) AS valor_total
+FROM pedidosvenda p
+JOIN entidades e ON e.enti_empr = p.pedi_empr AND e.enti_clie = p.pedi_forn
+GROUP BY e.enti_clie, e.enti_nome, e.enti_tipo_enti
+ORDER BY quantidade_pedidos DESC
+LIMIT 100""",
+    },
+]
+
+class CatalogoIntencoes:
+    """Reconhece perguntas do catálogo e monta o SQL validado do slug"""
+
+    def __init__(self, intencoes: List[Dict]):
+        self.intencoes = []
+        for intencao in intencoes:
+            self.intencoes.append(dict(
+                intencao,
+                _padroes=[re.compile(p) for p in intencao['padroes']],
+                _parametros={
+                    nome: dict(definicao, _regex=re.compile(definicao['regex']))
+                    for nome, definicao in intencao.get('parametros', {}).items()
+                },
+            ))
+        self._disponiveis: Dict[tuple, bool] = {}
+        self._lock = threading.Lock()
+        self.metricas: Dict[str, int] = {'consultas': 0, 'reconhecidas': 0}
+        self.por_intencao: Dict[str, int] = {}
+
+    def _disponivel(self, intencao: Dict, slug: str) -> bool:
+        """As tabelas da intenção existem no schema do slug (memoizado por versão)"""
+        if slug in intencao.get('sql_por_slug', {}):
+            return True
+        chave = (intencao['nome'], slug, obter_versao_schema(slug))
+        disponivel = self._disponiveis.get(chave)
+        if disponivel is None:
+            schema = carregar_schema(slug) or {}
+            disponivel = all(tabela in schema for tabela in intencao.get('tabelas', []))
+            self._disponiveis[chave] = disponivel
+        return disponivel
+
+    def _valores(self, intencao: Dict, texto: str) -> Dict[str, int]:
+        """Parâmetros lidos da pergunta, com o padrão quando ausentes ou fora dos limites"""
+        valores = {}
+        for nome, definicao in intencao['_parametros'].items():
+            valor = definicao['padrao']
+            encontrado = definicao['_regex'].search(texto)
+            if encontrado:
+                lido = int(encontrado.group(1))
+                if definicao['minimo'] <= lido <= definicao['maximo']:
+                    valor = lido
+            valores[nome] = valor
+        return valores
+
+    def reconhecer(self, pergunta: str, slug: str) -> Optional[Dict]:
+        """
+        Returns:
+            {'nome', 'sql', 'parametros'} da primeira intenção reconhecida, ou None
+        """
+        texto = normalizar_pergunta(pergunta)
+        with self._lock:
+            self.metricas['consultas'] += 1
+
+        for intencao in self.intencoes:
+            if not any(padrao.search(texto) for padrao in intencao['_padroes']):
+                continue
+            if not self._disponivel(intencao, slug):
+                continue
+            valores = self._valores(intencao, texto)
+            sql = intencao.get('sql_por_slug', {}).get(slug, intencao['sql']).format(**valores)
+            with self._lock:
+                self.metricas['reconhecidas'] += 1
+                self.por_intencao[intencao['nome']] = self.por_intencao.get(intencao['nome'], 0) + 1
+            print(f"📌 Intenção reconhecida: {intencao['nome']} {valores or ''}")
+            return {'nome': intencao['nome'], 'sql': sql, 'parametros': valores}
+        return None
+
+    def listar(self) -> List[Dict]:
+        """Intenções do catálogo (nome, descrição e parâmetros)"""
+        return [
+            {
+                'nome': intencao['nome'],
+                'descricao': intencao['descricao'],
+                'parametros': {nome: d['padrao'] for nome, d in intencao['_parametros'].items()},
+            }
+            for intencao in self.intencoes
+        ]
+
+    def get_stats(self) -> Dict:
+        """Retorna perguntas avaliadas, reconhecidas e acertos por intenção"""
+        with self._lock:
+            consultas = self.metricas['consultas']
+            return {
+                **self.metricas,
+                'taxa_reconhecimento': self.metricas['reconhecidas'] / consultas if consultas else 0.0,
+                'por_intencao': dict(self.por_intencao),
+            }
+
+# Instância global do catálogo de intenções
+catalogo_intencoes = CatalogoIntencoes(CATALOGO_INTENCOES)
+
+def resolver_intencao(pergunta: str, slug: str) -> Optional[Dict]:
+    """SQL validado para a pergunta, quando ela corresponde a uma intenção do catálogo"""
+    return catalogo_intencoes.reconhecer(pergunta, slug)
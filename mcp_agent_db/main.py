@@ -1,16 +1,35 @@
-from fastapi import FastAPI
+import time
+
+_inicio_importacao = time.perf_counter()
+
+from dotenv import load_dotenv
+
+# .env antes dos módulos que leem configuração na importação
+load_dotenv()
+
+from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import Optional
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import json
 import uvicorn
 import os
-from agente_inteligente_v2 import processar_pergunta_com_agente_v2, processar_pergunta_com_streaming_sync
-from sql_generator import gerar_sql_da_pergunta
+# Agente, consulta_tool, sql_generator e orcamento_agente (langchain/langgraph) são
+# importados nos handlers ou no aquecimento (inicializacao), não na subida do app
 from conversation_memory import conversation_memory
-from cache_manager import query_cache
+from cache_manager import consultas_em_andamento, normalizar_pergunta, query_cache, sql_cache
+from sql_templates import obter_metricas_templates
+from concorrencia import limitador
+from roteador import metricas_rotas
+from intencoes import catalogo_intencoes
+from schema_loader import colunas_indexadas, obter_estatisticas_tabela, schema_registry, tabela_grande
+from custo_consulta import obter_metricas_custo
+from executores import contar_execucao, fechar_pools, obter_metricas_pools, timeout_requisicao_ms
+from inicializacao import AQUECER_NA_INICIALIZACAO, aquecer, relatorio_inicializacao
+
+relatorio_inicializacao.registrar_importacao(_inicio_importacao)
 
 # Configuração da aplicação
 app = FastAPI(
@@ -28,22 +47,73 @@ except:
     # Fallback se a pasta static não existir
     pass
 
-executor = ThreadPoolExecutor(max_workers=4)
+@app.on_event("startup")
+async def aquecer_servico():
+    """Inicia agente, ferramentas MCP, schemas e banco antes de aceitar requisições"""
+    if AQUECER_NA_INICIALIZACAO:
+        await aquecer()
+
+@app.on_event("shutdown")
+async def encerrar_servico():
+    """Fecha as conexões dos pools de todos os tenants"""
+    await fechar_pools()
+
+# Intervalo entre as verificações de cliente desconectado durante uma consulta
+INTERVALO_DESCONEXAO_S = float(os.getenv("INTERVALO_DESCONEXAO_S", "0.5"))
 
 class PerguntaRequest(BaseModel):
     pergunta: str
     slug: str = "casaa"
+    timeout_ms: Optional[int] = None  # reduz o statement_timeout do tenant nesta requisição
+    sessao: Optional[str] = None      # perguntas da mesma sessão compartilham o histórico do agente
 
 class GraficoRequest(BaseModel):
     pergunta: str
     tipo_grafico: str = "bar"
     slug: str = "casaa"
+    timeout_ms: Optional[int] = None
+    sessao: Optional[str] = None
+
+class ClienteDesconectado(Exception):
+    """O cliente fechou a conexão antes da resposta"""
 
-def executar_agente_sync(pergunta):
-    return processar_pergunta_com_agente_v2(pergunta)
+async def executar_agente(pergunta: str, slug: str = "casaa", timeout_ms: Optional[int] = None,
+                          sessao: Optional[str] = None) -> str:
+    """Executa o agente no event loop, limitado por LIMITE_REQUISICOES"""
+    from agente_inteligente_v2 import processar_pergunta_com_agente_v2_async
+    token = timeout_requisicao_ms.set(timeout_ms)
+    try:
+        async with limitador.limite('requisicoes'):
+            return await processar_pergunta_com_agente_v2_async(pergunta, slug, sessao)
+    finally:
+        timeout_requisicao_ms.reset(token)
+
+async def aguardar_ou_cancelar(requisicao: Request, corrotina):
+    """
+    Aguarda a corrotina, cancelando-a se o cliente desconectar
+
+    O cancelamento chega até o SQL em andamento, que é cancelado no banco.
+    """
+    tarefa = asyncio.ensure_future(corrotina)
+    try:
+        while True:
+            concluidas, _ = await asyncio.wait({tarefa}, timeout=INTERVALO_DESCONEXAO_S)
+            if concluidas:
+                return tarefa.result()
+            if await requisicao.is_disconnected():
+                contar_execucao('desconexoes')
+                print("🔌 Cliente desconectou: cancelando a consulta")
+                raise ClienteDesconectado()
+    finally:
+        if not tarefa.done():
+            tarefa.cancel()
 
-def executar_agente_streaming_sync(pergunta):
-    return processar_pergunta_com_streaming_sync(pergunta)
+def resposta_desconectado(pergunta: str, slug: str) -> JSONResponse:
+    """499 (padrão do nginx para cliente que fechou a conexão); ninguém lê a resposta"""
+    return JSONResponse(
+        content={"pergunta": pergunta, "slug": slug, "status": "cancelado"},
+        status_code=499
+    )
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -84,6 +154,20 @@ async def health_check():
         "service": "MCP Agent DB"
     }
 
+@app.get("/api/pronto")
+async def prontidao():
+    """Prontidão: 200 depois do aquecimento sem falhas, 503 antes disso ou se alguma etapa falhou"""
+    estatisticas = relatorio_inicializacao.get_stats()
+    return JSONResponse(
+        status_code=200 if estatisticas["pronto"] else 503,
+        content={"pronto": estatisticas["pronto"], "aquecimento": estatisticas["aquecimento"]}
+    )
+
+@app.get("/api/inicializacao")
+async def estatisticas_inicializacao():
+    """Tempo de importação e de cada etapa do aquecimento"""
+    return relatorio_inicializacao.get_stats()
+
 @app.get("/api/schemas")
 async def listar_schemas():
     """Listar schemas disponíveis"""
@@ -93,19 +177,42 @@ async def listar_schemas():
         "default": "casaa"
     }
 
+@app.get("/api/schemas/estatisticas")
+async def estatisticas_schemas():
+    """Estatísticas do registro de schemas em memória"""
+    return schema_registry.get_stats()
+
+@app.get("/api/schemas/{slug}/tabelas/{tabela}/estatisticas")
+async def estatisticas_tabela(slug: str, tabela: str):
+    """Linhas, tamanho, índices e estatísticas de colunas de uma tabela"""
+    estatisticas = obter_estatisticas_tabela(slug, tabela)
+    if estatisticas is None:
+        return JSONResponse(status_code=404, content={"erro": f"Estatísticas não encontradas: {slug}.{tabela}"})
+    return {
+        "slug": slug,
+        "tabela": tabela,
+        "tabela_grande": tabela_grande(slug, tabela),
+        "colunas_indexadas": colunas_indexadas(slug, tabela),
+        **estatisticas
+    }
+
+@app.get("/api/prompt/estatisticas")
+async def estatisticas_prompt():
+    """Tamanho médio dos prompts enviados ao LLM e redução obtida pela poda do schema"""
+    from sql_generator import obter_metricas_prompt
+    return obter_metricas_prompt()
+
 @app.post("/api/consulta")
-async def consultar(request: PerguntaRequest):
+async def consultar(request: PerguntaRequest, requisicao: Request):
     """Realizar consulta em linguagem natural"""
     print(f"🔍 Recebido: {request.pergunta}")
     
     try:
-        # Executar o agente em thread separada
-        loop = asyncio.get_event_loop()
-        resposta = await loop.run_in_executor(
-            executor, 
-            executar_agente_sync, 
-            request.pergunta
-        )
+        # Requisições idênticas simultâneas aguardam a mesma execução do agente
+        resposta = await aguardar_ou_cancelar(requisicao, consultas_em_andamento.executar_async(
+            ("agente", normalizar_pergunta(request.pergunta), request.slug, request.timeout_ms, request.sessao),
+            lambda: executar_agente(request.pergunta, request.slug, request.timeout_ms, request.sessao)
+        ))
         
         print(f"✅ Resposta do agente: {resposta[:100]}...")
         
@@ -116,6 +223,8 @@ async def consultar(request: PerguntaRequest):
             "status": "success"
         })
         
+    except ClienteDesconectado:
+        return resposta_desconectado(request.pergunta, request.slug)
     except Exception as e:
         print(f"❌ Erro: {str(e)}")
         return JSONResponse(
@@ -129,7 +238,7 @@ async def consultar(request: PerguntaRequest):
         )
 
 @app.post("/api/grafico")
-async def gerar_grafico(request: GraficoRequest):
+async def gerar_grafico(request: GraficoRequest, requisicao: Request):
     """Gerar gráfico a partir de consulta"""
     print(f"📊 Gerando gráfico: {request.pergunta}")
     
@@ -137,13 +246,10 @@ async def gerar_grafico(request: GraficoRequest):
         # Adicionar instrução de gráfico à pergunta
         pergunta_com_grafico = f"Gere um gráfico {request.tipo_grafico} para: {request.pergunta}"
         
-        # Executar o agente em thread separada
-        loop = asyncio.get_event_loop()
-        resposta = await loop.run_in_executor(
-            executor, 
-            executar_agente_sync, 
-            pergunta_com_grafico
-        )
+        resposta = await aguardar_ou_cancelar(requisicao, consultas_em_andamento.executar_async(
+            ("agente", normalizar_pergunta(pergunta_com_grafico), request.slug, request.timeout_ms, request.sessao),
+            lambda: executar_agente(pergunta_com_grafico, request.slug, request.timeout_ms, request.sessao)
+        ))
         
         return JSONResponse(content={
             "pergunta": request.pergunta,
@@ -153,6 +259,8 @@ async def gerar_grafico(request: GraficoRequest):
             "status": "success"
         })
         
+    except ClienteDesconectado:
+        return resposta_desconectado(request.pergunta, request.slug)
     except Exception as e:
         print(f"❌ Erro ao gerar gráfico: {str(e)}")
         return JSONResponse(
@@ -165,7 +273,8 @@ async def gerar_grafico(request: GraficoRequest):
             status_code=500
         )
 
-async def stream_agente_response(pergunta: str):
+async def stream_agente_response(pergunta: str, slug: str = "casaa", timeout_ms: Optional[int] = None,
+                                 sessao: Optional[str] = None):
     """Gerador que simula o streaming real da resposta do agente"""
     try:
         # Enviar evento de início
@@ -185,13 +294,7 @@ async def stream_agente_response(pergunta: str):
             yield f"data: {json.dumps({'tipo': 'etapa', 'numero': i, 'mensagem': etapa})}\n\n"
             await asyncio.sleep(0.8)
         
-        # Executar o agente em thread separada
-        loop = asyncio.get_event_loop()
-        resposta_completa = await loop.run_in_executor(
-            executor, 
-            executar_agente_sync, 
-            pergunta
-        )
+        resposta_completa = await executar_agente(pergunta, slug, timeout_ms, sessao)
         
         # Simular streaming da resposta palavra por palavra
         yield f"data: {json.dumps({'tipo': 'resposta_inicio', 'mensagem': '📝 Gerando resposta...'})}\n\n"
@@ -214,6 +317,11 @@ async def stream_agente_response(pergunta: str):
         # Enviar evento de conclusão
         yield f"data: {json.dumps({'tipo': 'concluido', 'resposta_final': resposta_completa})}\n\n"
         
+    except asyncio.CancelledError:
+        # O Starlette cancela o gerador quando o cliente desconecta; o SQL é cancelado junto
+        contar_execucao('desconexoes')
+        print("🔌 Cliente desconectou do streaming: consulta cancelada")
+        raise
     except Exception as e:
         yield f"data: {json.dumps({'tipo': 'erro', 'mensagem': f'❌ Erro: {str(e)}'})}\n\n"
 
@@ -223,7 +331,7 @@ async def consultar_com_streaming_real(request: PerguntaRequest):
     print(f"🎬 Iniciando streaming real: {request.pergunta}")
     
     return StreamingResponse(
-        stream_agente_response(request.pergunta),
+        stream_agente_response(request.pergunta, request.slug, request.timeout_ms, request.sessao),
         media_type="text/plain",
         headers={
             "Cache-Control": "no-cache",
@@ -246,8 +354,46 @@ async def get_historico():
 async def limpar_cache():
     """Limpa cache de consultas"""
     query_cache.cache.clear()
+    sql_cache.clear()
     return {"message": "Cache limpo com sucesso"}
 
+@app.get("/api/cache/estatisticas")
+async def estatisticas_cache():
+    """Estatísticas do cache de respostas e do cache persistente de SQL"""
+    return {
+        "respostas": query_cache.get_stats(),
+        "sql": sql_cache.get_stats(),
+        "templates_por_slug": obter_metricas_templates(),
+        "coalescencia": consultas_em_andamento.get_stats(),
+        "intencoes": catalogo_intencoes.get_stats()
+    }
+
+@app.get("/api/intencoes")
+async def listar_intencoes():
+    """Perguntas conhecidas respondidas com SQL validado, sem chamar o LLM"""
+    return {"intencoes": catalogo_intencoes.listar()}
+
+@app.get("/api/concorrencia/estatisticas")
+async def estatisticas_concorrencia():
+    """Limites de concorrência (requisições, LLM, banco) e uso de cada um"""
+    return limitador.get_stats()
+
+@app.get("/api/banco/pools")
+async def estatisticas_pools():
+    """Tenants cadastrados e uso dos pools de conexão de cada um"""
+    return obter_metricas_pools()
+
+@app.get("/api/banco/custo")
+async def estatisticas_custo():
+    """Limites de custo do EXPLAIN por tenant e SQLs aprovados, limitados, regerados e recusados"""
+    return obter_metricas_custo()
+
+@app.get("/api/roteamento/estatisticas")
+async def estatisticas_roteamento():
+    """Perguntas e latência por rota (caminho direto de SQL x agente)"""
+    from orcamento_agente import obter_metricas_orcamento
+    return {**metricas_rotas.get_stats(), "orcamento_agente": obter_metricas_orcamento()}
+
 @app.post("/api/limpar-historico")
 async def limpar_historico():
     """Limpa histórico da conversa"""
@@ -5,11 +5,23 @@ from dotenv import load_dotenv
 load_dotenv()
 
 SMITHERY_API_KEY = os.getenv("SMITHERY_API_KEY")
-print('chave do mcp',SMITHERY_API_KEY)
 if not SMITHERY_API_KEY:
     print("⚠️ SMITHERY_API_KEY não definida - MCP tools não estarão disponíveis")
     SMITHERY_API_KEY = "dummy_key"
 
+# Servidores MCP usados pelo agente: smithery (padrão), local (ferramentas de
+# gráfico no próprio processo, sem rede) ou local_http (graficos_locais.py rodando
+# como servidor MCP em MCP_LOCAL_URL)
+MCP_SERVIDORES = os.getenv("MCP_SERVIDORES", "smithery")
+MCP_LOCAL_URL = os.getenv("MCP_LOCAL_URL", "http://localhost:8765/mcp")
+
+MCP_LOCAL_CONFIG = {
+    "graficos_locais": {
+        "url": MCP_LOCAL_URL,
+        "transport": "streamable_http",
+    },
+}
+
 # Configuração simplificada para evitar erros
 MCP_SERVERS_CONFIG = {
     "chart_js_generator": {
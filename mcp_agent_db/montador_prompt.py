@@ -0,0 +1,146 @@
+"""
+Montagem de prompt com orçamento de tokens
+
+As seções são preenchidas por prioridade (regras, dicas de JOIN, tabelas
+relevantes, exemplos) até o orçamento, mas aparecem no texto na ordem em que
+foram adicionadas. Linhas que já foram enviadas (no prefixo fixo ou numa seção
+mais prioritária) são removidas das seções marcadas para deduplicação.
+"""
+
+import os
+import re
+from typing import Dict, List, Tuple, Union
+
+from schema_loader import estimar_tokens
+
+# Orçamento total do prompt de geração de SQL (prefixo fixo + parte variável)
+PROMPT_ORCAMENTO_TOKENS = int(os.getenv("PROMPT_ORCAMENTO_TOKENS", "6000"))
+
+# Regras e metadados vão no prefixo fixo (reservado), acima de qualquer seção
+PRIORIDADE_JOINS = 1
+PRIORIDADE_TABELAS = 2
+PRIORIDADE_EXEMPLOS = 3
+
+# Linhas curtas ("🔑 Chaves primárias:") se repetem legitimamente entre blocos
+TAMANHO_MINIMO_DEDUP = 12
+
+def _chave_linha(linha: str) -> str:
+    """Linha sem marcadores/emojis iniciais e em minúsculas, para comparar conteúdo"""
+    return re.sub(r"^[^\w]+", "", linha.strip()).lower()
+
+class Secao:
+    __slots__ = ('nome', 'itens', 'prioridade', 'obrigatoria', 'deduplicar', 'titulo', 'incluidos')
+
+    def __init__(self, nome: str, itens: List[str], prioridade: int, obrigatoria: bool,
+                 deduplicar: bool, titulo: str):
+        self.nome = nome
+        self.itens = itens
+        self.prioridade = prioridade
+        self.obrigatoria = obrigatoria
+        self.deduplicar = deduplicar
+        self.titulo = titulo
+        self.incluidos: List[str] = []
+
+class MontadorPrompt:
+    """
+    Monta a parte variável do prompt dentro de um orçamento de tokens
+
+    Uma seção pode ser um texto único ou uma lista de itens (ex: um bloco por
+    tabela, em ordem de relevância); listas entram item a item até o orçamento.
+    Seções obrigatórias entram mesmo estourando o orçamento.
+    """
+
+    def __init__(self, orcamento: int = PROMPT_ORCAMENTO_TOKENS, reservado: str = ""):
+        self.orcamento = orcamento
+        self.tokens_reservados = estimar_tokens(reservado) if reservado else 0
+        self._secoes: List[Secao] = []
+        self._linhas_enviadas = set()
+        self._registrar_linhas(reservado)
+
+    def _registrar_linhas(self, texto: str):
+        for linha in texto.splitlines():
+            chave = _chave_linha(linha)
+            if len(chave) >= TAMANHO_MINIMO_DEDUP:
+                self._linhas_enviadas.add(chave)
+
+    def adicionar(self, nome: str, conteudo: Union[str, List[str], None], prioridade: int,
+                  obrigatoria: bool = False, deduplicar: bool = False, titulo: str = ""):
+        """Adiciona uma seção (texto ou lista de itens); conteúdo vazio é ignorado"""
+        if not conteudo:
+            return
+        itens = [conteudo] if isinstance(conteudo, str) else list(conteudo)
+        self._secoes.append(Secao(nome, itens, prioridade, obrigatoria, deduplicar, titulo))
+
+    def _sem_linhas_repetidas(self, texto: str) -> Tuple[str, int]:
+        linhas, removidas = [], 0
+        for linha in texto.splitlines():
+            chave = _chave_linha(linha)
+            if len(chave) >= TAMANHO_MINIMO_DEDUP and chave in self._linhas_enviadas:
+                removidas += 1
+                continue
+            linhas.append(linha)
+        return "\n".join(linhas), removidas
+
+    def montar(self) -> Tuple[str, Dict]:
+        """
+        Returns:
+            (texto, relatório) com tokens finais, tokens por seção,
+            itens omitidos por falta de orçamento e linhas duplicadas removidas
+        """
+        tokens = self.tokens_reservados
+        omitidos: Dict[str, int] = {}
+        duplicadas = 0
+        itens_vistos = set()
+
+        for secao in sorted(self._secoes, key=lambda s: s.prioridade):
+            custo_titulo = estimar_tokens(secao.titulo) if secao.titulo else 0
+            for item in secao.itens:
+                if item in itens_vistos:
+                    duplicadas += item.count("\n") + 1
+                    continue
+                texto = item
+                if secao.deduplicar:
+                    texto, removidas = self._sem_linhas_repetidas(item)
+                    duplicadas += removidas
+                    if not texto.strip():
+                        continue
+                custo = estimar_tokens(texto) + (custo_titulo if not secao.incluidos else 0)
+                if not secao.obrigatoria and tokens + custo > self.orcamento:
+                    omitidos[secao.nome] = omitidos.get(secao.nome, 0) + 1
+                    continue
+                if not secao.incluidos:
+                    self._registrar_linhas(secao.titulo)
+                secao.incluidos.append(texto)
+                itens_vistos.add(item)
+                self._registrar_linhas(texto)
+                tokens += custo
+
+        partes = []
+        tokens_por_secao = {}
+        for secao in self._secoes:
+            if not secao.incluidos:
+                continue
+            bloco = "\n".join(([secao.titulo] if secao.titulo else []) + secao.incluidos)
+            tokens_por_secao[secao.nome] = estimar_tokens(bloco)
+            partes.append(bloco)
+
+        relatorio = {
+            'tokens': tokens,
+            'orcamento': self.orcamento,
+            'tokens_reservados': self.tokens_reservados,
+            'secoes': tokens_por_secao,
+            'omitidos': omitidos,
+            'linhas_duplicadas': duplicadas,
+        }
+        return "\n".join(partes), relatorio
+
+def resumo_relatorio(relatorio: Dict) -> str:
+    """Linha de log do relatório de montagem"""
+    omitidos = ", ".join(f"{nome}: {n}" for nome, n in relatorio['omitidos'].items())
+    return (
+        f"🧮 Prompt montado: ~{relatorio['tokens']}/{relatorio['orcamento']} tokens "
+        f"(fixo ~{relatorio['tokens_reservados']}; "
+        f"{', '.join(f'{nome} ~{t}' for nome, t in relatorio['secoes'].items())}"
+        f"{'; omitidos ' + omitidos if omitidos else ''}"
+        f"{'; ' + str(relatorio['linhas_duplicadas']) + ' linhas duplicadas removidas' if relatorio['linhas_duplicadas'] else ''})"
+    )
@@ -0,0 +1,183 @@
+"""
+Orçamento por pergunta do agente ReAct
+
+Cada pergunta que vai ao agente recebe limites de chamadas ao LLM (inclusive as
+de geração de SQL dentro das ferramentas), de chamadas de ferramenta e de tempo:
+
+    AGENTE_MAX_LLM          chamadas ao LLM por pergunta (padrão 6)
+    AGENTE_MAX_FERRAMENTAS  chamadas de ferramenta por pergunta (padrão 3)
+    AGENTE_TEMPO_MAX_S      tempo máximo por pergunta em segundos (padrão 60)
+
+Um SQL que falhou não é executado de novo na mesma pergunta. Ao estourar o
+orçamento o agente é interrompido e a resposta parcial traz o que foi obtido.
+"""
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from filtros_empresa import normalizar_sql
+
+AGENTE_MAX_LLM = int(os.getenv("AGENTE_MAX_LLM", "6"))
+AGENTE_MAX_FERRAMENTAS = int(os.getenv("AGENTE_MAX_FERRAMENTAS", "3"))
+AGENTE_TEMPO_MAX_S = float(os.getenv("AGENTE_TEMPO_MAX_S", "60"))
+
+# Saídas de ferramenta que indicam erro (não entram na resposta parcial)
+PREFIXOS_ERRO = ("❌", "-- Erro", "Error", "Erro")
+
+class OrcamentoEsgotado(Exception):
+    """Limite de LLM, ferramentas ou tempo atingido"""
+
+class OrcamentoAgente:
+    """Contadores e limites de uma pergunta"""
+
+    def __init__(self, max_llm: int = AGENTE_MAX_LLM, max_ferramentas: int = AGENTE_MAX_FERRAMENTAS,
+                 tempo_max_s: float = AGENTE_TEMPO_MAX_S):
+        self.max_llm = max_llm
+        self.max_ferramentas = max_ferramentas
+        self.tempo_max_s = tempo_max_s
+        self.inicio = time.perf_counter()
+        self.chamadas_llm = 0
+        self.chamadas_ferramentas = 0
+        self.sqls_falhos: List[str] = []
+        self.resultados: List[Dict[str, str]] = []
+        self.motivo: Optional[str] = None
+
+    @property
+    def tempo_decorrido(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    @property
+    def tempo_restante(self) -> float:
+        return max(0.0, self.tempo_max_s - self.tempo_decorrido)
+
+    @property
+    def limite_recursao(self) -> int:
+        """recursion_limit do grafo: um passo do agente e um das ferramentas por chamada, mais a resposta"""
+        return 2 * self.max_ferramentas + 3
+
+    def encerrar(self, motivo: str):
+        """Registra o motivo da interrupção (o primeiro prevalece)"""
+        if self.motivo is None:
+            self.motivo = motivo
+            print(f"⛔ Orçamento do agente esgotado: {motivo}")
+
+    def esgotar(self, motivo: str):
+        self.encerrar(motivo)
+        raise OrcamentoEsgotado(self.motivo)
+
+    def _verificar(self):
+        if self.motivo is not None:
+            raise OrcamentoEsgotado(self.motivo)
+        if self.tempo_decorrido > self.tempo_max_s:
+            self.esgotar(f"tempo máximo de {self.tempo_max_s:.0f}s")
+
+    def registrar_llm(self):
+        self._verificar()
+        if self.chamadas_llm >= self.max_llm:
+            self.esgotar(f"limite de {self.max_llm} chamadas ao LLM")
+        self.chamadas_llm += 1
+
+    def registrar_ferramenta(self, nome: str):
+        self._verificar()
+        if self.chamadas_ferramentas >= self.max_ferramentas:
+            self.esgotar(f"limite de {self.max_ferramentas} chamadas de ferramenta")
+        self.chamadas_ferramentas += 1
+
+    def registrar_resultado(self, nome: str, saida: str):
+        if saida and not saida.lstrip().startswith(PREFIXOS_ERRO):
+            self.resultados.append({'ferramenta': nome, 'saida': saida})
+
+    def resumo(self) -> Dict:
+        return {
+            'chamadas_llm': self.chamadas_llm,
+            'chamadas_ferramentas': self.chamadas_ferramentas,
+            'tempo_s': round(self.tempo_decorrido, 2),
+            'sqls_falhos': len(self.sqls_falhos),
+            'motivo': self.motivo,
+        }
+
+    def resposta_parcial(self) -> str:
+        """Resposta estruturada com o que foi obtido antes de o orçamento acabar"""
+        partes = [
+            f"⚠️ **Resposta parcial** – a análise foi interrompida: {self.motivo or 'orçamento esgotado'}.",
+            f"Etapas executadas: {self.chamadas_llm} chamadas ao LLM, "
+            f"{self.chamadas_ferramentas} ferramentas, {self.tempo_decorrido:.1f}s.",
+        ]
+        if self.resultados:
+            ultimo = self.resultados[-1]
+            partes.append(f"\n📋 **Último resultado obtido ({ultimo['ferramenta']}):**\n{ultimo['saida']}")
+        else:
+            partes.append("\nNenhum resultado foi obtido antes do limite.")
+        if self.sqls_falhos:
+            partes.append("\n❌ **SQL que falhou:**\n```sql\n" + self.sqls_falhos[-1] + "\n```")
+        partes.append("\n💡 Tente reformular a pergunta de forma mais específica.")
+        return "\n".join(partes)
+
+# Perguntas no agente, interrompidas por orçamento e SQLs repetidos barrados
+metricas_orcamento = {'perguntas': 0, 'interrompidas': 0, 'sqls_repetidos_bloqueados': 0}
+_lock_metricas = threading.Lock()
+
+def contar_orcamento(campo: str):
+    with _lock_metricas:
+        metricas_orcamento[campo] += 1
+
+def obter_metricas_orcamento() -> Dict:
+    """Limites configurados e contadores de interrupção"""
+    with _lock_metricas:
+        return {
+            'limites': {
+                'max_llm': AGENTE_MAX_LLM,
+                'max_ferramentas': AGENTE_MAX_FERRAMENTAS,
+                'tempo_max_s': AGENTE_TEMPO_MAX_S,
+            },
+            **metricas_orcamento,
+        }
+
+# Orçamento da pergunta em andamento (propagado às ferramentas pelo contexto)
+orcamento_atual: ContextVar[Optional[OrcamentoAgente]] = ContextVar("orcamento_atual", default=None)
+
+def _chave_sql(sql: str) -> str:
+    # Mesma consulta com outra formatação ou caixa conta como repetida
+    return normalizar_sql(sql).lower()
+
+def sql_ja_falhou(sql: str) -> bool:
+    """True se este SQL já falhou na pergunta em andamento"""
+    orcamento = orcamento_atual.get()
+    if orcamento is None:
+        return False
+    if _chave_sql(sql) in {_chave_sql(s) for s in orcamento.sqls_falhos}:
+        contar_orcamento('sqls_repetidos_bloqueados')
+        return True
+    return False
+
+def registrar_sql_falho(sql: str):
+    """Marca o SQL como falho na pergunta em andamento"""
+    orcamento = orcamento_atual.get()
+    if orcamento is not None:
+        orcamento.sqls_falhos.append(sql)
+
+class MonitorOrcamento(BaseCallbackHandler):
+    """Callback que conta chamadas ao LLM e às ferramentas e interrompe o agente no limite"""
+
+    raise_error = True
+
+    def __init__(self, orcamento: OrcamentoAgente):
+        self.orcamento = orcamento
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List, **kwargs: Any):
+        self.orcamento.registrar_llm()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any):
+        self.orcamento.registrar_llm()
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any):
+        self.orcamento.registrar_ferramenta((serialized or {}).get('name', ''))
+
+    def on_tool_end(self, output: Any, **kwargs: Any):
+        nome = kwargs.get('name') or ''
+        self.orcamento.registrar_resultado(nome, str(getattr(output, 'content', output)))
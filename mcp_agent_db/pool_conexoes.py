@@ -0,0 +1,279 @@
+"""
+Pool de conexões por tenant
+
+Cada slug do registro de tenants (tenants.py) tem seu próprio pool psycopg2,
+compartilhado pelas threads; slugs sem entrada usam o pool "default".
+
+    DB_POOL_MIN           conexões abertas no aquecimento (padrão 1)
+    DB_POOL_MAX           máximo de conexões por slug (padrão LIMITE_DB ou 10)
+    DB_POOL_TIMEOUT_S     espera máxima por uma conexão livre (padrão 10)
+    DB_POOL_OCIOSA_MAX_S  conexão ociosa há mais tempo é fechada (padrão 300)
+    DB_POOL_VIDA_MAX_S    idade máxima de uma conexão (padrão 1800)
+    DB_POOL_PREPING_S     conexão ociosa há mais tempo é testada com SELECT 1
+                          antes do uso (padrão 30; 0 testa sempre)
+
+As conexões ficam em autocommit (o agente só lê): um erro de SQL não deixa
+transação aberta, e conexões quebradas são descartadas na devolução. Cada
+conexão já nasce com o statement_timeout do tenant.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from tenants import registro_tenants
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", os.getenv("LIMITE_DB", "10")))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))
+DB_POOL_OCIOSA_MAX_S = float(os.getenv("DB_POOL_OCIOSA_MAX_S", "300"))
+DB_POOL_VIDA_MAX_S = float(os.getenv("DB_POOL_VIDA_MAX_S", "1800"))
+DB_POOL_PREPING_S = float(os.getenv("DB_POOL_PREPING_S", "30"))
+DB_CONNECT_TIMEOUT_S = int(os.getenv("DB_CONNECT_TIMEOUT_S", "5"))
+
+class PoolEsgotado(TimeoutError):
+    """Nenhuma conexão livre dentro de DB_POOL_TIMEOUT_S"""
+
+class _ConexaoPool:
+    """Conexão psycopg2 com os instantes de criação e de devolução"""
+
+    __slots__ = ('conexao', 'criada_em', 'devolvida_em')
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.criada_em = self.devolvida_em = time.monotonic()
+
+class PoolConexoes:
+    """Pool de conexões de um tenant com timeout de espera, reciclagem e pre-ping"""
+
+    def __init__(self, chave: str, config: Dict):
+        self.chave = chave
+        self.config = config
+        self.maximo = max(1, config.get('pool_max', DB_POOL_MAX))
+        self.minimo = min(config.get('pool_min', DB_POOL_MIN), self.maximo)
+        self._livres: List[_ConexaoPool] = []
+        self._abertas = 0
+        self._em_uso = 0
+        self._fechado = False
+        self._cond = threading.Condition()
+        self.metricas = {
+            'checkouts': 0, 'reutilizadas': 0, 'criadas': 0, 'fechadas': 0,
+            'recicladas': 0, 'falhas_preping': 0, 'descartadas': 0,
+            'esperaram': 0, 'timeouts': 0, 'espera_total_ms': 0.0,
+        }
+
+    def _conectar(self) -> _ConexaoPool:
+        import psycopg2
+
+        conexao = psycopg2.connect(
+            host=self.config['host'],
+            port=self.config['port'],
+            user=self.config['user'],
+            password=self.config['password'],
+            dbname=self.config['dbname'],
+            connect_timeout=DB_CONNECT_TIMEOUT_S,
+            options=f"-c search_path=public -c statement_timeout={self.config['statement_timeout_ms']}",
+        )
+        conexao.autocommit = True
+        with self._cond:
+            self.metricas['criadas'] += 1
+        return _ConexaoPool(conexao)
+
+    def _fechar(self, item: _ConexaoPool):
+        try:
+            item.conexao.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.metricas['fechadas'] += 1
+
+    def _expirada(self, item: _ConexaoPool, agora: float) -> bool:
+        return (agora - item.criada_em > DB_POOL_VIDA_MAX_S
+                or agora - item.devolvida_em > DB_POOL_OCIOSA_MAX_S)
+
+    def _recolher_expiradas(self) -> List[_ConexaoPool]:
+        """Retira do pool as conexões ociosas ou velhas demais (chamar com o lock)"""
+        agora = time.monotonic()
+        expiradas = [item for item in self._livres if self._expirada(item, agora)]
+        if expiradas:
+            self._livres = [item for item in self._livres if not self._expirada(item, agora)]
+            self._abertas -= len(expiradas)
+            self.metricas['recicladas'] += len(expiradas)
+        return expiradas
+
+    def _viva(self, item: _ConexaoPool) -> bool:
+        """Pre-ping: testa a conexão que ficou ociosa mais que DB_POOL_PREPING_S"""
+        if item.conexao.closed:
+            return False
+        if time.monotonic() - item.devolvida_em < DB_POOL_PREPING_S:
+            return True
+        try:
+            with item.conexao.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            with self._cond:
+                self.metricas['falhas_preping'] += 1
+            return False
+
+    def _obter(self) -> _ConexaoPool:
+        inicio = time.perf_counter()
+        prazo = time.monotonic() + DB_POOL_TIMEOUT_S
+        esperou = False
+        while True:
+            with self._cond:
+                if self._fechado:
+                    raise RuntimeError(f"Pool {self.chave} fechado")
+                expiradas = self._recolher_expiradas()
+                item, abrir = None, False
+                if self._livres:
+                    # LIFO: a conexão usada por último é a mais provável de estar viva
+                    item = self._livres.pop()
+                elif self._abertas < self.maximo:
+                    self._abertas += 1
+                    abrir = True
+                else:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        self.metricas['timeouts'] += 1
+                        raise PoolEsgotado(
+                            f"Pool {self.chave}: nenhuma conexão livre em {DB_POOL_TIMEOUT_S:g}s "
+                            f"({self.maximo} em uso)"
+                        )
+                    esperou = True
+                    self._cond.wait(restante)
+            for expirada in expiradas:
+                self._fechar(expirada)
+            if abrir:
+                try:
+                    item = self._conectar()
+                except Exception:
+                    with self._cond:
+                        self._abertas -= 1
+                        self._cond.notify()
+                    raise
+            elif item is not None:
+                if not self._viva(item):
+                    self._fechar(item)
+                    with self._cond:
+                        self._abertas -= 1
+                    continue
+                with self._cond:
+                    self.metricas['reutilizadas'] += 1
+            if item is None:
+                continue
+            with self._cond:
+                self._em_uso += 1
+                self.metricas['checkouts'] += 1
+                if esperou:
+                    self.metricas['esperaram'] += 1
+                    self.metricas['espera_total_ms'] += (time.perf_counter() - inicio) * 1000
+            return item
+
+    def _devolver(self, item: _ConexaoPool, descartar: bool = False):
+        fechar = False
+        with self._cond:
+            self._em_uso -= 1
+            item.devolvida_em = time.monotonic()
+            if descartar or self._fechado or item.conexao.closed or self._expirada(item, item.devolvida_em):
+                self._abertas -= 1
+                self.metricas['descartadas'] += 1
+                fechar = True
+            else:
+                self._livres.append(item)
+            self._cond.notify()
+        if fechar:
+            self._fechar(item)
+
+    @contextmanager
+    def conexao(self):
+        """Conexão do pool durante o bloco; devolvida (ou descartada, se quebrou) no fim"""
+        item = self._obter()
+        descartar = False
+        try:
+            yield item.conexao
+        except Exception as e:
+            import psycopg2
+
+            descartar = bool(item.conexao.closed) or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            raise
+        finally:
+            self._devolver(item, descartar)
+
+    def aquecer(self) -> int:
+        """Abre conexões até o mínimo configurado e testa uma delas"""
+        novas = []
+        with self._cond:
+            faltam = max(0, self.minimo - self._abertas)
+            self._abertas += faltam
+        try:
+            for _ in range(faltam):
+                novas.append(self._conectar())
+        finally:
+            with self._cond:
+                self._abertas -= faltam - len(novas)
+                self._livres.extend(novas)
+                self._cond.notify_all()
+        with self.conexao() as conexao:
+            with conexao.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        return self._abertas
+
+    def fechar(self):
+        """Fecha as conexões livres; as em uso são fechadas na devolução"""
+        with self._cond:
+            self._fechado = True
+            livres, self._livres = self._livres, []
+            self._abertas -= len(livres)
+            self._cond.notify_all()
+        for item in livres:
+            self._fechar(item)
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            return {
+                'dbname': self.config['dbname'],
+                'statement_timeout_ms': self.config['statement_timeout_ms'],
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'abertas': self._abertas,
+                'em_uso': self._em_uso,
+                'ociosas': len(self._livres),
+                **{k: round(v, 2) for k, v in self.metricas.items()},
+            }
+
+class GerenciadorPools:
+    """Um PoolConexoes por tenant, criado no primeiro uso do slug"""
+
+    def __init__(self):
+        self._pools: Dict[str, PoolConexoes] = {}
+        self._lock = threading.Lock()
+
+    def pool(self, slug: str) -> PoolConexoes:
+        chave, config = registro_tenants.resolver(slug)
+        pool = self._pools.get(chave)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(chave)
+                if pool is None:
+                    pool = PoolConexoes(chave, config)
+                    self._pools[chave] = pool
+                    print(f"🔌 Pool de conexões {chave}: {pool.minimo}-{pool.maximo} conexões ({config['dbname']})")
+        return pool
+
+    def fechar_todos(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.fechar()
+
+    def get_stats(self) -> Dict:
+        """Uso e métricas de cada pool"""
+        with self._lock:
+            pools = dict(self._pools)
+        return {chave: pool.get_stats() for chave, pool in pools.items()}
+
+# Instância global dos pools por tenant
+pools_conexao = GerenciadorPools()
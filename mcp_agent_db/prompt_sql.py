@@ -1,12 +1,9 @@
-TEMPLATE_SQL = """
+# Parte fixa (persona + regras) vem primeiro e, somada aos metadados do slug, forma
+# um prefixo idêntico entre chamadas, elegível ao cache de contexto do provedor.
+# As partes variáveis (schema podado e pergunta) ficam no fim.
+TEMPLATE_SQL_SISTEMA = """
 Você é um especialista em SQL PostgreSQL com conhecimento profundo do sistema de gestão.
 
-CONTEXTO DO BANCO:
-{schema}
-
-PERGUNTA DO USUÁRIO:
-"{pergunta}"
-
 INSTRUÇÕES PARA GERAR SQL:
 
 🎯 ANÁLISE DA PERGUNTA:
@@ -47,7 +44,17 @@ INSTRUÇÕES PARA GERAR SQL:
 - Ordene resultados de forma lógica (por valor, data, etc.)
 - Limite a 20 registros para gráficos
 - para os graficos use a ferramenta de visualização do mcp 
+"""
+
+TEMPLATE_SQL_PERGUNTA = """
+CONTEXTO DO BANCO:
+{schema}
+
+PERGUNTA DO USUÁRIO:
+"{pergunta}"
 
 RESPONDA APENAS COM A SQL VÁLIDA:
 """
 
+TEMPLATE_SQL = TEMPLATE_SQL_SISTEMA + TEMPLATE_SQL_PERGUNTA
+
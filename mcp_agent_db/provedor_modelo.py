@@ -0,0 +1,190 @@
+"""
+Provedor do modelo de linguagem, escolhido por configuração
+
+    MODELO_PROVEDOR   google_genai (padrão) ou qualquer provedor do init_chat_model;
+                      "fake" usa o ModeloReplay, sem rede
+    MODELO_NOME       nome do modelo (padrão gemini-2.5-flash)
+    MODELO_FIXTURE    arquivo com as respostas do ModeloReplay
+                      (padrão fixtures/modelo_replay.json)
+    MODELO_FAKE_LATENCIA_MS  latência simulada por chamada (sobrepõe a da fixture)
+
+O ModeloReplay é determinístico: para o prompt de geração de SQL devolve o SQL
+da fixture que corresponde à pergunta; no agente devolve as chamadas de
+ferramenta da fixture (por padrão consultar_banco_dados e, para gráficos, a
+ferramenta de gráfico) e depois a resposta final. Serve para testes de carga e
+profiling offline de todo o fluxo.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from cache_manager import normalizar_pergunta
+from roteador import eh_pergunta_grafico
+from schema_loader import estimar_tokens
+
+MODELO_PROVEDOR = os.getenv("MODELO_PROVEDOR", "google_genai")
+MODELO_NOME = os.getenv("MODELO_NOME", "gemini-2.5-flash")
+MODELO_FIXTURE = os.getenv("MODELO_FIXTURE", "fixtures/modelo_replay.json")
+MODELO_FAKE_LATENCIA_MS = os.getenv("MODELO_FAKE_LATENCIA_MS")
+
+PROVEDOR_FAKE = "fake"
+
+PADRAO_PERGUNTA_SQL = re.compile(r'PERGUNTA DO USUÁRIO:\s*"(.*?)"\s*RESPONDA', re.DOTALL)
+
+DADOS_GRAFICO_PADRAO = [
+    {"category": "A", "value": 10},
+    {"category": "B", "value": 20},
+    {"category": "C", "value": 15},
+]
+
+def carregar_fixture(caminho: str = MODELO_FIXTURE) -> Dict:
+    """Lê a fixture do ModeloReplay (vazia se o arquivo não existe)"""
+    if not os.path.exists(caminho):
+        print(f"⚠️ Fixture do modelo fake não encontrada: {caminho}")
+        return {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _nome_ferramenta(ferramenta: Any) -> str:
+    nome = getattr(ferramenta, 'name', None)
+    if nome:
+        return nome
+    return convert_to_openai_tool(ferramenta)['function']['name']
+
+def _texto(mensagem: BaseMessage) -> str:
+    conteudo = mensagem.content
+    if isinstance(conteudo, list):
+        return " ".join(parte.get('text', '') if isinstance(parte, dict) else str(parte) for parte in conteudo)
+    return str(conteudo)
+
+class ModeloReplay(BaseChatModel):
+    """Modelo de chat determinístico que responde a partir de uma fixture"""
+
+    fixture: Dict = {}
+    latencia_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any):
+        """Guarda apenas os nomes das ferramentas; as chamadas vêm da fixture"""
+        return self.bind(ferramentas=[_nome_ferramenta(t) for t in tools], **kwargs)
+
+    def _entrada(self, pergunta: str) -> Dict:
+        """Primeira resposta da fixture cujo trecho aparece na pergunta"""
+        texto = normalizar_pergunta(pergunta)
+        for entrada in self.fixture.get('respostas', []):
+            if normalizar_pergunta(entrada.get('contem', '')) in texto:
+                return entrada
+        return {}
+
+    def _responder_sql(self, texto: str) -> AIMessage:
+        encontrado = PADRAO_PERGUNTA_SQL.search(texto)
+        pergunta = encontrado.group(1) if encontrado else texto
+        sql = self._entrada(pergunta).get('sql') or self.fixture.get(
+            'sql_padrao', "SELECT enti_tipo_enti, COUNT(*) AS quantidade FROM entidades GROUP BY enti_tipo_enti"
+        )
+        return AIMessage(content=sql)
+
+    def _responder_agente(self, mensagens: List[BaseMessage], ferramentas: List[str]) -> AIMessage:
+        # Chamadas de ferramenta já feitas desde a última mensagem do usuário
+        inicio = max((i for i, m in enumerate(mensagens) if isinstance(m, HumanMessage)), default=0)
+        chamadas = [
+            chamada
+            for mensagem in mensagens[inicio:] if isinstance(mensagem, AIMessage)
+            for chamada in mensagem.tool_calls
+        ]
+        texto_usuario = _texto(mensagens[inicio]) if mensagens else ""
+        pergunta = next((linha.strip() for linha in texto_usuario.splitlines() if linha.strip()), "")
+        entrada = self._entrada(pergunta)
+
+        sequencia = entrada.get('ferramentas')
+        if sequencia is None:
+            sequencia = [{'nome': 'consultar_banco_dados', 'args': {'pergunta': pergunta}}]
+            if eh_pergunta_grafico(pergunta):
+                nome_grafico = self.fixture.get('ferramenta_grafico', 'generate_bar_chart')
+                sequencia.append({
+                    'nome': nome_grafico,
+                    'args': {
+                        'data': entrada.get('dados_grafico') or self.fixture.get('dados_grafico', DADOS_GRAFICO_PADRAO),
+                        'title': pergunta[:80],
+                    },
+                })
+        sequencia = [passo for passo in sequencia if passo['nome'] in ferramentas]
+
+        if len(chamadas) < len(sequencia):
+            passo = sequencia[len(chamadas)]
+            return AIMessage(content="", tool_calls=[{
+                'name': passo['nome'],
+                'args': passo.get('args', {}),
+                'id': f"call_{uuid.uuid4().hex[:12]}",
+                'type': 'tool_call',
+            }])
+
+        resultado = _texto(mensagens[-1]) if mensagens else ""
+        modelo_resposta = entrada.get('resposta') or self.fixture.get('resposta_final', "{resultado}")
+        return AIMessage(content=modelo_resposta.replace("{resultado}", resultado))
+
+    def _responder(self, mensagens: List[BaseMessage], ferramentas: Optional[List[str]]) -> ChatResult:
+        texto = "\n".join(_texto(m) for m in mensagens)
+        if ferramentas:
+            mensagem = self._responder_agente(mensagens, ferramentas)
+        else:
+            mensagem = self._responder_sql(texto)
+        tokens_entrada = estimar_tokens(texto)
+        tokens_saida = estimar_tokens(_texto(mensagem)) + 10 * len(mensagem.tool_calls)
+        mensagem.usage_metadata = {
+            'input_tokens': tokens_entrada,
+            'output_tokens': tokens_saida,
+            'total_tokens': tokens_entrada + tokens_saida,
+        }
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        return self._responder(messages, kwargs.get('ferramentas'))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latencia_ms:
+            await asyncio.sleep(self.latencia_ms / 1000)
+        return self._responder(messages, kwargs.get('ferramentas'))
+
+def criar_modelo_replay(caminho: str = MODELO_FIXTURE) -> ModeloReplay:
+    fixture = carregar_fixture(caminho)
+    latencia = float(MODELO_FAKE_LATENCIA_MS) if MODELO_FAKE_LATENCIA_MS else float(fixture.get('latencia_ms', 0))
+    print(f"🧪 Modelo fake (replay): {caminho}, latência {latencia:.0f} ms")
+    return ModeloReplay(fixture=fixture, latencia_ms=latencia)
+
+_modelo = None
+_lock_modelo = threading.Lock()
+
+def obter_modelo():
+    """Modelo de chat configurado, criado uma única vez por processo"""
+    global _modelo
+    if _modelo is not None:
+        return _modelo
+    with _lock_modelo:
+        if _modelo is None:
+            if MODELO_PROVEDOR == PROVEDOR_FAKE:
+                _modelo = criar_modelo_replay()
+            else:
+                # Import adiado: carregar o provedor é caro e só é preciso aqui
+                from langchain.chat_models import init_chat_model
+
+                _modelo = init_chat_model(MODELO_NOME, model_provider=MODELO_PROVEDOR)
+    return _modelo
@@ -0,0 +1,85 @@
+"""
+Roteamento de perguntas: caminho direto de SQL x agente ReAct
+
+Perguntas simples de dados vão direto para consultar_banco_dados_interno (uma
+única chamada ao LLM, para gerar o SQL). Gráficos e perguntas com mais de uma
+etapa continuam no agente, que decide quais ferramentas usar.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+ROTEAMENTO_DIRETO = os.getenv("ROTEAMENTO_DIRETO", "true").lower() in ("1", "true", "sim", "yes")
+
+ROTA_DIRETA = "direta"
+ROTA_AGENTE = "agente"
+
+PALAVRAS_GRAFICO = ['gráfico', 'grafico', 'chart', 'visualiza', 'gere um gráfico', 'criar gráfico']
+
+# Indícios de pergunta com várias etapas ou que pede raciocínio sobre os dados
+PADRAO_MULTIPLAS_ETAPAS = re.compile(
+    r"\b(compar[ae]\w*|depois|em seguida|ent[aã]o|al[eé]m disso|por ?qu[eê]|explique|analise|"
+    r"recomend\w*|sugira|sugest[aã]o|e tamb[eé]m)\b",
+    re.IGNORECASE
+)
+
+# Amostras de latência guardadas por rota para os percentis
+AMOSTRAS_LATENCIA = 200
+
+def eh_pergunta_grafico(pergunta: str) -> bool:
+    """True se a pergunta pede um gráfico"""
+    texto = pergunta.lower()
+    return any(palavra in texto for palavra in PALAVRAS_GRAFICO)
+
+def escolher_rota(pergunta: str) -> str:
+    """Rota da pergunta: ROTA_DIRETA para dados simples, ROTA_AGENTE para o resto"""
+    if not ROTEAMENTO_DIRETO:
+        return ROTA_AGENTE
+    if eh_pergunta_grafico(pergunta):
+        return ROTA_AGENTE
+    if PADRAO_MULTIPLAS_ETAPAS.search(pergunta):
+        return ROTA_AGENTE
+    # Mais de uma pergunta na mesma mensagem
+    if pergunta.count("?") > 1:
+        return ROTA_AGENTE
+    return ROTA_DIRETA
+
+class MetricasRotas:
+    """Quantidade de perguntas e latência (média, p50, p95) por rota"""
+
+    def __init__(self, amostras: int = AMOSTRAS_LATENCIA):
+        self._lock = threading.Lock()
+        self._totais: Dict[str, int] = {}
+        self._soma_ms: Dict[str, float] = {}
+        self._latencias: Dict[str, deque] = {}
+        self._amostras = amostras
+
+    def registrar(self, rota: str, inicio: float):
+        """Registra a latência de uma pergunta iniciada em inicio (time.perf_counter)"""
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self._totais[rota] = self._totais.get(rota, 0) + 1
+            self._soma_ms[rota] = self._soma_ms.get(rota, 0.0) + duracao_ms
+            self._latencias.setdefault(rota, deque(maxlen=self._amostras)).append(duracao_ms)
+        print(f"🛣️ Rota {rota}: {duracao_ms:.0f} ms")
+
+    def get_stats(self) -> Dict:
+        """Retorna contagem e latências por rota"""
+        with self._lock:
+            stats = {}
+            for rota, total in self._totais.items():
+                latencias = sorted(self._latencias[rota])
+                stats[rota] = {
+                    'perguntas': total,
+                    'latencia_media_ms': round(self._soma_ms[rota] / total, 1),
+                    'latencia_p50_ms': round(latencias[len(latencias) // 2], 1),
+                    'latencia_p95_ms': round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 1),
+                }
+            return {'roteamento_direto': ROTEAMENTO_DIRETO, 'rotas': stats}
+
+# Instância global das métricas por rota
+metricas_rotas = MetricasRotas()
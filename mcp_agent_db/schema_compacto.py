@@ -0,0 +1,307 @@
+"""
+Formato compacto de schema com carregamento preguiçoso por tabela
+
+Layout do arquivo (schemas/<slug>.schema):
+    [8 bytes]  MAGIA
+    [4 bytes]  tamanho do cabeçalho (uint32 little-endian)
+    [N bytes]  cabeçalho JSON: hash de origem, tipos internados, diretório
+               de tabelas (nome, offset, tamanho), chaves extras (_metadados)
+               e diretório de seções
+    [...]      blocos JSON compactos, um por tabela, seguidos das seções
+
+O arquivo é mapeado em memória e cada tabela só vira objeto Python quando
+acessada, então a memória do worker cresce com as tabelas usadas. Seções são
+estruturas derivadas do schema (ex: índice de relevância) montadas uma vez por
+quem publica o arquivo e lidas prontas pelos workers.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+MAGIA = b"MCPSCH1\n"
+VERSAO_FORMATO = 2
+EXTENSAO = ".schema"
+
+FLAG_NULLABLE = 1
+FLAG_PRIMARY_KEY = 2
+
+class Coluna(NamedTuple):
+    """Registro imutável de coluna; aceita acesso por chave como o dict do JSON"""
+    nome: str
+    tipo: str
+    nullable: bool
+    default: Optional[str]
+    primary_key: bool
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            if chave not in self._fields:
+                raise KeyError(chave)
+            return getattr(self, chave)
+        return tuple.__getitem__(self, chave)
+
+    def get(self, chave, padrao=None):
+        if chave in self._fields:
+            return getattr(self, chave)
+        return padrao
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return zip(self._fields, self)
+
+class SchemaCompacto(Mapping):
+    """Mapping somente leitura sobre um arquivo .schema mapeado em memória"""
+
+    def __init__(self, caminho: str, manter_tabelas: bool = True):
+        self.caminho = caminho
+        # Sem manter_tabelas, cada acesso decodifica o bloco direto do mapeamento
+        # e a memória do processo não cresce com as tabelas lidas
+        self.manter_tabelas = manter_tabelas
+        with open(caminho, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIA)] != MAGIA:
+            self._mmap.close()
+            raise ValueError(f"Arquivo não está no formato compacto: {caminho}")
+
+        inicio_cabecalho = len(MAGIA) + 4
+        (tamanho_cabecalho,) = struct.unpack("<I", self._mmap[len(MAGIA):inicio_cabecalho])
+        cabecalho = json.loads(self._mmap[inicio_cabecalho:inicio_cabecalho + tamanho_cabecalho])
+
+        self.hash = cabecalho["hash"]
+        self._inicio_blocos = inicio_cabecalho + tamanho_cabecalho
+        self._tipos = [sys.intern(t) for t in cabecalho["tipos"]]
+        self._diretorio = {nome: (offset, tamanho) for nome, offset, tamanho in cabecalho["tabelas"]}
+        self._extras: Dict = cabecalho.get("extras", {})
+        self._diretorio_secoes = {nome: tuple(posicao) for nome, posicao in cabecalho.get("secoes", {}).items()}
+        self._tabelas: Dict[str, Dict] = {}
+        self._secoes: Dict[str, object] = {}
+
+    def _materializar(self, nome: str) -> Dict:
+        offset, tamanho = self._diretorio[nome]
+        inicio = self._inicio_blocos + offset
+        info = json.loads(self._mmap[inicio:inicio + tamanho])
+        tipos = self._tipos
+        info["colunas"] = [
+            Coluna(sys.intern(c[0]), tipos[c[1]], bool(c[2] & FLAG_NULLABLE), c[3], bool(c[2] & FLAG_PRIMARY_KEY))
+            for c in info["colunas"]
+        ]
+        return info
+
+    def __getitem__(self, nome: str):
+        if nome in self._extras:
+            return self._extras[nome]
+        tabela = self._tabelas.get(nome)
+        if tabela is None:
+            if nome not in self._diretorio:
+                raise KeyError(nome)
+            tabela = self._materializar(nome)
+            if self.manter_tabelas:
+                self._tabelas[nome] = tabela
+        return tabela
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._diretorio
+        yield from self._extras
+
+    def __len__(self) -> int:
+        return len(self._diretorio) + len(self._extras)
+
+    def __contains__(self, nome) -> bool:
+        return nome in self._diretorio or nome in self._extras
+
+    @property
+    def tabelas_materializadas(self) -> int:
+        """Quantidade de tabelas já convertidas em objetos Python"""
+        return len(self._tabelas)
+
+    def secao(self, nome: str):
+        """Conteúdo de uma seção gravada junto do schema (None se não existir)"""
+        if nome in self._secoes:
+            return self._secoes[nome]
+        posicao = self._diretorio_secoes.get(nome)
+        if posicao is None:
+            return None
+        offset, tamanho = posicao
+        inicio = self._inicio_blocos + offset
+        conteudo = json.loads(self._mmap[inicio:inicio + tamanho])
+        self._secoes[nome] = conteudo
+        return conteudo
+
+    def tabela_avulsa(self, nome: str) -> Dict:
+        """Tabela decodificada sem ficar retida (para montar estruturas derivadas)"""
+        tabela = self._tabelas.get(nome)
+        if tabela is None:
+            if nome not in self._diretorio:
+                raise KeyError(nome)
+            tabela = self._materializar(nome)
+        return tabela
+
+    def bloco_bruto(self, nome: str) -> bytes:
+        """Bytes do bloco da tabela como gravados (índices de tipo relativos a self._tipos)"""
+        offset, tamanho = self._diretorio[nome]
+        inicio = self._inicio_blocos + offset
+        return self._mmap[inicio:inicio + tamanho]
+
+    def fechar(self):
+        self._mmap.close()
+
+def percorrer_tabelas(schema: Mapping) -> Iterator[Tuple[str, Dict]]:
+    """(nome, info) de cada tabela; num SchemaCompacto, sem reter as tabelas lidas"""
+    if isinstance(schema, SchemaCompacto):
+        for nome in schema._diretorio:
+            yield nome, schema.tabela_avulsa(nome)
+    else:
+        for nome, info in schema.items():
+            if not nome.startswith('_'):
+                yield nome, info
+
+def ler_tabela_avulsa(schema: Mapping, nome: str) -> Optional[Dict]:
+    """Uma tabela do schema (None se não existe); num SchemaCompacto, sem retê-la"""
+    if nome.startswith('_') or nome not in schema:
+        return None
+    if isinstance(schema, SchemaCompacto):
+        return schema.tabela_avulsa(nome)
+    return schema[nome]
+
+def _serializar(schema: Dict, hash_origem: str, secoes: Optional[Dict] = None,
+                anterior: Optional[SchemaCompacto] = None, reaproveitar: Iterable[str] = ()) -> bytes:
+    # Com um arquivo anterior, os blocos das tabelas em reaproveitar são copiados
+    # como estão; a lista de tipos começa pela dele para os índices continuarem valendo
+    tipos: List[str] = list(anterior._tipos) if anterior else []
+    indice_tipos: Dict[str, int] = {tipo: i for i, tipo in enumerate(tipos)}
+    reaproveitar = set(reaproveitar) if anterior else set()
+    diretorio = []
+    extras = {}
+    blocos = bytearray()
+
+    for nome, info in schema.items():
+        if nome.startswith('_'):
+            extras[nome] = info
+            continue
+
+        if nome in reaproveitar and nome in anterior._diretorio:
+            dados = anterior.bloco_bruto(nome)
+            diretorio.append([nome, len(blocos), len(dados)])
+            blocos += dados
+            continue
+
+        colunas = []
+        for col in info.get("colunas", []):
+            tipo = col["tipo"]
+            if tipo not in indice_tipos:
+                indice_tipos[tipo] = len(tipos)
+                tipos.append(tipo)
+            flags = (FLAG_NULLABLE if col.get("nullable") else 0) | (FLAG_PRIMARY_KEY if col.get("primary_key") else 0)
+            colunas.append([col["nome"], indice_tipos[tipo], flags, col.get("default")])
+
+        bloco = dict(info, colunas=colunas)
+        dados = json.dumps(bloco, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        diretorio.append([nome, len(blocos), len(dados)])
+        blocos += dados
+
+    diretorio_secoes = {}
+    for nome, conteudo in (secoes or {}).items():
+        dados = json.dumps(conteudo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        diretorio_secoes[nome] = [len(blocos), len(dados)]
+        blocos += dados
+
+    cabecalho = json.dumps({
+        "versao_formato": VERSAO_FORMATO,
+        "hash": hash_origem,
+        "tipos": tipos,
+        "tabelas": diretorio,
+        "extras": extras,
+        "secoes": diretorio_secoes,
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return MAGIA + struct.pack("<I", len(cabecalho)) + cabecalho + bytes(blocos)
+
+def salvar_schema_compacto(schema: Dict, caminho: str, hash_origem: Optional[str] = None,
+                           secoes: Optional[Dict] = None) -> str:
+    """
+    Grava o schema no formato compacto de forma atômica (arquivo temporário + rename)
+
+    Processos que já mapearam a versão anterior continuam lendo o arquivo antigo
+    até notarem a troca; nunca veem um arquivo pela metade.
+    """
+    if hash_origem is None:
+        conteudo = json.dumps(schema, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        hash_origem = hashlib.sha256(conteudo).hexdigest()
+
+    temporario = f"{caminho}.tmp{os.getpid()}"
+    with open(temporario, "wb") as f:
+        f.write(_serializar(schema, hash_origem, secoes))
+    os.replace(temporario, caminho)
+    return caminho
+
+def atualizar_schema_compacto(schema: Dict, caminho: str, inalteradas: Iterable[str],
+                              hash_origem: str, hash_anterior: Optional[str] = None,
+                              secoes: Optional[Dict] = None) -> int:
+    """
+    Regrava o schema compacto reaproveitando os blocos das tabelas inalteradas
+
+    Só as tabelas fora de inalteradas são serializadas de novo; as demais têm o
+    bloco copiado do arquivo atual. O arquivo continua sendo trocado inteiro
+    (temporário + rename) para quem já o mapeou. Sem arquivo anterior, ou se ele
+    não corresponde a hash_anterior, grava tudo como salvar_schema_compacto.
+
+    Returns:
+        Quantidade de tabelas reaproveitadas
+    """
+    inalteradas = set(inalteradas)
+    anterior = None
+    if os.path.exists(caminho):
+        try:
+            anterior = SchemaCompacto(caminho, manter_tabelas=False)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Schema compacto anterior ilegível ({caminho}): {e}")
+        else:
+            if hash_anterior and not anterior.hash.startswith(hash_anterior):
+                anterior.fechar()
+                anterior = None
+
+    try:
+        conteudo = _serializar(schema, hash_origem, secoes, anterior, inalteradas)
+        reaproveitadas = len(set(inalteradas) & set(anterior._diretorio)) if anterior else 0
+    finally:
+        if anterior is not None:
+            anterior.fechar()
+
+    temporario = f"{caminho}.tmp{os.getpid()}"
+    with open(temporario, "wb") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+    return reaproveitadas
+
+def converter_json_para_compacto(caminho_json: str, caminho_saida: Optional[str] = None,
+                                 construtor_secoes: Optional[Callable[[Dict], Dict]] = None) -> str:
+    """Converte um schema JSON existente para o formato compacto"""
+    if caminho_saida is None:
+        caminho_saida = os.path.splitext(caminho_json)[0] + EXTENSAO
+
+    with open(caminho_json, "rb") as f:
+        conteudo = f.read()
+    schema = json.loads(conteudo.decode("utf-8"))
+
+    secoes = construtor_secoes(schema) if construtor_secoes else None
+    return salvar_schema_compacto(schema, caminho_saida, hashlib.sha256(conteudo).hexdigest(), secoes)
+
+if __name__ == "__main__":
+    # Uso: python schema_compacto.py [slug ...]  (sem argumentos converte todos)
+    from schema_index import secoes_compartilhadas
+
+    schema_dir = "schemas"
+    slugs = sys.argv[1:] or [a[:-5] for a in os.listdir(schema_dir) if a.endswith(".json") and a.count(".") == 1]
+    for slug in slugs:
+        origem = os.path.join(schema_dir, f"{slug}.json")
+        destino = converter_json_para_compacto(origem, construtor_secoes=secoes_compartilhadas)
+        print(f"✅ {origem} ({os.path.getsize(origem)} bytes) → {destino} ({os.path.getsize(destino)} bytes)")
@@ -0,0 +1,252 @@
+"""
+Índice de relevância do schema para montar prompts menores
+
+Em vez de enviar as ~800 tabelas ao LLM, o índice ranqueia as tabelas mais
+relacionadas à pergunta a partir de radicais de 4 letras, que é o padrão de
+nomes do banco (enti_, pedi_, prod_...).
+
+Quem publica o schema compacto grava o índice (e os relacionamentos do grafo
+de joins) como seções do arquivo (secoes_compartilhadas); os workers os
+carregam sem percorrer as tabelas.
+"""
+
+import math
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from grafo_joins import obter_grafo, secao_relacionamentos
+from schema_compacto import percorrer_tabelas
+from schema_loader import (
+    carregar_schema,
+    estimar_tokens,
+    formatar_schema_para_prompt,
+    obter_versao_schema,
+    schema_registry,
+)
+
+# Quantidade padrão de tabelas enviadas ao prompt (0 desativa a poda)
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "12"))
+
+# Pesos por origem do termo
+PESO_CONTEXTO = 4.0    # contexto de _metadados.campos_chave (ex: 'clientes' → entidades)
+PESO_NOME_EXATO = 4.0  # palavra da pergunta igual ao nome da tabela
+PESO_NOME = 2.0        # n-grama do nome da tabela
+PESO_PREFIXO = 2.0     # prefixo das colunas (enti_, pedi_, prod_)
+PESO_DESCRICAO = 1.0
+PESO_COLUNA = 0.5      # demais partes do nome da coluna (_nume, _data, _tota)
+
+TAMANHO_RADICAL = 4
+
+# Tabelas do topo cujos vizinhos no grafo de joins sempre entram na seleção
+# (a tabela central da pergunta costuma perder para nomes parecidos)
+SCHEMA_VIZINHOS_DO_TOPO = int(os.getenv("SCHEMA_VIZINHOS_DO_TOPO", "3"))
+
+# Abaixo deste score a melhor tabela é palpite: entram também as tabelas de
+# _metadados.campos_chave (clientes, produtos, pedidos)
+SCHEMA_SCORE_MINIMO = float(os.getenv("SCHEMA_SCORE_MINIMO", "8"))
+
+# Incrementar quando a construção do índice mudar: seções antigas são ignoradas
+VERSAO_INDICE = 2
+
+PALAVRAS_IGNORADAS = {
+    'de', 'da', 'do', 'das', 'dos', 'que', 'por', 'para', 'com', 'sem', 'os', 'as',
+    'um', 'uma', 'em', 'no', 'na', 'nos', 'nas', 'mais', 'menos', 'qual', 'quais',
+    'quanto', 'quantos', 'quantas', 'mostre', 'liste', 'listar', 'todos', 'todas',
+    'use', 'select', 'from', 'where', 'join', 'group', 'order', 'count', 'tabela',
+    'top', 'sao', 'esta', 'estao', 'tem', 'abaixo', 'acima', 'dia', 'dias', 'mes',
+    'ano', 'ultimo', 'ultimos', 'ultima', 'ultimas', 'proximo', 'proximos',
+    # Período: meses e datas ficam no WHERE, não escolhem tabela ("marco" → marca)
+    'janeiro', 'fevereiro', 'marco', 'abril', 'maio', 'junho', 'julho', 'agosto',
+    'setembro', 'outubro', 'novembro', 'dezembro', 'hoje', 'ontem', 'amanha',
+    'semana', 'semanas', 'meses', 'anos', 'periodo', 'atual', 'passado', 'passada',
+    'anterior', 'corrente', 'trimestre', 'semestre', 'desde', 'ate', 'entre',
+    'este', 'deste', 'desta', 'neste', 'nesta', 'esse', 'essa', 'desse', 'dessa',
+}
+
+def _normalizar(texto: str) -> str:
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+def _palavras(texto: str) -> List[str]:
+    return [
+        p for p in re.findall(r'[a-z0-9]+', _normalizar(texto))
+        if p not in PALAVRAS_IGNORADAS and not p.isdigit()
+    ]
+
+def _radical(palavra: str) -> str:
+    return palavra[:TAMANHO_RADICAL]
+
+def _ngramas(nome: str) -> List[str]:
+    nome = _normalizar(nome).replace('_', '')
+    if len(nome) <= TAMANHO_RADICAL:
+        return [nome]
+    return [nome[i:i + TAMANHO_RADICAL] for i in range(len(nome) - TAMANHO_RADICAL + 1)]
+
+class IndiceSchema:
+    """Índice invertido radical → {tabela: peso}, ponderado por IDF"""
+
+    def __init__(self, schema: Optional[Dict] = None):
+        self.invertido: Dict[str, Dict[str, float]] = {}
+        self.nomes: Dict[str, str] = {}
+        self.tabelas_chave: List[str] = []
+        self.total_tabelas = 0
+        self.tokens_schema_completo = 0
+        if schema is not None:
+            self._indexar(schema)
+
+    def _indexar(self, schema: Dict):
+        self.total_tabelas = 0
+
+        # Num SchemaCompacto, as tabelas são lidas uma a uma sem ficar retidas
+        for tabela, info in percorrer_tabelas(schema):
+            self.total_tabelas += 1
+            self.nomes[_normalizar(tabela)] = tabela
+            for ngrama in _ngramas(tabela):
+                self._adicionar(ngrama, tabela, PESO_NOME)
+            for col in info.get('colunas', []):
+                partes = [p for p in _normalizar(col['nome']).split('_') if p]
+                if not partes:
+                    continue
+                self._adicionar(_radical(partes[0]), tabela, PESO_PREFIXO)
+                for parte in partes[1:]:
+                    self._adicionar(_radical(parte), tabela, PESO_COLUNA)
+            for palavra in _palavras(info.get('descricao', '')):
+                self._adicionar(_radical(palavra), tabela, PESO_DESCRICAO)
+
+        campos_chave = schema.get('_metadados', {}).get('campos_chave', {})
+        for contexto, info in campos_chave.items():
+            for tabela in info.get('tabelas', []):
+                if tabela in schema:
+                    self._adicionar(_radical(_normalizar(contexto)), tabela, PESO_CONTEXTO)
+                    if tabela not in self.tabelas_chave:
+                        self.tabelas_chave.append(tabela)
+
+        for postings in self.invertido.values():
+            idf = math.log(1 + self.total_tabelas / len(postings))
+            for tabela in postings:
+                postings[tabela] *= idf
+
+    def _adicionar(self, termo: str, tabela: str, peso: float):
+        if len(termo) < 3:
+            return
+        postings = self.invertido.setdefault(termo, {})
+        if peso > postings.get(tabela, 0.0):
+            postings[tabela] = peso
+
+    def exportar(self) -> Dict:
+        """Representação serializável do índice (seção do schema compacto)"""
+        return {
+            'versao': VERSAO_INDICE,
+            'invertido': self.invertido,
+            'nomes': self.nomes,
+            'tabelas_chave': self.tabelas_chave,
+            'total_tabelas': self.total_tabelas,
+            'tokens_schema_completo': self.tokens_schema_completo,
+        }
+
+    @classmethod
+    def de_secao(cls, dados: Optional[Dict]) -> Optional['IndiceSchema']:
+        """Reconstrói o índice exportado (None se ausente ou de outra versão)"""
+        if not dados or dados.get('versao') != VERSAO_INDICE:
+            return None
+        indice = cls()
+        indice.invertido = dados['invertido']
+        indice.nomes = dados['nomes']
+        indice.tabelas_chave = dados['tabelas_chave']
+        indice.total_tabelas = dados['total_tabelas']
+        indice.tokens_schema_completo = dados['tokens_schema_completo']
+        return indice
+
+    def buscar(self, pergunta: str, k: int = SCHEMA_TOP_K) -> List[Tuple[str, float]]:
+        """Retorna as k tabelas mais relevantes para a pergunta com seus scores"""
+        scores: Dict[str, float] = {}
+        for palavra in set(_palavras(pergunta)):
+            for candidato in (palavra, palavra.rstrip('s')):
+                tabela = self.nomes.get(candidato)
+                if tabela:
+                    scores[tabela] = scores.get(tabela, 0.0) + PESO_NOME_EXATO
+                    break
+            for tabela, peso in self.invertido.get(_radical(palavra), {}).items():
+                scores[tabela] = scores.get(tabela, 0.0) + peso
+
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+_indices: Dict[str, Dict] = {}
+_lock_indices = threading.Lock()
+
+def obter_indice(slug: str) -> Optional[IndiceSchema]:
+    """Retorna o índice do slug, reconstruindo-o apenas quando a versão do schema muda"""
+    versao = obter_versao_schema(slug)
+    if versao is None:
+        return None
+
+    entrada = _indices.get(slug)
+    if entrada and entrada['versao'] == versao:
+        return entrada['indice']
+
+    with _lock_indices:
+        entrada = _indices.get(slug)
+        if entrada and entrada['versao'] == versao:
+            return entrada['indice']
+
+        schema = carregar_schema(slug)
+        secao = schema.secao('indice') if hasattr(schema, 'secao') else None
+        indice = IndiceSchema.de_secao(secao)
+        if indice is not None:
+            origem = "carregado do schema compartilhado"
+        else:
+            # Sem seção (JSON ou arquivo antigo): percorre as tabelas sem retê-las
+            indice = IndiceSchema(schema)
+            indice.tokens_schema_completo = estimar_tokens(formatar_schema_para_prompt(schema))
+            origem = "criado"
+        _indices[slug] = {'versao': versao, 'indice': indice}
+        print(f"🗂️ Índice de schema {origem}: {slug} ({len(indice.invertido)} termos)")
+        return indice
+
+def secoes_compartilhadas(schema: Dict) -> Dict:
+    """Seções gravadas no schema compacto para os workers não reconstruírem o índice e o grafo"""
+    indice = IndiceSchema(schema)
+    indice.tokens_schema_completo = estimar_tokens(formatar_schema_para_prompt(schema))
+    return {'indice': indice.exportar(), 'relacionamentos': secao_relacionamentos(schema)}
+
+schema_registry.construtor_secoes = secoes_compartilhadas
+
+def _sem_repetir(tabelas: List[str]) -> List[str]:
+    return list(dict.fromkeys(tabelas))
+
+def _com_vizinhos(slug: str, tabelas: List[str], k: int) -> List[str]:
+    """Vizinhos no grafo de joins das primeiras tabelas logo após elas (fora do corte de k)"""
+    grafo = obter_grafo(slug)
+    if grafo is None or SCHEMA_VIZINHOS_DO_TOPO <= 0:
+        return tabelas[:k]
+    topo = tabelas[:SCHEMA_VIZINHOS_DO_TOPO]
+    obrigatorias = _sem_repetir(topo + [a.destino for t in topo for a in grafo.vizinhos.get(t, [])])
+    return _sem_repetir(obrigatorias + tabelas)[:max(k, len(obrigatorias))]
+
+def selecionar_tabelas(slug: str, pergunta: str, k: int = SCHEMA_TOP_K) -> Optional[List[str]]:
+    """
+    Seleciona as tabelas relevantes para a pergunta
+
+    As k mais bem pontuadas, mais os vizinhos no grafo de joins das primeiras
+    (SCHEMA_VIZINHOS_DO_TOPO); com a melhor abaixo de SCHEMA_SCORE_MINIMO, as
+    tabelas de campos_chave entram à frente.
+
+    Returns:
+        Lista de tabelas ou None quando a poda está desativada (k <= 0),
+        o índice não existe ou nenhuma tabela foi encontrada
+    """
+    if k <= 0:
+        return None
+    indice = obter_indice(slug)
+    if indice is None:
+        return None
+    resultado = indice.buscar(pergunta, k)
+    if not resultado:
+        return None
+    tabelas = [tabela for tabela, _ in resultado]
+    if resultado[0][1] < SCHEMA_SCORE_MINIMO:
+        tabelas = _sem_repetir(indice.tabelas_chave + tabelas)
+    return _com_vizinhos(slug, tabelas, k)
@@ -2,9 +2,241 @@
 Função para carregar schema
 """
 
+import hashlib
 import json
 import os
-from typing import Dict, Optional
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from schema_compacto import EXTENSAO, SchemaCompacto, converter_json_para_compacto, percorrer_tabelas
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Com vários workers (uvicorn --workers N), cada processo só mapeia o arquivo
+# compacto em modo leitura; o JSON é decodificado uma única vez por quem publica
+SCHEMA_COMPARTILHADO = os.getenv("SCHEMA_COMPARTILHADO", "false").lower() in ("1", "true", "sim")
+
+class SchemaRegistry:
+    """
+    Registro de schemas em memória, compartilhado por todas as threads do processo.
+
+    Cada slug é lido e decodificado uma única vez. Quando existe um arquivo no
+    formato compacto (schema_compacto) pelo menos tão novo quanto o JSON, ele é
+    preferido e as tabelas são materializadas sob demanda. A entrada é validada pelo
+    mtime/tamanho do arquivo e, quando estes mudam, pelo hash do conteúdo; só um
+    conteúdo diferente provoca nova decodificação. A troca da entrada é atômica,
+    então leitores concorrentes veem sempre a versão antiga ou a nova, completas.
+
+    Ouvintes registrados com adicionar_ouvinte são avisados a cada troca de
+    versão, com as tabelas alteradas segundo o manifesto do gerar_schema
+    (ou None quando a diferença não é conhecida).
+
+    No modo compartilhado os processos usam apenas o arquivo compacto: o mesmo
+    mapeamento de páginas serve a todos os workers, as tabelas não ficam retidas
+    e o índice vem pronto nas seções do arquivo. Se o compacto estiver ausente ou
+    mais antigo que o JSON, o primeiro processo a obter o lock o publica
+    (construtor_secoes monta as seções) e os demais apenas o mapeiam.
+
+    O dicionário devolvido é compartilhado: quem chama não deve alterá-lo.
+    """
+
+    def __init__(self, schema_dir: str = "schemas", compartilhado: bool = SCHEMA_COMPARTILHADO):
+        self.schema_dir = schema_dir
+        self.compartilhado = compartilhado
+        self.construtor_secoes: Optional[Callable[[Dict], Dict]] = None
+        self._entradas: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._locks_slug: Dict[str, threading.Lock] = {}
+        self._ouvintes: List[Callable] = []
+        self.hits = 0
+        self.misses = 0
+        self.recargas = 0
+        self.tempo_carga_total = 0.0
+
+    def _resolver_arquivo(self, slug: str) -> Tuple[str, Optional[os.stat_result]]:
+        """Escolhe o arquivo do slug, preferindo o compacto quando está atualizado"""
+        caminho_json = os.path.join(self.schema_dir, f"{slug}.json")
+        caminho_compacto = os.path.join(self.schema_dir, f"{slug}{EXTENSAO}")
+
+        stats = {}
+        for caminho in (caminho_compacto, caminho_json):
+            try:
+                stats[caminho] = os.stat(caminho)
+            except FileNotFoundError:
+                stats[caminho] = None
+
+        stat_compacto, stat_json = stats[caminho_compacto], stats[caminho_json]
+        if stat_compacto and (stat_json is None or stat_compacto.st_mtime_ns >= stat_json.st_mtime_ns):
+            return caminho_compacto, stat_compacto
+        if self.compartilhado and stat_json is not None:
+            return caminho_compacto, self._publicar_compacto(caminho_json, caminho_compacto)
+        return caminho_json, stat_json
+
+    def _publicar_compacto(self, caminho_json: str, caminho_compacto: str) -> os.stat_result:
+        """Gera o compacto a partir do JSON, uma vez entre todos os processos"""
+        with open(f"{caminho_compacto}.lock", "w") as trava:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                # Outro worker pode ter publicado enquanto esperávamos o lock
+                stat_json = os.stat(caminho_json)
+                try:
+                    stat_compacto = os.stat(caminho_compacto)
+                    if stat_compacto.st_mtime_ns >= stat_json.st_mtime_ns:
+                        return stat_compacto
+                except FileNotFoundError:
+                    pass
+                converter_json_para_compacto(caminho_json, caminho_compacto, self.construtor_secoes)
+                print(f"📦 Schema compacto publicado: {caminho_compacto}")
+                return os.stat(caminho_compacto)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(trava, fcntl.LOCK_UN)
+
+    def _lock_do_slug(self, slug: str) -> threading.Lock:
+        with self._lock:
+            if slug not in self._locks_slug:
+                self._locks_slug[slug] = threading.Lock()
+            return self._locks_slug[slug]
+
+    def adicionar_ouvinte(self, ouvinte: Callable[[str, str, str, Optional[Set[str]]], None]):
+        """Registra ouvinte(slug, versao_anterior, versao_nova, tabelas_alteradas)"""
+        self._ouvintes.append(ouvinte)
+
+    def _tabelas_alteradas(self, slug: str, versao_anterior: str, versao_nova: str) -> Optional[Set[str]]:
+        """Tabelas alteradas entre as versões segundo schemas/<slug>.manifest.json"""
+        caminho = os.path.join(self.schema_dir, f"{slug}.manifest.json")
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                manifesto = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if manifesto.get('versao_anterior') != versao_anterior or manifesto.get('versao_atual') != versao_nova:
+            return None
+
+        alteradas = set(manifesto.get('adicionadas', []))
+        alteradas.update(manifesto.get('removidas', []), manifesto.get('alteradas', []))
+        alteradas.update(manifesto.get('estatisticas_alteradas', []))
+        if manifesto.get('metadados_alterados'):
+            alteradas.add('_metadados')
+        return alteradas
+
+    def _notificar(self, slug: str, entrada_anterior: Dict, versao_nova: str):
+        versao_anterior = entrada_anterior['versao']
+        alteradas = self._tabelas_alteradas(slug, versao_anterior, versao_nova)
+        for ouvinte in self._ouvintes:
+            try:
+                ouvinte(slug, versao_anterior, versao_nova, alteradas)
+            except Exception as e:
+                print(f"⚠️ Erro ao notificar troca de schema ({slug}): {e}")
+
+    def _entrada_valida(self, entrada: Optional[Dict], caminho: str, stat) -> bool:
+        return (
+            entrada is not None
+            and entrada['caminho'] == caminho
+            and entrada['mtime'] == stat.st_mtime_ns
+            and entrada['tamanho'] == stat.st_size
+        )
+
+    def obter(self, slug: str) -> Optional[Dict]:
+        """Retorna o schema do slug, recarregando apenas se o arquivo mudou"""
+        caminho, stat = self._resolver_arquivo(slug)
+        if stat is None:
+            print(f"⚠️ Schema não encontrado: {caminho}")
+            return None
+
+        entrada = self._entradas.get(slug)
+        if self._entrada_valida(entrada, caminho, stat):
+            self.hits += 1
+            return entrada['schema']
+
+        with self._lock_do_slug(slug):
+            # Outra thread pode ter recarregado enquanto esperávamos o lock
+            entrada = self._entradas.get(slug)
+            if self._entrada_valida(entrada, caminho, stat):
+                self.hits += 1
+                return entrada['schema']
+
+            inicio = time.perf_counter()
+            if caminho.endswith(EXTENSAO):
+                schema = SchemaCompacto(caminho, manter_tabelas=not self.compartilhado)
+                hash_conteudo = schema.hash
+            else:
+                with open(caminho, "rb") as f:
+                    conteudo = f.read()
+                schema = None
+                hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+
+            if entrada is not None and entrada['hash'] == hash_conteudo:
+                # Arquivo tocado sem mudança de conteúdo: mantém o schema decodificado
+                self._entradas[slug] = dict(entrada, caminho=caminho, mtime=stat.st_mtime_ns, tamanho=stat.st_size)
+                self.hits += 1
+                return entrada['schema']
+
+            if schema is None:
+                schema = json.loads(conteudo.decode("utf-8"))
+            duracao = time.perf_counter() - inicio
+
+            if entrada is not None:
+                self._notificar(slug, entrada, hash_conteudo[:12])
+
+            self._entradas[slug] = {
+                'schema': schema,
+                'caminho': caminho,
+                'mtime': stat.st_mtime_ns,
+                'tamanho': stat.st_size,
+                'hash': hash_conteudo,
+                'versao': hash_conteudo[:12],
+                'carregado_em': time.time(),
+                'tempo_carga': duracao,
+            }
+            self.misses += 1
+            if entrada is not None:
+                self.recargas += 1
+            self.tempo_carga_total += duracao
+            print(f"✅ Schema carregado: {slug} ({len(schema)} tabelas, {duracao * 1000:.1f} ms)")
+            return schema
+
+    def versao(self, slug: str) -> Optional[str]:
+        """Versão (hash do conteúdo) do schema atualmente carregado para o slug"""
+        if self.obter(slug) is None:
+            return None
+        return self._entradas[slug]['versao']
+
+    def invalidar(self, slug: Optional[str] = None):
+        """Descarta a entrada de um slug (ou de todos) para forçar nova leitura"""
+        with self._lock:
+            if slug is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(slug, None)
+
+    def get_stats(self) -> Dict:
+        """Retorna estatísticas do registro"""
+        total = self.hits + self.misses
+        return {
+            'modo': 'compartilhado' if self.compartilhado else 'processo',
+            'slugs_carregados': {
+                slug: {
+                    'versao': e['versao'],
+                    'formato': 'compacto' if isinstance(e['schema'], SchemaCompacto) else 'json',
+                    'tempo_carga_ms': round(e['tempo_carga'] * 1000, 2),
+                }
+                for slug, e in self._entradas.items()
+            },
+            'hits': self.hits,
+            'misses': self.misses,
+            'recargas': self.recargas,
+            'hit_rate': self.hits / total if total else 0.0,
+            'tempo_carga_total_ms': round(self.tempo_carga_total * 1000, 2),
+        }
+
+# Instância global do registro de schemas
+schema_registry = SchemaRegistry()
 
 def carregar_schema(slug: str) -> Optional[Dict]:
     """
@@ -16,18 +248,8 @@ def carregar_schema(slug: str) -> Optional[Dict]:
     Returns:
         Dict com schema ou None se não encontrado
     """
-    caminho = f"schemas/{slug}.json"
-    
     try:
-        if not os.path.exists(caminho):
-            print(f"⚠️ Schema não encontrado: {caminho}")
-            return None
-            
-        with open(caminho, "r", encoding="utf-8") as f:
-            schema = json.load(f)
-            print(f"✅ Schema carregado: {slug} ({len(schema)} tabelas)")
-            return schema
-            
+        return schema_registry.obter(slug)
     except json.JSONDecodeError as e:
         print(f"❌ Erro ao decodificar JSON: {e}")
         return None
@@ -35,12 +257,19 @@ def carregar_schema(slug: str) -> Optional[Dict]:
         print(f"❌ Erro ao carregar schema: {e}")
         return None
 
+def obter_versao_schema(slug: str) -> Optional[str]:
+    """Retorna a versão do schema carregado para o slug (None se não existir)"""
+    try:
+        return schema_registry.versao(slug)
+    except Exception:
+        return None
+
 def listar_schemas_disponiveis() -> list:
     """
     Lista todos os schemas disponíveis no diretório schemas/
     
     Returns:
-        Lista com nomes dos schemas (sem extensão .json)
+        Lista com nomes dos schemas (sem extensão .json/.schema)
     """
     schemas_dir = "schemas"
     
@@ -49,23 +278,99 @@ def listar_schemas_disponiveis() -> list:
     
     schemas = []
     for arquivo in os.listdir(schemas_dir):
-        if arquivo.endswith('.json'):
-            schemas.append(arquivo[:-5])  # Remove .json
+        nome, extensao = os.path.splitext(arquivo)
+        # Ignora manifestos (<slug>.manifest.json) e temporários
+        if extensao in ('.json', EXTENSAO) and '.' not in nome and nome not in schemas:
+            schemas.append(nome)
     
     return schemas
 
-def formatar_schema_para_prompt(schema: Dict) -> str:
-    """
-    Formata schema para uso em prompts do LLM incluindo metadados
-    """
-    if not schema:
-        return "Nenhum schema disponível"
-    
+def estimar_tokens(texto: str) -> int:
+    """Estimativa grosseira de tokens (~4 caracteres por token)"""
+    return (len(texto) + 3) // 4
+
+CAMPOS_IMPORTANTES = ['nome', 'desc', 'data', 'valor', 'prec', 'quan']
+
+# Tabelas a partir desse número de linhas exigem filtro indexado e LIMIT
+LIMIAR_TABELA_GRANDE = int(os.getenv("LIMIAR_TABELA_GRANDE", "1000000"))
+
+def _formatar_linhas(linhas: int) -> str:
+    """Contagem arredondada (2 algarismos) para o prompt não mudar a cada ANALYZE"""
+    if linhas < 1000:
+        return str(linhas)
+    if linhas < 1_000_000:
+        return f"{float(f'{linhas / 1000:.2g}'):g} mil"
+    return f"{float(f'{linhas / 1_000_000:.2g}'):g} mi"
+
+def colunas_indexadas_info(info: Dict) -> List[str]:
+    """Colunas indexadas da tabela, colunas líderes dos índices primeiro"""
+    indices = (info.get('estatisticas') or {}).get('indices', [])
+    colunas: List[str] = []
+    for posicao in range(max((len(i['colunas']) for i in indices), default=0)):
+        for indice in indices:
+            if posicao < len(indice['colunas']) and indice['colunas'][posicao] not in colunas:
+                colunas.append(indice['colunas'][posicao])
+    return colunas
+
+def resumo_estatisticas(info: Dict) -> Optional[str]:
+    """Resumo das estatísticas da tabela usado no prompt (None se não houver)"""
+    estatisticas = info.get('estatisticas')
+    if not estatisticas:
+        return None
+
+    partes = []
+    if estatisticas.get('linhas') is not None:
+        partes.append(f"~{_formatar_linhas(estatisticas['linhas'])} linhas")
+    indexadas = colunas_indexadas_info(info)
+    if indexadas:
+        partes.append(f"índices: {', '.join(indexadas)}")
+    valores = [
+        f"{coluna} ∈ {{{', '.join(map(str, estatistica['valores_comuns']))}}}"
+        for coluna, estatistica in sorted(estatisticas.get('colunas', {}).items())
+        if estatistica.get('valores_comuns')
+    ]
+    if valores:
+        partes.append(f"valores: {'; '.join(valores)}")
+    return " | ".join(partes) or None
+
+def obter_estatisticas_tabela(slug: str, tabela: str) -> Optional[Dict]:
+    """Estatísticas (linhas, tamanho, índices, colunas) de uma tabela do slug"""
+    schema = carregar_schema(slug)
+    if not schema or tabela not in schema or tabela.startswith('_'):
+        return None
+    return schema[tabela].get('estatisticas')
+
+def colunas_indexadas(slug: str, tabela: str) -> List[str]:
+    """Colunas indexadas de uma tabela do slug (vazio se desconhecido)"""
+    schema = carregar_schema(slug)
+    if not schema or tabela not in schema or tabela.startswith('_'):
+        return []
+    return colunas_indexadas_info(schema[tabela])
+
+def tabela_grande(slug: str, tabela: str, limiar: int = LIMIAR_TABELA_GRANDE) -> bool:
+    """True se a tabela tem pelo menos 'limiar' linhas estimadas"""
+    estatisticas = obter_estatisticas_tabela(slug, tabela) or {}
+    linhas = estatisticas.get('linhas')
+    return linhas is not None and linhas >= limiar
+
+def montar_dicas_tabelas_grandes(slug: str, tabelas: Optional[List[str]]) -> str:
+    """Bloco de prompt alertando sobre tabelas grandes entre as selecionadas"""
+    grandes = [t for t in tabelas or [] if tabela_grande(slug, t)]
+    if not grandes:
+        return ""
+    linhas = ["\n\n⚠️ TABELAS GRANDES (filtre por colunas indexadas e use LIMIT):"]
+    for tabela in grandes:
+        indexadas = colunas_indexadas(slug, tabela)
+        sufixo = f" → filtre por {', '.join(indexadas[:4])}" if indexadas else ""
+        linhas.append(f"   - {tabela}{sufixo}")
+    return "\n".join(linhas)
+
+def _linhas_cabecalho_schema(metadados: Dict) -> List[str]:
+    """Cabeçalho do schema no prompt: campos chave e exemplos dos metadados"""
     linhas = []
     linhas.append("=== SCHEMA DO BANCO DE DADOS ===\n")
     
     # Adicionar metadados se existirem
-    metadados = schema.get('_metadados', {})
     if metadados:
         campos_chave = metadados.get('campos_chave', {})
         exemplos = metadados.get('exemplos_consultas', {})
@@ -87,35 +392,223 @@ def formatar_schema_para_prompt(schema: Dict) -> str:
         linhas.append("\n" + "="*50)
     
     linhas.append("\n📊 TABELAS DISPONÍVEIS:")
+    return linhas
+
+def _linhas_tabela(tabela: str, info: Dict) -> List[str]:
+    """Bloco de uma tabela no prompt: PKs, campos importantes e demais campos"""
+    colunas = info.get('colunas', [])
+    linhas = [f"\n🔹 {tabela}:"]
+    
+    resumo = resumo_estatisticas(info)
+    if resumo:
+        linhas.append(f"   📈 {resumo}")
+    
+    # Separar colunas por tipo
+    pks = [col for col in colunas if col.get('primary_key')]
+    importantes = [col for col in colunas if any(palavra in col['nome'].lower() 
+                  for palavra in CAMPOS_IMPORTANTES)]
+    ja_listadas = {col['nome'] for col in pks} | {col['nome'] for col in importantes}
+    outras = [col for col in colunas if col['nome'] not in ja_listadas]
+    
+    if pks:
+        linhas.append("   🔑 Chaves primárias:")
+        for col in pks:
+            linhas.append(f"      - {col['nome']} ({col['tipo']})")
+    
+    if importantes:
+        linhas.append("   ⭐ Campos importantes:")
+        for col in importantes:
+            linhas.append(f"      - {col['nome']} ({col['tipo']})")
+    
+    if len(outras) <= 10:  # Mostrar todas se poucas
+        linhas.append("   📝 Outros campos:")
+        for col in outras:
+            linhas.append(f"      - {col['nome']} ({col['tipo']})")
+    else:  # Resumir se muitas
+        linhas.append(f"   📝 Outros campos ({len(outras)}): {', '.join([col['nome'] for col in outras[:5]])}...")
+    
+    return linhas
+
+def formatar_schema_para_prompt(schema: Dict, tabelas: Optional[List[str]] = None) -> str:
+    """
+    Formata schema para uso em prompts do LLM incluindo metadados
+
+    Args:
+        schema: Schema carregado
+        tabelas: Se informado, apenas essas tabelas são incluídas (na ordem dada)
+    """
+    if not schema:
+        return "Nenhum schema disponível"
+    
+    linhas = _linhas_cabecalho_schema(schema.get('_metadados', {}))
+    
+    if tabelas is None:
+        # Todas as tabelas (sem metadados), sem reter as do schema compacto
+        for tabela, info in percorrer_tabelas(schema):
+            linhas.extend(_linhas_tabela(tabela, info))
+        return "\n".join(linhas)
+    
+    for tabela in tabelas:
+        info = schema.get(tabela)
+        if info is not None:
+            linhas.extend(_linhas_tabela(tabela, info))
+    
+    return "\n".join(linhas)
+
+def formatar_metadados_para_prompt(metadados: Dict) -> str:
+    """Bloco de METADADOS IMPORTANTES anexado ao template de geração de SQL"""
+    exemplos_consultas = metadados.get('exemplos_consultas', {})
+    campos_chave = metadados.get('campos_chave', {})
+    
+    partes = ["\n\nMETADADOS IMPORTANTES:\n"]
+    
+    # Adicionar exemplos de consultas
+    if exemplos_consultas:
+        partes.append("EXEMPLOS DE CONSULTAS:\n")
+        for categoria, exemplos in exemplos_consultas.items():
+            partes.append(f"- {categoria.upper()}:\n")
+            for exemplo in exemplos:
+                partes.append(f"  * {exemplo}\n")
+    
+    # Adicionar campos chave
+    if campos_chave:
+        partes.append("\nCAMPOS CHAVE POR CONTEXTO:\n")
+        for contexto, info in campos_chave.items():
+            partes.append(f"- {contexto.upper()}: tabelas {info['tabelas']}, campos {info.get('campos_identificacao', [])}\n")
     
-    for tabela, info in schema.items():
-        if tabela.startswith('_'):  # Pular metadados
+    # Adicionar informações específicas sobre tipos de entidade
+    partes.append("\nINFORMAÇÕES ESPECÍFICAS:\n")
+    partes.append("- Campo enti_tipo_enti na tabela entidades classifica tipos:\n")
+    partes.append("  * 'CL' = Clientes\n")
+    partes.append("  * 'VE' = Vendedores\n")
+    partes.append("  * Para agrupar por tipo: GROUP BY enti_tipo_enti\n")
+    
+    return "".join(partes)
+
+class CacheFragmentosPrompt:
+    """
+    Fragmentos de prompt já renderizados, por slug e versão do schema.
+
+    Os blocos de cada tabela, o cabeçalho e o bloco de metadados são
+    construídos uma vez por versão; montar um prompt vira um join de strings.
+    Uma nova versão do schema descarta todos os fragmentos do slug.
+    """
+
+    def __init__(self):
+        self._fragmentos: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obter(self, slug: str, versao: str, chave: str, construtor: Callable[[], str]) -> str:
+        entrada = self._fragmentos.get(slug)
+        if entrada is None or entrada['versao'] != versao:
+            with self._lock:
+                entrada = self._fragmentos.get(slug)
+                if entrada is None or entrada['versao'] != versao:
+                    entrada = {'versao': versao, 'itens': {}}
+                    self._fragmentos[slug] = entrada
+
+        itens = entrada['itens']
+        fragmento = itens.get(chave)
+        if fragmento is None:
+            fragmento = construtor()
+            itens[chave] = fragmento
+            self.misses += 1
+        else:
+            self.hits += 1
+        return fragmento
+
+    def migrar_versao(self, slug: str, versao_anterior: str, versao_nova: str, alteradas: Optional[Set[str]]):
+        """
+        Ouvinte do SchemaRegistry: leva para a nova versão os fragmentos das
+        tabelas que não mudaram. Sem a lista de alteradas, descarta tudo.
+        """
+        with self._lock:
+            entrada = self._fragmentos.get(slug)
+            if entrada is None or entrada['versao'] != versao_anterior:
+                return
+            if alteradas is None:
+                self._fragmentos.pop(slug, None)
+                return
+            # Fragmentos '_' (cabeçalho, metadados) são baratos e sempre reconstruídos
+            itens = {
+                chave: fragmento for chave, fragmento in entrada['itens'].items()
+                if chave not in alteradas and not chave.startswith('_')
+            }
+            self._fragmentos[slug] = {'versao': versao_nova, 'itens': itens}
+            print(f"♻️ Fragmentos de prompt migrados: {slug} ({len(itens)} mantidos, {len(alteradas)} alterados)")
+
+    def invalidar(self, slug: Optional[str] = None, chaves: Optional[List[str]] = None):
+        """Descarta fragmentos de um slug (todos ou só as chaves informadas)"""
+        with self._lock:
+            if slug is None:
+                self._fragmentos.clear()
+            elif chaves is None:
+                self._fragmentos.pop(slug, None)
+            elif slug in self._fragmentos:
+                for chave in chaves:
+                    self._fragmentos[slug]['itens'].pop(chave, None)
+
+    def get_stats(self) -> Dict:
+        """Retorna estatísticas do cache de fragmentos"""
+        return {
+            'slugs': {slug: len(e['itens']) for slug, e in self._fragmentos.items()},
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+# Instância global do cache de fragmentos
+fragmentos_prompt = CacheFragmentosPrompt()
+schema_registry.adicionar_ouvinte(fragmentos_prompt.migrar_versao)
+
+def montar_cabecalho_schema(slug: str) -> str:
+    """Cabeçalho do schema (campos chave e exemplos) já renderizado para a versão atual"""
+    schema = carregar_schema(slug)
+    if not schema:
+        return ""
+    return fragmentos_prompt.obter(
+        slug, obter_versao_schema(slug), '_cabecalho',
+        lambda: "\n".join(_linhas_cabecalho_schema(schema.get('_metadados', {})))
+    )
+
+def montar_blocos_tabelas(slug: str, tabelas: Optional[List[str]] = None) -> List[str]:
+    """Blocos já renderizados das tabelas (todas se tabelas=None), na ordem dada"""
+    schema = carregar_schema(slug)
+    if not schema:
+        return []
+    versao = obter_versao_schema(slug)
+    
+    if tabelas is None:
+        tabelas = [t for t in schema if not t.startswith('_')]
+    
+    blocos = []
+    for tabela in tabelas:
+        if tabela.startswith('_') or tabela not in schema:
             continue
-            
-        colunas = info.get('colunas', [])
-        linhas.append(f"\n🔹 {tabela}:")
-        
-        # Separar colunas por tipo
-        pks = [col for col in colunas if col.get('primary_key')]
-        importantes = [col for col in colunas if any(palavra in col['nome'].lower() 
-                      for palavra in ['nome', 'desc', 'data', 'valor', 'prec', 'quan'])]
-        outras = [col for col in colunas if col not in pks and col not in importantes]
-        
-        if pks:
-            linhas.append("   🔑 Chaves primárias:")
-            for col in pks:
-                linhas.append(f"      - {col['nome']} ({col['tipo']})")
-        
-        if importantes:
-            linhas.append("   ⭐ Campos importantes:")
-            for col in importantes:
-                linhas.append(f"      - {col['nome']} ({col['tipo']})")
-        
-        if len(outras) <= 10:  # Mostrar todas se poucas
-            linhas.append("   📝 Outros campos:")
-            for col in outras:
-                linhas.append(f"      - {col['nome']} ({col['tipo']})")
-        else:  # Resumir se muitas
-            linhas.append(f"   📝 Outros campos ({len(outras)}): {', '.join([col['nome'] for col in outras[:5]])}...")
-    
-    return "\n".join(linhas)
\ No newline at end of file
+        blocos.append(fragmentos_prompt.obter(
+            slug, versao, tabela,
+            lambda: "\n".join(_linhas_tabela(tabela, schema[tabela]))
+        ))
+    return blocos
+
+def montar_schema_prompt(slug: str, tabelas: Optional[List[str]] = None) -> str:
+    """
+    Versão memoizada de formatar_schema_para_prompt para um slug
+
+    Produz o mesmo texto, mas reaproveita os blocos já renderizados
+    para a versão atual do schema.
+    """
+    if not carregar_schema(slug):
+        return "Nenhum schema disponível"
+    return "\n".join([montar_cabecalho_schema(slug)] + montar_blocos_tabelas(slug, tabelas))
+
+def montar_metadados_prompt(slug: str) -> str:
+    """Versão memoizada de formatar_metadados_para_prompt para um slug"""
+    schema = carregar_schema(slug)
+    if not schema:
+        return ""
+    return fragmentos_prompt.obter(
+        slug, obter_versao_schema(slug), '_contexto_metadados',
+        lambda: formatar_metadados_para_prompt(schema.get('_metadados', {}))
+    )
@@ -1,78 +1,243 @@
 from langchain.prompts import ChatPromptTemplate
-from langchain.chat_models import init_chat_model
 from langchain_core.output_parsers import StrOutputParser
-from schema_loader import carregar_schema, formatar_schema_para_prompt
-from prompt_sql import TEMPLATE_SQL
-from dotenv import load_dotenv
+from schema_loader import (
+    carregar_schema,
+    estimar_tokens,
+    montar_blocos_tabelas,
+    montar_cabecalho_schema,
+    montar_dicas_tabelas_grandes,
+    montar_metadados_prompt,
+    obter_versao_schema,
+)
+from montador_prompt import (
+    PRIORIDADE_EXEMPLOS,
+    PRIORIDADE_JOINS,
+    PRIORIDADE_TABELAS,
+    MontadorPrompt,
+    resumo_relatorio,
+)
+from cache_manager import sql_cache
+from sql_templates import buscar_sql_por_template
+from schema_index import obter_indice, selecionar_tabelas
+from grafo_joins import montar_dicas_join
+from concorrencia import limitador
+from provedor_modelo import obter_modelo
+from prompt_sql import TEMPLATE_SQL_PERGUNTA, TEMPLATE_SQL_SISTEMA
 import re
+import threading
+from typing import Optional, Tuple
 
-load_dotenv()
+# Origem do SQL devolvido pela geração: só o que veio do LLM é gravado no cache
+ORIGEM_CACHE = 'cache'
+ORIGEM_TEMPLATE = 'template'
+ORIGEM_LLM = 'llm'
 
-model_llm = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
+# Métricas acumuladas de tamanho de prompt
+metricas_prompt = {
+    'perguntas': 0,
+    'tokens_enviados': 0,
+    'tokens_sem_poda': 0,
+    'tokens_prefixo_estatico': 0,
+    'tokens_entrada_reportados': 0,
+    'tokens_prefixo_em_cache': 0,
+}
 
-def gerar_sql_da_pergunta(pergunta: str, slug: str) -> str:
-    """Gera SQL para a pergunta usando schema do cliente"""
-    try:
-        # Carregar schema com metadados
-        schema = carregar_schema(slug)
-        if not schema:
-            raise Exception(f"Schema não encontrado para slug: {slug}")
-        
-        # Extrair metadados
-        metadados = schema.get('_metadados', {})
-        print('📊 Metadados carregados:', metadados)
-        exemplos_consultas = metadados.get('exemplos_consultas', {})
-        campos_chave = metadados.get('campos_chave', {})
-        
-        # Adicionar contexto de metadados ao prompt
-        contexto_metadados = "\n\nMETADADOS IMPORTANTES:\n"
-        
-        # Adicionar exemplos de consultas
-        if exemplos_consultas:
-            contexto_metadados += "EXEMPLOS DE CONSULTAS:\n"
-            for categoria, exemplos in exemplos_consultas.items():
-                contexto_metadados += f"- {categoria.upper()}:\n"
-                for exemplo in exemplos:
-                    contexto_metadados += f"  * {exemplo}\n"
-        
-        # Adicionar campos chave
-        if campos_chave:
-            contexto_metadados += "\nCAMPOS CHAVE POR CONTEXTO:\n"
-            for contexto, info in campos_chave.items():
-                contexto_metadados += f"- {contexto.upper()}: tabelas {info['tabelas']}, campos {info.get('campos_identificacao', [])}\n"
-        
-        # Adicionar informações específicas sobre tipos de entidade
-        contexto_metadados += "\nINFORMAÇÕES ESPECÍFICAS:\n"
-        contexto_metadados += "- Campo enti_tipo_enti na tabela entidades classifica tipos:\n"
-        contexto_metadados += "  * 'CL' = Clientes\n"
-        contexto_metadados += "  * 'VE' = Vendedores\n"
-        contexto_metadados += "  * Para agrupar por tipo: GROUP BY enti_tipo_enti\n"
-        
-        print('📋 Contexto de metadados adicionado:', contexto_metadados[:200] + '...')
-        
-        # Formatar schema para o prompt
-        schema_formatado = formatar_schema_para_prompt(schema)
-        
-        # Criar prompt com contexto aprimorado
-        prompt = ChatPromptTemplate.from_template(TEMPLATE_SQL + contexto_metadados)
-        
-        chain = prompt | model_llm | StrOutputParser()
+class RegistroChains:
+    """
+    Chain de geração de SQL por slug, montada uma vez por versão do schema
+
+    A mensagem de sistema (regras + metadados do slug) é fixa para o slug; o
+    schema podado e a pergunta vão na mensagem do usuário, depois do prefixo.
+    """
+
+    def __init__(self):
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def obter(self, slug: str) -> dict:
+        versao = obter_versao_schema(slug)
+        entrada = self._chains.get(slug)
+        if entrada and entrada['versao'] == versao:
+            return entrada
+
+        with self._lock:
+            entrada = self._chains.get(slug)
+            if entrada and entrada['versao'] == versao:
+                return entrada
+
+            sistema = TEMPLATE_SQL_SISTEMA + montar_metadados_prompt(slug)
+            prompt = ChatPromptTemplate.from_messages([
+                # Metadados são texto literal: chaves não podem virar variáveis do template
+                ("system", sistema.replace("{", "{{").replace("}", "}}")),
+                ("human", TEMPLATE_SQL_PERGUNTA),
+            ])
+            entrada = {
+                'versao': versao,
+                'sistema': sistema,
+                'prompt': prompt,
+                'chain': prompt | obter_modelo(),
+                'tokens_prefixo': estimar_tokens(sistema),
+            }
+            self._chains[slug] = entrada
+            print(f"⛓️ Chain SQL criada: {slug} (prefixo fixo ~{entrada['tokens_prefixo']} tokens)")
+            return entrada
+
+# Instância global do registro de chains
+registro_chains = RegistroChains()
+
+def registrar_metricas_prompt(slug: str, tokens: int, tabelas_usadas: int):
+    """Acumula e exibe o tamanho do prompt enviado comparado ao schema completo"""
+    indice = obter_indice(slug)
+    tokens_completo = getattr(indice, 'tokens_schema_completo', tokens)
+    total_tabelas = getattr(indice, 'total_tabelas', tabelas_usadas)
+
+    metricas_prompt['perguntas'] += 1
+    metricas_prompt['tokens_enviados'] += tokens
+    metricas_prompt['tokens_sem_poda'] += max(tokens_completo, tokens)
+    print(f"📏 Prompt: ~{tokens} tokens ({tabelas_usadas}/{total_tabelas} tabelas; schema completo ~{tokens_completo} tokens)")
+
+def registrar_cache_prefixo(slug: str, resposta, tokens_prefixo: int):
+    """Registra quantos tokens de entrada o provedor serviu do cache de contexto"""
+    uso = getattr(resposta, 'usage_metadata', None) or {}
+    tokens_entrada = uso.get('input_tokens', 0)
+    tokens_cache = (uso.get('input_token_details') or {}).get('cache_read', 0)
+
+    metricas_prompt['tokens_prefixo_estatico'] += tokens_prefixo
+    metricas_prompt['tokens_entrada_reportados'] += tokens_entrada
+    metricas_prompt['tokens_prefixo_em_cache'] += tokens_cache
+    if tokens_entrada:
+        print(f"🧊 Cache de prefixo ({slug}): {tokens_cache}/{tokens_entrada} tokens de entrada (prefixo fixo ~{tokens_prefixo})")
+
+def obter_metricas_prompt() -> dict:
+    """Retorna as métricas de tamanho de prompt acumuladas"""
+    perguntas = metricas_prompt['perguntas']
+    enviados = metricas_prompt['tokens_enviados']
+    sem_poda = metricas_prompt['tokens_sem_poda']
+    return {
+        **metricas_prompt,
+        'tokens_medios_por_pergunta': enviados / perguntas if perguntas else 0,
+        'reducao': 1 - enviados / sem_poda if sem_poda else 0.0,
+        'taxa_prefixo_em_cache': (
+            metricas_prompt['tokens_prefixo_em_cache'] / metricas_prompt['tokens_entrada_reportados']
+            if metricas_prompt['tokens_entrada_reportados'] else 0.0
+        ),
+    }
+
+def _preparar_geracao(pergunta: str, slug: str,
+                      usar_cache: bool) -> Tuple[Optional[str], str, Optional[dict], Optional[dict]]:
+    """
+    Etapas anteriores à chamada do LLM
+
+    Returns:
+        (sql, ORIGEM_CACHE ou ORIGEM_TEMPLATE, None, None) quando o SQL sai do cache/template, ou
+        (None, ORIGEM_LLM, entrada da chain, variáveis do prompt) quando é preciso chamar o LLM
+    """
+    # SQL já validado para esta pergunta e versão do schema: sem chamada ao LLM
+    if usar_cache:
+        versao_schema = obter_versao_schema(slug)
+        sql_cacheado = sql_cache.get(pergunta, slug, versao_schema)
+        if sql_cacheado:
+            return sql_cacheado, ORIGEM_CACHE, None, None
         
-        sql_gerado = chain.invoke({
-            "pergunta": pergunta,
-            "schema": schema_formatado,
-            "slug": slug
-        })
+        # Mesma forma de pergunta com outros valores (datas, códigos, números)
+        sql_template = buscar_sql_por_template(pergunta, slug, versao_schema)
+        if sql_template:
+            return sql_template, ORIGEM_TEMPLATE, None, None
+    
+    # Carregar schema com metadados
+    schema = carregar_schema(slug)
+    if not schema:
+        raise Exception(f"Schema não encontrado para slug: {slug}")
+    
+    metadados = schema.get('_metadados', {})
+    print('📊 Metadados carregados:', list(metadados.keys()))
+    
+    # Chain do slug (regras + metadados no prefixo fixo) montada uma vez por versão
+    entrada_chain = registro_chains.obter(slug)
+    
+    # Tabelas relevantes para a pergunta, em ordem de relevância
+    tabelas_relevantes = selecionar_tabelas(slug, pergunta)
+    if tabelas_relevantes:
+        print(f"🎯 Tabelas relevantes: {', '.join(tabelas_relevantes)}")
+    blocos_tabelas = montar_blocos_tabelas(slug, tabelas_relevantes)
+    
+    # Parte variável dentro do orçamento: JOINs exatos e alertas de tabelas grandes,
+    # depois as tabelas e, se sobrar espaço, exemplos que ainda não estão no prefixo
+    montador = MontadorPrompt(reservado=entrada_chain['sistema'] + TEMPLATE_SQL_PERGUNTA + pergunta)
+    montador.adicionar('exemplos', montar_cabecalho_schema(slug), PRIORIDADE_EXEMPLOS, deduplicar=True)
+    montador.adicionar('tabelas', blocos_tabelas[:1], PRIORIDADE_TABELAS, obrigatoria=True,
+                       titulo="\n📊 TABELAS DISPONÍVEIS:")
+    montador.adicionar('tabelas_extras', blocos_tabelas[1:], PRIORIDADE_TABELAS)
+    montador.adicionar('joins', montar_dicas_join(slug, tabelas_relevantes).strip("\n"), PRIORIDADE_JOINS)
+    montador.adicionar('tabelas_grandes', montar_dicas_tabelas_grandes(slug, tabelas_relevantes).strip("\n"),
+                       PRIORIDADE_JOINS)
+    schema_formatado, relatorio = montador.montar()
+    print(resumo_relatorio(relatorio))
+    
+    variaveis = {
+        "pergunta": pergunta,
+        "schema": schema_formatado
+    }
+    registrar_metricas_prompt(
+        slug,
+        relatorio['tokens'],
+        len(blocos_tabelas) - relatorio['omitidos'].get('tabelas_extras', 0)
+    )
+    return None, ORIGEM_LLM, entrada_chain, variaveis
+
+def _finalizar_geracao(slug: str, resposta, entrada_chain: dict) -> str:
+    """Registra o uso de cache do provedor e limpa o SQL devolvido pelo LLM"""
+    registrar_cache_prefixo(slug, resposta, entrada_chain['tokens_prefixo'])
+    sql_gerado = StrOutputParser().invoke(resposta)
+    
+    # Limpar SQL
+    sql_limpo = re.sub(r'```sql\s*', '', sql_gerado)
+    sql_limpo = re.sub(r'```\s*$', '', sql_limpo)
+    sql_limpo = sql_limpo.strip()
+    
+    print('🔍 SQL gerado:', sql_limpo[:100] + '...')
+    
+    return sql_limpo
+
+def gerar_sql_com_origem(pergunta: str, slug: str, usar_cache: bool = True) -> Tuple[str, Optional[str]]:
+    """
+    Gera SQL para a pergunta usando schema do cliente
+
+    Returns:
+        (sql, origem): ORIGEM_CACHE, ORIGEM_TEMPLATE ou ORIGEM_LLM; None com o SQL "-- Erro ..."
+    """
+    try:
+        sql_pronto, origem, entrada_chain, variaveis = _preparar_geracao(pergunta, slug, usar_cache)
+        if sql_pronto:
+            return sql_pronto, origem
         
-        # Limpar SQL
-        sql_limpo = re.sub(r'```sql\s*', '', sql_gerado)
-        sql_limpo = re.sub(r'```\s*$', '', sql_limpo)
-        sql_limpo = sql_limpo.strip()
+        resposta = entrada_chain['chain'].invoke(variaveis)
+        return _finalizar_geracao(slug, resposta, entrada_chain), origem
         
-        print('🔍 SQL gerado:', sql_limpo[:100] + '...')
+    except Exception as e:
+        print(f"❌ Erro ao gerar SQL: {e}")
+        return f"-- Erro ao gerar SQL: {str(e)}", None
+
+async def gerar_sql_com_origem_async(pergunta: str, slug: str,
+                                     usar_cache: bool = True) -> Tuple[str, Optional[str]]:
+    """Versão assíncrona de gerar_sql_com_origem (ainvoke, limitada por LIMITE_LLM)"""
+    try:
+        sql_pronto, origem, entrada_chain, variaveis = _preparar_geracao(pergunta, slug, usar_cache)
+        if sql_pronto:
+            return sql_pronto, origem
         
-        return sql_limpo
+        async with limitador.limite('llm'):
+            resposta = await entrada_chain['chain'].ainvoke(variaveis)
+        return _finalizar_geracao(slug, resposta, entrada_chain), origem
         
     except Exception as e:
         print(f"❌ Erro ao gerar SQL: {e}")
-        return f"-- Erro ao gerar SQL: {str(e)}"
\ No newline at end of file
+        return f"-- Erro ao gerar SQL: {str(e)}", None
+
+def gerar_sql_da_pergunta(pergunta: str, slug: str, usar_cache: bool = True) -> str:
+    """Gera SQL para a pergunta usando schema do cliente"""
+    return gerar_sql_com_origem(pergunta, slug, usar_cache)[0]
+
+async def gerar_sql_da_pergunta_async(pergunta: str, slug: str, usar_cache: bool = True) -> str:
+    """Versão assíncrona de gerar_sql_da_pergunta (ainvoke, limitada por LIMITE_LLM)"""
+    return (await gerar_sql_com_origem_async(pergunta, slug, usar_cache))[0]
@@ -0,0 +1,307 @@
+"""
+Templates de SQL parametrizados por literais da pergunta
+
+"vendas de março de 2024" e "vendas de abril de 2024" têm a mesma forma
+("vendas de <mes> de <ano>"). Quando o SQL gerado para uma delas executa com
+sucesso, os valores literais encontrados no SQL são trocados por marcadores e o
+esqueleto fica guardado no cache persistente. Perguntas com a mesma forma
+recebem os novos valores no esqueleto sem chamar o LLM.
+
+Só vira template o SQL em que todo literal da pergunta foi localizado sem
+ambiguidade; na dúvida o LLM continua sendo chamado.
+"""
+
+import calendar
+import re
+import threading
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cache_manager import normalizar_pergunta, sql_cache
+
+MESES = [
+    'janeiro', 'fevereiro', 'marco', 'abril', 'maio', 'junho',
+    'julho', 'agosto', 'setembro', 'outubro', 'novembro', 'dezembro',
+]
+
+# Palavras seguidas de um código de entidade ("cliente 123", "pedido nº 45")
+PALAVRAS_CODIGO = [
+    'cliente', 'produto', 'vendedor', 'fornecedor', 'entidade', 'empresa',
+    'filial', 'pedido', 'nota', 'codigo', 'cod',
+]
+
+PADRAO_LITERAIS = re.compile(
+    r"(?P<data_br>\b\d{1,2}/\d{1,2}/\d{4}\b)"
+    r"|(?P<data_iso>\b\d{4}-\d{2}-\d{2}\b)"
+    r"|(?P<mes_ano>\b\d{1,2}/\d{4}\b)"
+    rf"|(?P<mes>\b(?:{'|'.join(MESES)})\b)"
+    rf"|(?P<cod>\b(?:{'|'.join(PALAVRAS_CODIGO)})s?\s+(?:(?:de\s+)?(?:codigo|cod|numero|no|n)\s+)?(?P<valor_cod>\d+)\b)"
+    r"|(?P<ano>\b(?:19|20)\d{2}\b)"
+    r"|(?P<num>\b\d+(?:[.,]\d+)?\b)"
+)
+
+PADRAO_STRING_SQL = re.compile(r"'(?:[^']|'')*'")
+PADRAO_NUMERO_SQL = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+PADRAO_DATA_SQL = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+PADRAO_MARCADOR = re.compile(r"\{\{(\w+):([^}]*)\}\}")
+
+class Literal(NamedTuple):
+    """Valor extraído da pergunta"""
+    tipo: str    # data, mes, ano, cod, num
+    valor: object
+    texto: str   # forma usada no SQL
+
+def extrair_literais(pergunta: str) -> Tuple[str, List[Literal]]:
+    """
+    Separa a pergunta em forma e literais
+
+    Returns:
+        (forma, literais), ex: ("vendas de <mes> de <ano>", [mes=3, ano=2024])
+    """
+    texto = normalizar_pergunta(pergunta)
+    literais: List[Literal] = []
+    partes = []
+    ultimo = 0
+
+    for m in PADRAO_LITERAIS.finditer(texto):
+        tipo = m.lastgroup if m.lastgroup != 'valor_cod' else 'cod'
+        trecho = m.group(0)
+        try:
+            if tipo == 'data_br':
+                dia, mes, ano = map(int, trecho.split('/'))
+                valor = date(ano, mes, dia)
+                literais.append(Literal('data', valor, valor.isoformat()))
+                marcador = '<data>'
+            elif tipo == 'data_iso':
+                valor = date.fromisoformat(trecho)
+                literais.append(Literal('data', valor, valor.isoformat()))
+                marcador = '<data>'
+            elif tipo == 'mes_ano':
+                mes, ano = map(int, trecho.split('/'))
+                if not 1 <= mes <= 12:
+                    raise ValueError(trecho)
+                literais.append(Literal('mes', mes, str(mes)))
+                literais.append(Literal('ano', ano, str(ano)))
+                marcador = '<mes>/<ano>'
+            elif tipo == 'mes':
+                mes = MESES.index(trecho) + 1
+                literais.append(Literal('mes', mes, str(mes)))
+                marcador = '<mes>'
+            elif tipo == 'cod':
+                codigo = m.group('valor_cod')
+                literais.append(Literal('cod', int(codigo), codigo))
+                marcador = trecho[:m.start('valor_cod') - m.start()] + '<cod>'
+            elif tipo == 'ano':
+                literais.append(Literal('ano', int(trecho), trecho))
+                marcador = '<ano>'
+            else:
+                numero = trecho.replace(',', '.')
+                valor = float(numero) if '.' in numero else int(numero)
+                literais.append(Literal('num', valor, numero))
+                marcador = '<num>'
+        except ValueError:
+            # Data ou mês inválido: mantém o trecho como texto da forma
+            continue
+        partes.append(texto[ultimo:m.start()])
+        partes.append(marcador)
+        ultimo = m.end()
+
+    partes.append(texto[ultimo:])
+    return ''.join(partes), literais
+
+def _normalizar_mes(ano: int, mes: int) -> Tuple[int, int]:
+    while mes > 12:
+        mes -= 12
+        ano += 1
+    while mes < 1:
+        mes += 12
+        ano -= 1
+    return ano, mes
+
+def _referencia(indice: int, deslocamento: int) -> str:
+    return f"${indice}" if deslocamento == 0 else f"${indice}{deslocamento:+d}"
+
+def _resolver_data(ano: int, mes: int, dia: int, literais: List[Literal], usados: set) -> Optional[str]:
+    """Marcador para uma data do SQL derivada dos literais (None se não derivável)"""
+    candidatos = set()
+    for i, literal in enumerate(literais):
+        if literal.tipo == 'data' and literal.valor == date(ano, mes, dia):
+            candidatos.add((f"{{{{v:{i}}}}}", (i,)))
+
+    if dia == 1:
+        componente_dia = '01'
+    elif dia >= 28 and dia == calendar.monthrange(ano, mes)[1]:
+        componente_dia = 'fim'
+    else:
+        componente_dia = f"{dia:02d}"
+
+    anos = [(i, l) for i, l in enumerate(literais) if l.tipo == 'ano']
+    meses = [(i, l) for i, l in enumerate(literais) if l.tipo == 'mes']
+    for i, literal_ano in anos:
+        for j, literal_mes in meses:
+            for deslocamento in (0, 1, -1):
+                if _normalizar_mes(literal_ano.valor, literal_mes.valor + deslocamento) == (ano, mes):
+                    candidatos.add((
+                        f"{{{{d:${i}:{_referencia(j, deslocamento)}:{componente_dia}}}}}", (i, j)
+                    ))
+        if not meses:
+            for deslocamento in (0, 1, -1):
+                if literal_ano.valor + deslocamento == ano:
+                    candidatos.add((
+                        f"{{{{d:{_referencia(i, deslocamento)}:{mes:02d}:{componente_dia}}}}}", (i,)
+                    ))
+
+    if len(candidatos) != 1:
+        return None
+    marcador, indices = candidatos.pop()
+    usados.update(indices)
+    return marcador
+
+def criar_template(pergunta: str, sql: str) -> Optional[Tuple[str, str, List[str]]]:
+    """
+    Troca no SQL os valores vindos da pergunta por marcadores
+
+    Returns:
+        (forma, template, tipos) ou None se a pergunta não tem literais ou
+        algum deles não pôde ser localizado no SQL sem ambiguidade
+    """
+    forma, literais = extrair_literais(pergunta)
+    if not literais:
+        return None
+
+    tem_periodo = any(l.tipo in ('data', 'mes', 'ano') for l in literais)
+    usados: set = set()
+    ocorrencias: Dict[int, int] = {}
+    ambiguo = False
+
+    def numero(match) -> str:
+        nonlocal ambiguo
+        token = match.group(0)
+        valor = float(token)
+        indices = [i for i, l in enumerate(literais) if l.tipo != 'data' and float(l.valor) == valor]
+        if len(indices) > 1:
+            ambiguo = True
+        if len(indices) != 1:
+            # Vizinho de um mês/ano (ex: ano + 1) sem marcador daria SQL errado para outros valores
+            if any(l.tipo in ('mes', 'ano') and abs(float(l.valor) - valor) == 1 for l in literais):
+                ambiguo = True
+            return token
+        indice = indices[0]
+        if literais[indice].tipo == 'mes':
+            # Número de mês só é confiável junto de MONTH/mes (evita trocar pedi_empr = 3)
+            contexto = match.string[max(0, match.start() - 60):match.start()].lower()
+            if 'month' not in contexto and 'mes' not in contexto:
+                ambiguo = True
+                return token
+        ocorrencias[indice] = ocorrencias.get(indice, 0) + 1
+        usados.add(indice)
+        largura = f":{len(token)}" if token.startswith('0') and len(token) > 1 else ""
+        return f"{{{{v:{indice}{largura}}}}}"
+
+    def trecho_sem_strings(trecho: str) -> str:
+        return PADRAO_NUMERO_SQL.sub(numero, trecho)
+
+    partes = []
+    ultimo = 0
+    for m in PADRAO_STRING_SQL.finditer(sql):
+        partes.append(trecho_sem_strings(sql[ultimo:m.start()]))
+        conteudo = m.group(0)[1:-1]
+        data = PADRAO_DATA_SQL.match(conteudo)
+        if data:
+            try:
+                marcador = _resolver_data(*map(int, data.groups()), literais, usados)
+            except ValueError:
+                marcador = None
+            if marcador is None and tem_periodo:
+                ambiguo = True
+            partes.append(f"'{marcador}'" if marcador else m.group(0))
+        elif re.fullmatch(r"\d+(?:\.\d+)?", conteudo):
+            partes.append(f"'{PADRAO_NUMERO_SQL.sub(numero, conteudo)}'")
+        else:
+            partes.append(m.group(0))
+        ultimo = m.end()
+    partes.append(trecho_sem_strings(sql[ultimo:]))
+
+    # O mesmo valor em dois pontos do SQL (ex: empresa e filial = 1) não é seguro trocar
+    if ambiguo or any(n > 1 for n in ocorrencias.values()) or usados != set(range(len(literais))):
+        return None
+    return forma, ''.join(partes), [l.tipo for l in literais]
+
+def aplicar_template(template: str, literais: List[Literal]) -> str:
+    """Preenche os marcadores do template com os literais da nova pergunta"""
+    def resolver(referencia: str) -> int:
+        m = re.fullmatch(r"\$(\d+)([+-]\d+)?", referencia)
+        if not m:
+            return int(referencia)
+        return int(literais[int(m.group(1))].valor) + int(m.group(2) or 0)
+
+    def substituir(m) -> str:
+        tipo, argumentos = m.group(1), m.group(2).split(':')
+        if tipo == 'v':
+            texto = literais[int(argumentos[0])].texto
+            return texto.zfill(int(argumentos[1])) if len(argumentos) > 1 else texto
+        ano, mes = _normalizar_mes(resolver(argumentos[0]), resolver(argumentos[1]))
+        dia = calendar.monthrange(ano, mes)[1] if argumentos[2] == 'fim' else int(argumentos[2])
+        return date(ano, mes, dia).isoformat()
+
+    return PADRAO_MARCADOR.sub(substituir, template)
+
+# Acertos/erros de template por slug (só perguntas com literais)
+metricas_templates: Dict[str, Dict[str, int]] = {}
+_lock_metricas = threading.Lock()
+
+def _contar(slug: str, campo: str):
+    with _lock_metricas:
+        contadores = metricas_templates.setdefault(slug, {'hits': 0, 'misses': 0, 'criados': 0})
+        contadores[campo] += 1
+
+def buscar_sql_por_template(pergunta: str, slug: str, versao_schema: Optional[str]) -> Optional[str]:
+    """SQL montado a partir de um template com a mesma forma da pergunta"""
+    if not versao_schema:
+        return None
+    forma, literais = extrair_literais(pergunta)
+    if not literais:
+        return None
+
+    encontrado = sql_cache.get_template(forma, slug, versao_schema)
+    if encontrado is None or encontrado[1] != [l.tipo for l in literais]:
+        _contar(slug, 'misses')
+        return None
+
+    try:
+        sql = aplicar_template(encontrado[0], literais)
+    except (ValueError, IndexError) as e:
+        print(f"⚠️ Template inválido para os valores informados: {e}")
+        _contar(slug, 'misses')
+        return None
+
+    _contar(slug, 'hits')
+    print(f"🧩 SQL montado por template: {forma[:60]}")
+    return sql
+
+def registrar_template(pergunta: str, slug: str, versao_schema: Optional[str], sql: str):
+    """Guarda o template do SQL executado com sucesso, quando parametrizável"""
+    if not versao_schema:
+        return
+    resultado = criar_template(pergunta, sql)
+    if resultado is None:
+        return
+    forma, template, tipos = resultado
+    if not sql_cache.existe_template(forma, slug, versao_schema):
+        sql_cache.set_template(forma, slug, versao_schema, template, tipos)
+        _contar(slug, 'criados')
+        print(f"🧩 Template registrado: {forma[:60]}")
+
+def descartar_template(pergunta: str, slug: str, versao_schema: Optional[str]):
+    """Remove o template da forma da pergunta (ex: SQL montado que falhou)"""
+    forma, literais = extrair_literais(pergunta)
+    if literais:
+        sql_cache.remover_template(forma, slug, versao_schema)
+
+def obter_metricas_templates() -> Dict:
+    """Taxa de acerto de templates por slug"""
+    with _lock_metricas:
+        return {
+            slug: dict(c, hit_rate=c['hits'] / (c['hits'] + c['misses']) if c['hits'] + c['misses'] else 0.0)
+            for slug, c in metricas_templates.items()
+        }
@@ -0,0 +1,147 @@
+"""
+Registro de clientes (tenants): banco de dados de cada slug
+
+O arquivo TENANTS_CONFIG (padrão tenants.json) mapeia slug -> conexão, no
+mesmo formato de DATABASES do gerar_schema.py:
+
+    {
+        "casaa": {"host": "localhost", "port": 5432, "user": "postgres",
+                  "password_env": "DB_PASSWORD_CASAA", "dbname": "casaa"},
+        "spartacus": {"host": "10.0.0.5", "user": "leitura", "password_env": "DB_PASSWORD_SPARTACUS",
+                      "dbname": "spartacus", "pool_min": 2, "pool_max": 20}
+    }
+
+password_env lê a senha de uma variável de ambiente (evita senha no arquivo);
+pool_min/pool_max sobrepõem DB_POOL_MIN/DB_POOL_MAX, statement_timeout_ms
+sobrepõe DB_STATEMENT_TIMEOUT_MS (tempo máximo de cada SQL) e custo_max/linhas_max
+sobrepõem SQL_CUSTO_MAX/SQL_LINHAS_MAX (limites do EXPLAIN, custo_consulta.py).
+empresa/filial (padrão SQL_EMPRESA/SQL_FILIAL, opcionais) são os valores de
+*_empr/*_fili que filtros_empresa.py acrescenta às consultas do slug.
+
+Slug fora do registro usa a conexão padrão (settings.DATABASES, variáveis DB_*),
+como antes; com TENANTS_ESTRITO=true ele é recusado.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+TENANTS_CONFIG = os.getenv("TENANTS_CONFIG", "tenants.json")
+TENANTS_ESTRITO = os.getenv("TENANTS_ESTRITO", "false").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+SQL_CUSTO_MAX = float(os.getenv("SQL_CUSTO_MAX", "100000"))
+SQL_LINHAS_MAX = int(os.getenv("SQL_LINHAS_MAX", "100000"))
+SQL_EMPRESA = os.getenv("SQL_EMPRESA")
+SQL_FILIAL = os.getenv("SQL_FILIAL")
+
+# Chave do pool compartilhado pelos slugs sem entrada no registro
+TENANT_PADRAO = "default"
+
+CAMPOS_CONEXAO = ('host', 'port', 'user', 'password', 'dbname')
+
+class TenantDesconhecido(ValueError):
+    """Slug sem entrada no registro com TENANTS_ESTRITO=true"""
+
+def _inteiro_opcional(valor) -> Optional[int]:
+    return None if valor in (None, "") else int(valor)
+
+def _config_padrao() -> Dict:
+    """Conexão padrão de settings.DATABASES['default']"""
+    from settings import DATABASES
+
+    banco = DATABASES['default']
+    return {
+        'host': banco.get('HOST') or 'localhost',
+        'port': int(banco.get('PORT') or 5432),
+        'user': banco.get('USER'),
+        'password': banco.get('PASSWORD'),
+        'dbname': banco.get('NAME'),
+        'statement_timeout_ms': DB_STATEMENT_TIMEOUT_MS,
+        'custo_max': SQL_CUSTO_MAX,
+        'linhas_max': SQL_LINHAS_MAX,
+        'empresa': _inteiro_opcional(SQL_EMPRESA),
+        'filial': _inteiro_opcional(SQL_FILIAL),
+    }
+
+def _normalizar(slug: str, config: Dict) -> Dict:
+    tipo = config.get('tipo', 'postgres')
+    if tipo != 'postgres':
+        raise ValueError(f"Tenant {slug}: tipo de banco não suportado no pool ({tipo})")
+    normalizada = {campo: config.get(campo) for campo in CAMPOS_CONEXAO}
+    if config.get('password_env'):
+        normalizada['password'] = os.getenv(config['password_env'])
+    normalizada['host'] = normalizada['host'] or 'localhost'
+    normalizada['port'] = int(normalizada['port'] or 5432)
+    normalizada['dbname'] = normalizada['dbname'] or slug
+    for limite in ('pool_min', 'pool_max'):
+        if config.get(limite) is not None:
+            normalizada[limite] = int(config[limite])
+    normalizada['statement_timeout_ms'] = int(config.get('statement_timeout_ms', DB_STATEMENT_TIMEOUT_MS))
+    normalizada['custo_max'] = float(config.get('custo_max', SQL_CUSTO_MAX))
+    normalizada['linhas_max'] = int(config.get('linhas_max', SQL_LINHAS_MAX))
+    normalizada['empresa'] = _inteiro_opcional(config.get('empresa', SQL_EMPRESA))
+    normalizada['filial'] = _inteiro_opcional(config.get('filial', SQL_FILIAL))
+    return normalizada
+
+class RegistroTenants:
+    """Conexão de cada slug, lida do arquivo de tenants na primeira consulta"""
+
+    def __init__(self, caminho: str = TENANTS_CONFIG, estrito: bool = TENANTS_ESTRITO):
+        self.caminho = caminho
+        self.estrito = estrito
+        self._tenants: Optional[Dict[str, Dict]] = None
+        self._avisados = set()
+        self._lock = threading.Lock()
+
+    def _carregar(self) -> Dict[str, Dict]:
+        tenants = {}
+        if os.path.exists(self.caminho):
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                for slug, config in json.load(f).items():
+                    tenants[slug] = _normalizar(slug, config)
+            print(f"🏢 Registro de tenants: {len(tenants)} slugs ({self.caminho})")
+        if TENANT_PADRAO not in tenants:
+            tenants[TENANT_PADRAO] = _config_padrao()
+        return tenants
+
+    def tenants(self) -> Dict[str, Dict]:
+        if self._tenants is None:
+            with self._lock:
+                if self._tenants is None:
+                    self._tenants = self._carregar()
+        return self._tenants
+
+    def resolver(self, slug: str) -> Tuple[str, Dict]:
+        """
+        Returns:
+            (chave do pool, configuração de conexão) do slug
+        """
+        tenants = self.tenants()
+        if slug in tenants:
+            return slug, tenants[slug]
+        if self.estrito:
+            raise TenantDesconhecido(f"Slug não cadastrado no registro de tenants: {slug}")
+        if slug not in self._avisados:
+            self._avisados.add(slug)
+            print(f"⚠️ Slug {slug} fora do registro de tenants: usando a conexão padrão")
+        return TENANT_PADRAO, tenants[TENANT_PADRAO]
+
+    def recarregar(self):
+        """Relê o arquivo de tenants (pools já abertos continuam até serem fechados)"""
+        with self._lock:
+            self._tenants = None
+            self._avisados.clear()
+
+    def listar(self) -> List[Dict]:
+        """Slugs cadastrados, sem as senhas"""
+        return [
+            {'slug': slug, 'host': config['host'], 'port': config['port'], 'dbname': config['dbname'],
+             'statement_timeout_ms': config['statement_timeout_ms'],
+             'custo_max': config['custo_max'], 'linhas_max': config['linhas_max'],
+             'empresa': config['empresa'], 'filial': config['filial']}
+            for slug, config in self.tenants().items()
+        ]
+
+# Instância global do registro de tenants
+registro_tenants = RegistroTenants()
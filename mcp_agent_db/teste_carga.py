@@ -0,0 +1,63 @@
+"""
+Teste de carga da API: N requisições com C simultâneas
+
+Uso: python teste_carga.py [total] [concorrencia] [url] [pergunta]
+
+Perguntas distintas (sufixo com o número da requisição) evitam que o cache e a
+coalescência escondam a concorrência real; use --repetir para medir o caso
+de perguntas idênticas.
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+URL_PADRAO = "http://localhost:8000/api/consulta"
+PERGUNTA_PADRAO = "Quantos pedidos foram feitos"
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+async def executar(total: int, concorrencia: int, url: str, pergunta: str, repetir: bool = False):
+    semaforo = asyncio.Semaphore(concorrencia)
+    latencias, erros = [], 0
+
+    async def requisicao(cliente: httpx.AsyncClient, numero: int):
+        nonlocal erros
+        texto = pergunta if repetir else f"{pergunta} (#{numero})"
+        async with semaforo:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.post(url, json={"pergunta": texto})
+                if resposta.status_code != 200:
+                    erros += 1
+            except httpx.HTTPError:
+                erros += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    print(f"🚀 {total} requisições, {concorrencia} simultâneas → {url}")
+    inicio = time.perf_counter()
+    async with httpx.AsyncClient(timeout=None) as cliente:
+        await asyncio.gather(*(requisicao(cliente, i) for i in range(total)))
+    duracao = time.perf_counter() - inicio
+
+    print(f"⏱️ Duração total: {duracao:.2f}s")
+    print(f"📈 Vazão: {total / duracao:.2f} req/s")
+    print(f"📊 Latência p50: {percentil(latencias, 50) * 1000:.0f} ms | "
+          f"p95: {percentil(latencias, 95) * 1000:.0f} ms | "
+          f"média: {statistics.mean(latencias) * 1000:.0f} ms")
+    print(f"❌ Erros: {erros}")
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if a != "--repetir"]
+    total = int(argumentos[0]) if len(argumentos) > 0 else 40
+    concorrencia = int(argumentos[1]) if len(argumentos) > 1 else 20
+    url = argumentos[2] if len(argumentos) > 2 else URL_PADRAO
+    pergunta = argumentos[3] if len(argumentos) > 3 else PERGUNTA_PADRAO
+    asyncio.run(executar(total, concorrencia, url, pergunta, "--repetir" in sys.argv))
@@ -0,0 +1,7 @@
+"""
+Os módulos do agente usam imports absolutos (rodam de dentro de mcp_agent_db)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
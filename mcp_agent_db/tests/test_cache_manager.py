@@ -0,0 +1,61 @@
+"""
+Cache persistente de SQL (cache_manager.SQLCache)
+"""
+import threading
+import time
+
+from cache_manager import SQLCache
+
+def _acessos(cache, tabela='sql_cache'):
+    with cache._lock:
+        cache._gravar_acessos()
+        return cache._conectar().execute(f"SELECT acessos FROM {tabela}").fetchone()[0]
+
+def test_acerto_nao_grava_no_banco(tmp_path):
+    cache = SQLCache(str(tmp_path / "cache.sqlite3"), lote_acessos=1000)
+    cache.set("entidades por tipo", 'casaa', 'v1', "SELECT 1")
+    # Com o escritor ocupado, o acerto continua respondendo
+    with cache._lock:
+        assert cache.get("Entidades por tipo?", 'casaa', 'v1') == "SELECT 1"
+    assert cache.get("outra pergunta", 'casaa', 'v1') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert _acessos(cache) == 1
+
+def test_acessos_gravados_em_lote(tmp_path):
+    cache = SQLCache(str(tmp_path / "cache.sqlite3"), lote_acessos=5)
+    cache.set("entidades por tipo", 'casaa', 'v1', "SELECT 1")
+    cache.set_template("entidades do tipo <texto>", 'casaa', 'v1', "SELECT {0}", ['texto'])
+    for _ in range(4):
+        cache.get("entidades por tipo", 'casaa', 'v1')
+    with cache._lock:
+        assert cache._conectar().execute("SELECT acessos FROM sql_cache").fetchone()[0] == 0
+    cache.get_template("entidades do tipo <texto>", 'casaa', 'v1')
+    # O quinto acerto completa o lote: a gravação roda numa thread à parte
+    for _ in range(200):
+        with cache._lock:
+            gravados = cache._conectar().execute("SELECT acessos FROM sql_cache").fetchone()[0]
+        if gravados:
+            break
+        time.sleep(0.01)
+    assert gravados == 4
+    assert _acessos(cache, 'sql_templates') == 1
+
+def test_leitura_de_outra_thread_ve_o_que_foi_gravado(tmp_path):
+    cache = SQLCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("entidades por tipo", 'casaa', 'v1') is None
+    resultado = []
+    thread = threading.Thread(target=lambda: cache.set("entidades por tipo", 'casaa', 'v1', "SELECT 1"))
+    thread.start()
+    thread.join()
+    resultado.append(cache.get("entidades por tipo", 'casaa', 'v1'))
+    cache.remover("entidades por tipo", 'casaa', 'v1')
+    resultado.append(cache.get("entidades por tipo", 'casaa', 'v1'))
+    assert resultado == ["SELECT 1", None]
+
+def test_existe_template_nao_conta_acesso(tmp_path):
+    cache = SQLCache(str(tmp_path / "cache.sqlite3"))
+    assert not cache.existe_template("entidades do tipo <texto>", 'casaa', 'v1')
+    cache.set_template("entidades do tipo <texto>", 'casaa', 'v1', "SELECT {0}", ['texto'])
+    assert cache.existe_template("entidades do tipo <texto>", 'casaa', 'v1')
+    assert cache.hits == 0
+    assert _acessos(cache, 'sql_templates') == 0
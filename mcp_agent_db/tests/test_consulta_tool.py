@@ -0,0 +1,84 @@
+"""
+Invalidação do cache de SQL quando a execução falha (consulta_tool)
+"""
+import pytest
+
+pytest.importorskip("langchain")
+
+import consulta_tool
+from custo_consulta import ConsultaCara
+from executores import ConsultaCancelada, ConsultaExcedeuTempo
+from pool_conexoes import PoolEsgotado
+from sql_generator import ORIGEM_CACHE, ORIGEM_LLM, ORIGEM_TEMPLATE
+
+class ErroPostgres(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+@pytest.fixture
+def registros(monkeypatch):
+    chamadas = {'descartados': [], 'falhos': []}
+    monkeypatch.setattr(consulta_tool, '_descartar_sql', lambda pergunta, slug, versao: chamadas['descartados'].append(pergunta))
+    monkeypatch.setattr(consulta_tool, 'registrar_sql_falho', lambda sql: chamadas['falhos'].append(sql))
+    return chamadas
+
+def _falhar(erro, intencao=None):
+    consulta_tool._registrar_falha(erro, "SELECT 1", intencao, "pergunta", 'casaa', 'v1')
+
+@pytest.mark.parametrize('erro', [
+    ErroPostgres('42601'),  # sintaxe
+    ErroPostgres('42703'),  # coluna inexistente
+    ErroPostgres('42P01'),  # tabela inexistente
+    ConsultaCara("custo"),
+])
+def test_erro_do_sql_descarta_o_cache(registros, erro):
+    _falhar(erro)
+    assert registros == {'descartados': ["pergunta"], 'falhos': ["SELECT 1"]}
+
+@pytest.mark.parametrize('erro', [
+    PoolEsgotado("sem conexão"),
+    ConsultaCancelada(),
+    ErroPostgres('08006'),  # conexão perdida
+    ErroPostgres('40P01'),  # deadlock
+    RuntimeError("qualquer"),
+])
+def test_falha_passageira_nao_toca_o_cache(registros, erro):
+    _falhar(erro)
+    assert registros == {'descartados': [], 'falhos': []}
+
+def test_timeout_nao_repete_o_sql_mas_mantem_o_cache(registros):
+    _falhar(ConsultaExcedeuTempo("statement_timeout"))
+    assert registros == {'descartados': [], 'falhos': ["SELECT 1"]}
+
+def test_sql_de_intencao_nunca_sai_do_catalogo(registros):
+    _falhar(ErroPostgres('42703'), intencao={'nome': 'estoque_baixo'})
+    assert registros == {'descartados': [], 'falhos': ["SELECT 1"]}
+
+@pytest.fixture
+def consulta(monkeypatch):
+    """_executar_consulta sem banco nem LLM; registra o que seria gravado no cache"""
+    gravados = []
+    monkeypatch.setattr(consulta_tool, 'resolver_intencao', lambda pergunta, slug: None)
+    monkeypatch.setattr(consulta_tool, '_preparar_pergunta', lambda pergunta, slug: pergunta)
+    monkeypatch.setattr(consulta_tool, 'reescrever_sql', lambda sql, slug: type('R', (), {'sql': sql})())
+    monkeypatch.setattr(consulta_tool, 'sql_ja_falhou', lambda sql: False)
+    monkeypatch.setattr(consulta_tool, 'obter_versao_schema', lambda slug: 'v1')
+    monkeypatch.setattr(consulta_tool, 'verificar_custo', lambda sql, slug, regenerar: sql)
+    monkeypatch.setattr(consulta_tool, 'executar_sql', lambda sql, slug: (['total'], [], False))
+    monkeypatch.setattr(consulta_tool.query_cache, 'set', lambda *args: None)
+    monkeypatch.setattr(consulta_tool.sql_cache, 'set', lambda *args: gravados.append('sql'))
+    monkeypatch.setattr(consulta_tool, 'registrar_template', lambda *args: gravados.append('template'))
+
+    def executar(origem):
+        monkeypatch.setattr(consulta_tool, 'gerar_sql_com_origem', lambda pergunta, slug, usar_cache=True: ("SELECT 1", origem))
+        consulta_tool._executar_consulta("pergunta", 'casaa')
+        return gravados
+    return executar
+
+@pytest.mark.parametrize('origem', [ORIGEM_CACHE, ORIGEM_TEMPLATE])
+def test_sql_do_cache_nao_volta_ao_cache(consulta, origem):
+    assert consulta(origem) == []
+
+def test_sql_novo_do_llm_vai_para_o_cache(consulta):
+    assert consulta(ORIGEM_LLM) == ['sql', 'template']
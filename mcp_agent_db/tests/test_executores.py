@@ -0,0 +1,48 @@
+"""
+Cancelamento do SQL que roda numa thread (executores)
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+import executores
+
+class ConexaoLenta:
+    """cancel() bloqueia como o do psycopg2, que fala com o servidor"""
+
+    def __init__(self):
+        self.cancelada = threading.Event()
+
+    def cancel(self):
+        time.sleep(0.3)
+        self.cancelada.set()
+
+def test_cancelamento_nao_bloqueia_o_event_loop(monkeypatch):
+    conexao = ConexaoLenta()
+
+    def executar_sql(sql, slug, limite, cancelavel):
+        cancelavel.associar(conexao)
+        try:
+            conexao.cancelada.wait(5)
+            raise executores.ConsultaCancelada("cancelada no banco")
+        finally:
+            cancelavel.desassociar()
+
+    monkeypatch.setattr(executores, 'USAR_ASYNCPG', False)
+    monkeypatch.setattr(executores, 'executar_sql', executar_sql)
+
+    async def cenario():
+        tarefa = asyncio.ensure_future(executores.executar_sql_async("SELECT pg_sleep(10)", 'casaa'))
+        await asyncio.sleep(0.05)
+        tarefa.cancel()
+        inicio = time.perf_counter()
+        with pytest.raises(asyncio.CancelledError):
+            await tarefa
+        espera_cancelamento = time.perf_counter() - inicio
+        await asyncio.to_thread(conexao.cancelada.wait, 5)
+        return espera_cancelamento
+
+    assert asyncio.run(cenario()) < 0.2
+    assert conexao.cancelada.is_set()
@@ -0,0 +1,119 @@
+"""
+Filtro de empresa/filial e LIMIT aplicados ao SQL gerado (filtros_empresa)
+"""
+import re
+
+import pytest
+
+import filtros_empresa
+
+SCHEMA = {
+    'pedidosvenda': {'colunas': [
+        {'nome': 'pedi_empr', 'primary_key': True},
+        {'nome': 'pedi_fili', 'primary_key': True},
+        {'nome': 'pedi_nume', 'primary_key': True},
+        {'nome': 'pedi_forn'},
+    ]},
+    'entidades': {'colunas': [
+        {'nome': 'enti_empr', 'primary_key': True},
+        {'nome': 'enti_clie', 'primary_key': True},
+        {'nome': 'enti_nome'},
+    ]},
+}
+
+@pytest.fixture(autouse=True)
+def tenant(monkeypatch):
+    monkeypatch.setattr(filtros_empresa, 'carregar_schema', lambda slug: SCHEMA)
+    monkeypatch.setattr(filtros_empresa, '_valores_tenant', lambda slug: {'empresa': 1, 'filial': 2})
+    monkeypatch.setattr(filtros_empresa, 'tabela_grande', lambda slug, tabela: False)
+
+@pytest.fixture(params=['arvore', 'regex'])
+def modo(request, monkeypatch):
+    if request.param == 'arvore':
+        if filtros_empresa.sqlglot is None:
+            pytest.skip("sqlglot não instalado")
+    else:
+        monkeypatch.setattr(filtros_empresa, 'sqlglot', None)
+    return request.param
+
+def _compacto(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+def _reescrever(sql):
+    return _compacto(filtros_empresa.reescrever_sql(sql, 'casaa').sql)
+
+def test_sem_where_recebe_filtro(modo):
+    sql = _reescrever("SELECT pedi_nume FROM pedidosvenda")
+    assert "pedidosvenda.pedi_empr = 1" in sql
+    assert "pedidosvenda.pedi_fili = 2" in sql
+
+def test_empresa_de_outro_tenant_no_where(modo):
+    sql = _reescrever("SELECT * FROM pedidosvenda WHERE pedi_empr = 3")
+    assert "pedidosvenda.pedi_empr = 1" in sql
+    assert "pedidosvenda.pedi_fili = 2" in sql
+
+def test_in_e_or_nao_isolam_o_tenant(modo):
+    sql = _reescrever("SELECT * FROM pedidosvenda WHERE pedi_empr IN (1, 3) OR pedi_fili > 0")
+    assert "pedidosvenda.pedi_empr = 1" in sql
+    assert "pedidosvenda.pedi_fili = 2" in sql
+
+def test_filtro_do_tenant_ja_presente_nao_duplica(modo):
+    original = "SELECT * FROM pedidosvenda WHERE pedi_empr = 1 AND pedidosvenda.pedi_fili = 2"
+    reescrito = filtros_empresa.reescrever_sql(original, 'casaa')
+    assert reescrito.alteracoes == []
+    assert reescrito.sql == original
+
+def test_filtro_dentro_de_or_nao_conta(modo):
+    sql = _reescrever("SELECT * FROM pedidosvenda WHERE (pedi_empr = 1 AND pedi_fili = 2) OR pedi_nume > 0")
+    assert sql.count("pedi_empr = 1") == 2
+
+def test_between_nao_esconde_filtro_regex(monkeypatch):
+    monkeypatch.setattr(filtros_empresa, 'sqlglot', None)
+    sql = _reescrever("SELECT * FROM pedidosvenda WHERE pedi_nume BETWEEN 1 AND pedi_empr = 1")
+    assert "pedidosvenda.pedi_empr = 1" in sql
+
+def test_reescrita_idempotente(modo):
+    primeira = filtros_empresa.reescrever_sql("SELECT * FROM pedidosvenda WHERE pedi_empr = 3", 'casaa')
+    segunda = filtros_empresa.reescrever_sql(primeira.sql, 'casaa')
+    assert segunda.alteracoes == []
+
+def test_join_implicito_filtra_as_duas_tabelas():
+    if filtros_empresa.sqlglot is None:
+        pytest.skip("sqlglot não instalado")
+    sql = _reescrever(
+        "SELECT * FROM pedidosvenda a, entidades b "
+        "WHERE a.pedi_empr = b.enti_empr AND a.pedi_fili = 1"
+    )
+    assert "a.pedi_empr = 1" in sql
+    assert "a.pedi_fili = 2" in sql
+    assert "b.enti_empr = 1" in sql
+
+def test_left_join_filtra_no_on():
+    if filtros_empresa.sqlglot is None:
+        pytest.skip("sqlglot não instalado")
+    sql = _reescrever(
+        "SELECT * FROM pedidosvenda p LEFT JOIN entidades e ON e.enti_clie = p.pedi_forn"
+    )
+    on, where = sql.split(" WHERE ")
+    assert "e.enti_empr = 1" in on
+    assert "p.pedi_empr = 1" in where and "enti_empr" not in where
+
+def test_subconsulta_e_cte():
+    if filtros_empresa.sqlglot is None:
+        pytest.skip("sqlglot não instalado")
+    sql = _reescrever(
+        "WITH ultimos AS (SELECT pedi_forn FROM pedidosvenda) "
+        "SELECT enti_nome FROM entidades WHERE enti_clie IN (SELECT pedi_forn FROM ultimos)"
+    )
+    assert "pedidosvenda.pedi_empr = 1" in sql
+    assert "entidades.enti_empr = 1" in sql
+    assert "ultimos.pedi_empr" not in sql
+
+def test_limite_acima_do_maximo_e_reduzido(modo, monkeypatch):
+    monkeypatch.setattr(filtros_empresa, 'LIMITE_MAXIMO', 501)
+    sql = _reescrever("SELECT * FROM pedidosvenda WHERE pedi_empr = 1 AND pedi_fili = 2 LIMIT 100000")
+    assert sql.endswith("LIMIT 501")
+
+def test_comando_que_nao_e_consulta_passa_inalterado():
+    sql = "UPDATE pedidosvenda SET pedi_forn = 1"
+    assert filtros_empresa.reescrever_sql(sql, 'casaa').sql == sql
@@ -0,0 +1,112 @@
+"""
+Extração e gravação do schema (gerar_schema) a partir de um banco SQLite
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import gerar_schema
+from schema_compacto import EXTENSAO, SchemaCompacto
+
+@pytest.fixture
+def conexao(tmp_path):
+    conexao = sqlite3.connect(str(tmp_path / "banco.db"))
+    conexao.executescript("""
+        CREATE TABLE clientes (
+            id INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL
+        );
+        CREATE TABLE pedidos (
+            id INTEGER PRIMARY KEY,
+            cliente_id INTEGER REFERENCES clientes (id),
+            valor DECIMAL(10,2) DEFAULT 0
+        );
+        CREATE INDEX idx_pedidos_cliente ON pedidos (cliente_id);
+        INSERT INTO clientes (nome) VALUES ('Ana'), ('Bruno');
+        INSERT INTO pedidos (cliente_id, valor) VALUES (1, 10), (1, 20), (2, 5);
+    """)
+    yield conexao
+    conexao.close()
+
+@pytest.fixture
+def schema_dir(tmp_path, monkeypatch):
+    diretorio = tmp_path / "schemas"
+    monkeypatch.setattr(gerar_schema, 'SCHEMA_DIR', str(diretorio))
+    return diretorio
+
+def test_extrair_schema_sqlite(conexao):
+    schema = gerar_schema.extrair_schema(conexao, "sqlite")
+
+    assert set(schema) == {'clientes', 'pedidos'}
+    colunas = {col['nome']: col for col in schema['pedidos']['colunas']}
+    assert list(colunas) == ['id', 'cliente_id', 'valor']
+    assert colunas['id']['primary_key'] and not colunas['cliente_id']['primary_key']
+    assert colunas['valor'] == {'nome': 'valor', 'tipo': 'DECIMAL(10,2)', 'nullable': True,
+                                'default': '0', 'primary_key': False}
+    assert not {col['nome']: col for col in schema['clientes']['colunas']}['nome']['nullable']
+    assert schema['pedidos']['fks'] == [
+        {'nome': 'fk_pedidos_0', 'colunas': ['cliente_id'], 'tabela_ref': 'clientes', 'colunas_ref': ['id']}
+    ]
+    assert 'fks' not in schema['clientes']
+    assert schema['pedidos']['estatisticas']['linhas'] == 3
+
+def test_extrair_fks_sqlite(conexao):
+    assert gerar_schema.extrair_fks_sqlite(conexao) == [
+        ('pedidos', 'fk_pedidos_0', 'clientes', ['cliente_id'], ['id'])
+    ]
+
+def test_extrair_estatisticas_sqlite(conexao):
+    estatisticas = gerar_schema.extrair_estatisticas_sqlite(conexao)
+
+    assert estatisticas['clientes'] == {'linhas': 2, 'tamanho_bytes': None, 'indices': [], 'colunas': {}}
+    assert estatisticas['pedidos']['linhas'] == 3
+    assert estatisticas['pedidos']['indices'] == [
+        {'nome': 'idx_pedidos_cliente', 'colunas': ['cliente_id'], 'unico': False}
+    ]
+
+def test_salvar_schema_grava_json_e_compacto(conexao, schema_dir):
+    schema = gerar_schema.adicionar_metadados_schema(gerar_schema.extrair_schema(conexao, "sqlite"))
+    gerar_schema.versionar_tabelas(schema, None)
+
+    versao = gerar_schema.salvar_schema('teste', schema)
+
+    caminho_json = schema_dir / "teste.json"
+    conteudo = caminho_json.read_bytes()
+    assert versao == hashlib.sha256(conteudo).hexdigest()[:12]
+    assert json.loads(conteudo.decode("utf-8")) == schema
+
+    caminho_compacto = schema_dir / f"teste{EXTENSAO}"
+    compacto = SchemaCompacto(str(caminho_compacto))
+    assert compacto.hash == hashlib.sha256(conteudo).hexdigest()
+    assert set(compacto) == set(schema)
+    assert [dict(col.items()) for col in compacto['pedidos']['colunas']] == schema['pedidos']['colunas']
+    assert compacto['pedidos']['fks'] == schema['pedidos']['fks']
+    assert compacto['_metadados'] == schema['_metadados']
+    assert compacto.secao('indice') is not None
+    assert compacto.secao('relacionamentos')['relacionamentos'][0]['tabela_ref'] == 'clientes'
+    # O compacto fica com o mtime do JSON para continuar sendo o preferido pelo schema_loader
+    assert os.stat(caminho_compacto).st_mtime_ns == os.stat(caminho_json).st_mtime_ns
+
+def test_salvar_incremental_reaproveita_tabelas_inalteradas(conexao, schema_dir, capsys):
+    schema = gerar_schema.adicionar_metadados_schema(gerar_schema.extrair_schema(conexao, "sqlite"))
+    gerar_schema.versionar_tabelas(schema, None)
+    gerar_schema.salvar_schema('teste', schema)
+    anterior = gerar_schema.carregar_schema_anterior('teste')
+
+    conexao.execute("ALTER TABLE pedidos ADD COLUMN status TEXT")
+    novo = gerar_schema.adicionar_metadados_schema(gerar_schema.extrair_schema(conexao, "sqlite"))
+    manifesto = gerar_schema.versionar_tabelas(novo, anterior)
+    assert manifesto['alteradas'] == ['pedidos']
+
+    capsys.readouterr()
+    gerar_schema.salvar_schema('teste', novo, ['clientes'], manifesto['versao_anterior'])
+    assert "1 tabelas reaproveitadas" in capsys.readouterr().out
+
+    compacto = SchemaCompacto(str(schema_dir / f"teste{EXTENSAO}"))
+    assert [col.nome for col in compacto['pedidos']['colunas']][-1] == 'status'
+    assert [dict(col.items()) for col in compacto['clientes']['colunas']] == novo['clientes']['colunas']
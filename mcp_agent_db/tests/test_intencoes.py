@@ -0,0 +1,70 @@
+"""
+Reconhecimento de perguntas do catálogo de intenções (intencoes)
+"""
+import pytest
+
+import intencoes
+
+TABELAS = ['itenspedidovenda', 'produtos', 'saldosprodutos', 'titulospagar', 'entidades', 'pedidosvenda']
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    monkeypatch.setattr(intencoes, 'carregar_schema', lambda slug: {t: {'colunas': []} for t in TABELAS})
+    monkeypatch.setattr(intencoes, 'obter_versao_schema', lambda slug: 'teste')
+    return intencoes.CatalogoIntencoes(intencoes.CATALOGO_INTENCOES)
+
+def _nome(catalogo, pergunta):
+    reconhecida = catalogo.reconhecer(pergunta, 'casaa')
+    return reconhecida and reconhecida['nome']
+
+@pytest.mark.parametrize('pergunta, nome', [
+    ("Contas a pagar desta semana", 'contas_a_pagar_periodo'),
+    ("Quais são as contas a pagar que vencem nos próximos 15 dias?", 'contas_a_pagar_periodo'),
+    ("títulos a pagar a vencer", 'contas_a_pagar_periodo'),
+    ("Entidades por tipo", 'entidades_por_tipo'),
+    ("quantas entidades de cada tipo?", 'entidades_por_tipo'),
+    ("tipos de entidade", 'entidades_por_tipo'),
+    ("pedidos por cliente", 'pedidos_por_cliente'),
+    ("produtos com estoque baixo", 'estoque_baixo'),
+    ("sugestão de compras", 'sugestao_compras_estoque'),
+    ("produtos vendidos nos últimos 60 dias com estoque baixo", 'sugestao_compras_estoque'),
+    ("liste os produtos com estoque abaixo de 5", 'estoque_baixo'),
+])
+def test_perguntas_do_catalogo(catalogo, pergunta, nome):
+    assert _nome(catalogo, pergunta) == nome
+
+@pytest.mark.parametrize('pergunta', [
+    "quais entidades de tipo CL têm mais pedidos em 2024?",
+    "contas que venceram semana passada",
+    "contas a pagar que venceram semana passada",
+    "contas a pagar do fornecedor 10 nos próximos 30 dias",
+    "top 5 contas a pagar desta semana por valor",
+    "ranking de entidades por tipo em 2024",
+    "tipos de entidade com mais vendas",
+    "qual o estoque minimo do produto 123?",
+    "produtos da marca Tramontina com estoque baixo na filial 2",
+    "sugestão de compras do fornecedor 55",
+    "produtos vendidos em janeiro de 2024 com estoque baixo",
+])
+def test_perguntas_com_qualificadores_vao_para_o_gerador(catalogo, pergunta):
+    assert catalogo.reconhecer(pergunta, 'casaa') is None
+
+def test_dias_lidos_da_pergunta(catalogo):
+    reconhecida = catalogo.reconhecer("contas a pagar dos próximos 20 dias", 'casaa')
+    assert reconhecida['parametros'] == {'dias': 20}
+    assert "CURRENT_DATE + 20" in reconhecida['sql']
+
+def test_dias_fora_dos_limites_usam_o_padrao(catalogo):
+    reconhecida = catalogo.reconhecer("contas a pagar dos próximos 5000 dias", 'casaa')
+    assert reconhecida['parametros'] == {'dias': 7}
+
+def test_produtos_juntados_pela_empresa(catalogo):
+    for pergunta in ("sugestão de compras", "produtos com estoque baixo"):
+        sql = catalogo.reconhecer(pergunta, 'casaa')['sql']
+        assert "p.prod_empr = " in sql
+
+def test_intencao_sem_tabelas_no_schema_e_ignorada(catalogo, monkeypatch):
+    monkeypatch.setattr(intencoes, 'carregar_schema', lambda slug: {'entidades': {}})
+    monkeypatch.setattr(intencoes, 'obter_versao_schema', lambda slug: 'outra')
+    assert catalogo.reconhecer("contas a pagar desta semana", 'casaa') is None
+    assert _nome(catalogo, "entidades por tipo") == 'entidades_por_tipo'
@@ -0,0 +1,69 @@
+"""
+Seleção das tabelas do prompt pelo índice de schema (schema_index)
+"""
+import json
+import os
+
+import pytest
+
+import schema_index
+from grafo_joins import GrafoJoins
+from schema_compacto import SchemaCompacto, salvar_schema_compacto
+
+CAMINHO_SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schemas', 'casaa.json')
+
+@pytest.fixture(scope='module')
+def schema():
+    with open(CAMINHO_SCHEMA, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+@pytest.fixture
+def selecionar(schema, monkeypatch):
+    indice = schema_index.IndiceSchema(schema)
+    grafo = GrafoJoins(schema)
+    monkeypatch.setattr(schema_index, 'obter_indice', lambda slug: indice)
+    monkeypatch.setattr(schema_index, 'obter_grafo', lambda slug: grafo)
+    return lambda pergunta: schema_index.selecionar_tabelas('casaa', pergunta)
+
+@pytest.mark.parametrize('pergunta, esperadas', [
+    ("vendas de março de 2024", {'pedidosvenda'}),
+    ("produtos com estoque baixo", {'produtos', 'saldosprodutos'}),
+    ("itens do pedido com nome do produto", {'itenspedidovenda', 'pedidosvenda', 'produtos'}),
+    ("TOP 10 clientes que mais compraram", {'entidades', 'pedidosvenda'}),
+])
+def test_tabela_central_entra_na_selecao(selecionar, pergunta, esperadas):
+    assert esperadas <= set(selecionar(pergunta))
+
+def test_mes_e_ano_nao_pontuam(schema):
+    indice = schema_index.IndiceSchema(schema)
+    assert indice.buscar("março de 2024") == []
+
+def test_score_baixo_inclui_campos_chave(selecionar):
+    tabelas = selecionar("como está a empresa?")
+    assert tabelas[:3] == ['entidades', 'produtos', 'pedidosvenda']
+
+def test_selecao_respeita_k_fora_dos_vizinhos(selecionar):
+    assert len(selecionar("contas a pagar desta semana")) == schema_index.SCHEMA_TOP_K
+
+def test_indice_exportado_preserva_tabelas_chave(schema):
+    indice = schema_index.IndiceSchema(schema)
+    recarregado = schema_index.IndiceSchema.de_secao(json.loads(json.dumps(indice.exportar())))
+    assert recarregado.tabelas_chave == indice.tabelas_chave
+    assert recarregado.buscar("pedidos por cliente") == indice.buscar("pedidos por cliente")
+
+def _arestas(grafo):
+    return sorted((a.origem, a.destino, tuple(a.colunas)) for arestas in grafo.vizinhos.values() for a in arestas)
+
+@pytest.mark.parametrize('com_secoes', [True, False])
+def test_grafo_e_indice_nao_retem_tabelas_do_schema_compacto(schema, tmp_path, com_secoes):
+    caminho = str(tmp_path / "casaa.schema")
+    secoes = schema_index.secoes_compartilhadas(schema) if com_secoes else None
+    salvar_schema_compacto(schema, caminho, "0" * 64, secoes)
+    compacto = SchemaCompacto(caminho)
+
+    grafo = GrafoJoins(compacto)
+    indice = schema_index.IndiceSchema.de_secao(compacto.secao('indice')) or schema_index.IndiceSchema(compacto)
+
+    assert compacto.tabelas_materializadas == 0
+    assert _arestas(grafo) == _arestas(GrafoJoins(schema))
+    assert indice.buscar("pedidos por cliente") == schema_index.IndiceSchema(schema).buscar("pedidos por cliente")
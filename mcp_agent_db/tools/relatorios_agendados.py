@@ -2,6 +2,7 @@ from langchain.tools import tool
 from .agente_inteligente_v2 import gerar_sql_da_pergunta
 from .executores import executar_sql_com_slug
 from .schema_loader import carregar_schema
+from .intencoes import resolver_intencao
 
 @tool
 def relatorio_estoque_baixo(slug: str) -> str:
@@ -32,7 +33,9 @@ def gerar_e_executar_sql(pergunta: str, slug: str) -> str:
     if not schema:
         return f"❌ Schema não encontrado para {slug}"
     
-    sql = gerar_sql_da_pergunta(pergunta, slug)
+    # Relatórios fixos têm SQL validado no catálogo de intenções
+    intencao = resolver_intencao(pergunta, slug)
+    sql = intencao['sql'] if intencao else gerar_sql_da_pergunta(pergunta, slug)
     # Optional: forçar filtro empresa
     # sql = forcar_filtro_empresa(sql, slug)
     return executar_sql_com_slug(sql, slug)
@@ -25,7 +25,8 @@ def read_requirements():
             'python-dotenv>=1.0.0',
             'uvicorn>=0.30.0',
             'pydantic>=2.0.0',
-            'requests>=2.30.0'
+            'requests>=2.30.0',
+            'sqlglot>=25.0.0'
         ]
     return requirements
 
@@ -97,6 +98,8 @@ setup(
             'templates/*.html',
             'static/*.png',
             'schemas/*.json',
+            'schemas/*.schema',
+            'fixtures/*.json',
             '*.py'
         ],
     },